@@ -0,0 +1,128 @@
+# asignaciones.py
+"""
+Reconciliación en bloque de PailaAsignacion con ProgramaProduccion.
+
+Deja las asignaciones como las dejaría ProgramaProduccion.save() programa por
+programa (ocupada si hay paila + horas, sin asignación si no), pero con un
+bulk_create, una actualización en bloque y un delete.
+
+sincronizacion_diferida() agrupa los save() de un bloque: ProgramaProduccion.save()
+solo registra el programa y la reconciliación se hace una vez al salir.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .bd import actualizar_en_bloque
+from .cambios import registrar_cambios, ASIGNACION
+from .models import PailaAsignacion, ProgramaProduccion
+from .versiones import cambios_agrupados
+
+CAMPOS_ASIGNACION = ["paila", "inicio", "fin", "estado"]
+
+# programas guardados dentro del bloque diferido (id -> última instancia guardada)
+_pendientes = ContextVar("asignaciones_pendientes", default=None)
+
+
+def asignacion_esperada(programa):
+    """(paila, inicio, fin) que debería tener el programa, o None si no aplica."""
+    if programa.paila_id and programa.hora_inicial and programa.hora_final:
+        return programa.paila_id, programa.hora_inicial, programa.hora_final
+    return None
+
+
+def reconciliar_asignaciones(programas, existentes=None, dry_run=False):
+    """
+    Compara las asignaciones esperadas de `programas` con las existentes
+    (por defecto, las de esos mismos programas) y aplica la diferencia.
+    Devuelve {"crear": [...], "actualizar": [...], "eliminar": [...]}.
+    Con dry_run=True solo calcula la diferencia.
+    """
+    programas = list(programas)
+    if existentes is None:
+        existentes = PailaAsignacion.objects.filter(programa_id__in=[p.id for p in programas])
+    crear, actualizar, eliminar = [], [], []
+    actuales = {}
+    for asignacion in existentes:
+        if asignacion.programa_id in actuales:
+            eliminar.append(asignacion)  # duplicada: un programa tiene a lo sumo una asignación
+        else:
+            actuales[asignacion.programa_id] = asignacion
+
+    for programa in programas:
+        esperada = asignacion_esperada(programa)
+        actual = actuales.get(programa.id)
+
+        if esperada is None:
+            if actual is not None:
+                eliminar.append(actual)
+            continue
+
+        paila_id, inicio, fin = esperada
+        if actual is None:
+            crear.append(PailaAsignacion(
+                programa_id=programa.id, paila_id=paila_id, inicio=inicio, fin=fin, estado="ocupada",
+            ))
+        elif (actual.paila_id, actual.inicio, actual.fin, actual.estado) != (paila_id, inicio, fin, "ocupada"):
+            actual.paila_id = paila_id
+            actual.inicio = inicio
+            actual.fin = fin
+            actual.estado = "ocupada"
+            actualizar.append(actual)
+
+    if not dry_run:
+        with cambios_agrupados():
+            PailaAsignacion.objects.bulk_create(crear)
+            actualizar_en_bloque(actualizar, CAMPOS_ASIGNACION)
+            if eliminar:
+                PailaAsignacion.objects.filter(pk__in=[a.pk for a in eliminar]).delete()
+            # solo las asignaciones escritas: los programas los anota quien los escribió
+            registrar_cambios(ASIGNACION, [a.pk for a in crear + actualizar + eliminar])
+
+    return {"crear": crear, "actualizar": actualizar, "eliminar": eliminar}
+
+
+def diferencia_json(diferencia):
+    """Versión serializable de lo que devuelve reconciliar_asignaciones."""
+    def _fila(a):
+        return {"id": a.pk, "programa": a.programa_id, "paila": a.paila_id, "inicio": a.inicio, "fin": a.fin}
+
+    return {clave: [_fila(a) for a in filas] for clave, filas in diferencia.items()}
+
+
+def diferir_asignacion(programa):
+    """Llamado desde ProgramaProduccion.save(): True si hay un bloque diferido activo."""
+    pendientes = _pendientes.get()
+    if pendientes is None:
+        return False
+    pendientes[programa.pk] = programa
+    return True
+
+
+@contextmanager
+def sincronizacion_diferida():
+    """
+    with sincronizacion_diferida(): ... los save() de ProgramaProduccion no
+    tocan PailaAsignacion; al salir se reconcilian todos en bloque. El bloque
+    es atómico: si falla, no queda ni el programa ni su asignación. Los
+    bloques anidados se suman al exterior.
+    """
+    if _pendientes.get() is not None:
+        yield
+        return
+
+    pendientes = {}
+    token = _pendientes.set(pendientes)
+    try:
+        with cambios_agrupados():  # atómico, y un solo incremento de la versión del plan
+            yield
+            _pendientes.reset(token)
+            token = None
+            if pendientes:
+                # los programas borrados dentro del bloque ya perdieron su asignación (CASCADE)
+                vivos = set(
+                    ProgramaProduccion.objects.filter(pk__in=pendientes).values_list("pk", flat=True)
+                )
+                reconciliar_asignaciones([p for pk, p in pendientes.items() if pk in vivos])
+    finally:
+        if token is not None:
+            _pendientes.reset(token)
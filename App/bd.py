@@ -0,0 +1,17 @@
+# bd.py
+"""Utilidades de escritura masiva."""
+
+# filas por UPDATE: acota el CASE WHEN que arma bulk_update (y su tiempo de compilación)
+TAMANO_LOTE = 500
+
+
+def actualizar_en_bloque(objetos, campos, batch_size=TAMANO_LOTE):
+    """
+    Model.objects.bulk_update(objetos, campos) en lotes de `batch_size` filas
+    (bulk_update ya los escribe en una transacción).
+    Devuelve la cantidad de filas actualizadas.
+    """
+    objetos = list(objetos)
+    if not objetos:
+        return 0
+    return type(objetos[0]).objects.bulk_update(objetos, campos, batch_size=batch_size)
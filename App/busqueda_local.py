@@ -0,0 +1,155 @@
+# busqueda_local.py
+"""
+Recocido simulado sobre secuencias por paila (sin dependencias de Django,
+para poder ejecutarse en procesos hijos con `spawn`).
+
+Una solución es, para cada paila, la lista ordenada de trabajos. Se decodifica
+colocando los trabajos uno detrás de otro desde t=0 (el inicio del horizonte,
+así un trabajo puede adelantarse a una paila ociosa) y saltando los bloques
+fijos (obstáculos). Vecindarios: mover un trabajo a otra posición/paila
+compatible (incluye reinsertar en la misma) e intercambiar dos trabajos.
+Tiempos en horas desde el inicio del horizonte.
+"""
+import math
+import random
+import time
+
+PESO_OCIO = 0.5  # horas de ocio interno de paila
+PESO_CARGA = 0.01  # fin promedio de las pailas (desempata y reparte carga)
+
+
+def decodificar(secuencia, duraciones, obstaculos):
+    """Devuelve (fin, ocio, inicios) de una paila con la secuencia dada."""
+    t = 0.0
+    ocio = 0.0
+    k = 0
+    inicios = []
+    for trabajo in secuencia:
+        d = duraciones[trabajo]
+        while k < len(obstaculos):
+            ini, fin = obstaculos[k]
+            if fin <= t:
+                k += 1
+                continue
+            if t + d <= ini:
+                break
+            ocio += max(0.0, ini - t)
+            t = max(t, fin)
+            k += 1
+        inicios.append(t)
+        t += d
+    return t, ocio, inicios
+
+
+def objetivo(fines, ocios):
+    makespan = max(fines) if fines else 0.0
+    carga = sum(fines) / len(fines) if fines else 0.0
+    return makespan + PESO_OCIO * sum(ocios) + PESO_CARGA * carga
+
+
+def buscar(datos, semilla, tiempo, iteraciones=None, perturbar=0):
+    """
+    Una corrida de recocido simulado.
+    datos: {"duraciones": [h], "compatibles": [[paila]], "obstaculos": [[(ini, fin)]],
+            "secuencias": [[trabajo]]}
+    Con `iteraciones` la corrida es determinista para la semilla (el tiempo es
+    solo un tope). `perturbar` aplica movimientos aleatorios iniciales para
+    diversificar los reinicios.
+    """
+    rnd = random.Random(semilla)
+    duraciones = datos["duraciones"]
+    compatibles = datos["compatibles"]
+    obstaculos = datos["obstaculos"]
+    secuencias = [list(s) for s in datos["secuencias"]]
+    paila_de = {}
+    for p, secuencia in enumerate(secuencias):
+        for trabajo in secuencia:
+            paila_de[trabajo] = p
+
+    movibles = [t for t in range(len(duraciones)) if t in paila_de]
+    if not movibles:
+        return {"objetivo": 0.0, "secuencias": secuencias, "iteraciones": 0, "semilla": semilla}
+
+    def _mover(secs, trabajo, destino, posicion):
+        origen = paila_de[trabajo]
+        nuevo_origen = [t for t in secs[origen] if t != trabajo]
+        if destino == origen:
+            nuevo_origen.insert(min(posicion, len(nuevo_origen)), trabajo)
+            return {origen: nuevo_origen}
+        nuevo_destino = list(secs[destino])
+        nuevo_destino.insert(min(posicion, len(nuevo_destino)), trabajo)
+        return {origen: nuevo_origen, destino: nuevo_destino}
+
+    def _vecino():
+        trabajo = rnd.choice(movibles)
+        if rnd.random() < 0.6 or len(movibles) < 2:
+            destino = rnd.choice(compatibles[trabajo])
+            return _mover(secuencias, trabajo, destino, rnd.randint(0, len(secuencias[destino])))
+        otro = rnd.choice(movibles)
+        pa, pb = paila_de[trabajo], paila_de[otro]
+        if otro == trabajo or pb not in compatibles[trabajo] or pa not in compatibles[otro]:
+            return None
+        if pa == pb:
+            nueva = list(secuencias[pa])
+            i, j = nueva.index(trabajo), nueva.index(otro)
+            nueva[i], nueva[j] = nueva[j], nueva[i]
+            return {pa: nueva}
+        nueva_a = [otro if t == trabajo else t for t in secuencias[pa]]
+        nueva_b = [trabajo if t == otro else t for t in secuencias[pb]]
+        return {pa: nueva_a, pb: nueva_b}
+
+    def _aplicar(cambio):
+        for p, secuencia in cambio.items():
+            secuencias[p] = secuencia
+            for trabajo in secuencia:
+                paila_de[trabajo] = p
+
+    for _ in range(perturbar):
+        cambio = _vecino()
+        if cambio:
+            _aplicar(cambio)
+
+    fines = []
+    ocios = []
+    for p, secuencia in enumerate(secuencias):
+        fin, ocio, _ = decodificar(secuencia, duraciones, obstaculos[p])
+        fines.append(fin)
+        ocios.append(ocio)
+
+    actual = objetivo(fines, ocios)
+    mejor = actual
+    mejor_secuencias = [list(s) for s in secuencias]
+    # temperatura en horas: ~1% de la duración media de un trabajo
+    temperatura_inicial = max(0.01 * sum(duraciones) / len(duraciones), 1e-6)
+
+    t0 = time.perf_counter()
+    iteracion = 0
+    while True:
+        if iteraciones is not None and iteracion >= iteraciones:
+            break
+        transcurrido = time.perf_counter() - t0
+        if transcurrido >= tiempo:
+            break
+        avance = iteracion / iteraciones if iteraciones else transcurrido / tiempo
+        temperatura = temperatura_inicial * max(1.0 - avance, 1e-3)
+        iteracion += 1
+
+        cambio = _vecino()
+        if not cambio:
+            continue
+
+        nuevos_fines = list(fines)
+        nuevos_ocios = list(ocios)
+        for p, secuencia in cambio.items():
+            nuevos_fines[p], nuevos_ocios[p], _ = decodificar(secuencia, duraciones, obstaculos[p])
+        candidato = objetivo(nuevos_fines, nuevos_ocios)
+
+        delta = candidato - actual
+        if delta <= 0 or rnd.random() < math.exp(-delta / temperatura):
+            _aplicar(cambio)
+            fines, ocios, actual = nuevos_fines, nuevos_ocios, candidato
+            if actual < mejor - 1e-9:
+                mejor = actual
+                mejor_secuencias = [list(s) for s in secuencias]
+
+    return {"objetivo": mejor, "secuencias": mejor_secuencias, "iteraciones": iteracion, "semilla": semilla}
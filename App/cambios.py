@@ -0,0 +1,103 @@
+# cambios.py
+"""
+Sincronización incremental del plan (GET /programa-produccion/cambios/).
+
+Cada escritura de programas o asignaciones anota (tabla, id) en la
+transacción y, al confirmarla, versiones.py incrementa la versión del plan y
+guarda esas filas en CambioPlan con la versión nueva. Las señales cubren los
+save()/delete() fila a fila (incluidos los fragmentos que reescribe
+asignar_paila); las escrituras en bloque llaman a registrar_cambios con las
+filas que escribieron (reconciliar_asignaciones, con las asignaciones que
+creó, cambió o borró). Un bloque sin filas escritas no cambia la versión.
+
+La bitácora solo dice qué filas cambiaron: la respuesta trae su estado
+actual, y las que ya no existen se informan como eliminadas. Cuando no se
+puede responder con un delta (versión podada de la bitácora o una carga
+masiva que registró un reinicio) se responde completo=True y el cliente
+vuelve a pedir /programa-produccion/. Sin `desde` solo se devuelve la
+versión actual: pedida antes de la carga completa, es el punto de partida.
+"""
+from django.conf import settings
+
+from .models import CambioPlan, PailaAsignacion, ProgramaProduccion
+from .versiones import obtener_version_plan, incrementar_version_plan, REINICIO as _REINICIO
+
+PROGRAMA = "programa"
+ASIGNACION = "asignacion"
+REINICIO = _REINICIO[0]
+
+
+def registrar_cambios(tabla, ids):
+    """
+    Anota filas escritas (señales y escrituras en bloque). Sin filas no hay
+    cambio; sin pk conocido se registra un reinicio.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    if any(i is None for i in ids):  # bulk_create sin RETURNING
+        reiniciar_cambios()
+        return
+    incrementar_version_plan((tabla, i) for i in ids)
+
+
+def reiniciar_cambios():
+    """
+    Para cargas masivas: los clientes con una versión anterior recargan todo.
+    En el mismo cambios_agrupados() descarta las filas anotadas por las señales.
+    """
+    incrementar_version_plan([_REINICIO])
+
+
+def asignacion_json(asignacion):
+    return {
+        "id": asignacion.pk,
+        "programa": asignacion.programa_id,
+        "paila": asignacion.paila_id,
+        "inicio": asignacion.inicio,
+        "fin": asignacion.fin,
+        "estado": asignacion.estado,
+    }
+
+
+def cambios_desde(desde):
+    """
+    Cambios con versión en (desde, versión actual]:
+    {"version", "completo", "programas", "programas_eliminados",
+     "asignaciones", "asignaciones_eliminadas"}; los programas van como
+    instancias (la vista los serializa) y sin anidar.
+    """
+    # la versión se lee antes que los datos: como mucho se reenvía algo ya visto
+    version = obtener_version_plan()
+    retenidas = getattr(settings, "CAMBIOS_VERSIONES_RETENIDAS", 1000)
+    if desde is None or desde > version or desde < version - retenidas:
+        return {"version": version, "completo": True}
+
+    bitacora = CambioPlan.objects.filter(version__gt=desde, version__lte=version)
+    cambiados = {PROGRAMA: set(), ASIGNACION: set(), REINICIO: set()}
+    for tabla, objeto_id in bitacora.values_list("tabla", "objeto_id").distinct():
+        cambiados.setdefault(tabla, set()).add(objeto_id)
+    if cambiados[REINICIO]:
+        return {"version": version, "completo": True}
+
+    programas = []
+    asignaciones = []
+    if cambiados[PROGRAMA]:
+        programas = list(
+            ProgramaProduccion.objects.filter(id__in=bitacora.filter(tabla=PROGRAMA).values("objeto_id"))
+            .select_related("paila", "fert").order_by("id")
+        )
+    if cambiados[ASIGNACION]:
+        asignaciones = list(
+            PailaAsignacion.objects.filter(id__in=bitacora.filter(tabla=ASIGNACION).values("objeto_id"))
+            .order_by("id")
+        )
+
+    return {
+        "version": version,
+        "completo": False,
+        "programas": programas,
+        "programas_eliminados": sorted(cambiados[PROGRAMA] - {p.id for p in programas}),
+        "asignaciones": [asignacion_json(a) for a in asignaciones],
+        "asignaciones_eliminadas": sorted(cambiados[ASIGNACION] - {a.id for a in asignaciones}),
+    }
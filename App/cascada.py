@@ -0,0 +1,149 @@
+# cascada.py
+"""
+Reprogramación en cascada de una paila cuando un programa cambia de hora.
+
+Solo se recorre el sufijo de la línea de tiempo de la paila (programas con
+hora_inicial >= la nueva hora, en tramos por keyset) y se corta en el primer
+programa que no cambia, así el costo es proporcional a lo que se mueve y no al
+tamaño del plan. Modos:
+  - empujar: cada programa que se solapa con el anterior pasa al primer hueco
+    libre después de él.
+  - compactar: además, la cadena de programas que iban pegados al movido en
+    el plan original lo sigue (se adelanta si el movido se adelantó); los
+    demás solo se mueven si quedan solapados.
+Las duraciones y las columnas de etapas se recalculan con el modelo de ruteo
+sobre la misma cantidad que usa el resto del plan (ruteo.cantidad_programa).
+Los bloques fijos (asignaciones sin programa) nunca se mueven: se saltan.
+"""
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .asignaciones import reconciliar_asignaciones
+from .bd import actualizar_en_bloque
+from .cambios import registrar_cambios, PROGRAMA
+from .models import ProgramaProduccion, PailaAsignacion
+from .planificador import Agenda
+from .ruteo import ETAPAS, obtener_modelo_ruteo, cantidad_programa
+from .versiones import cambios_agrupados
+
+MODOS = ("empujar", "compactar")
+
+TRAMO = 200  # programas leídos por consulta
+PEGADO = timedelta(minutes=1)  # tolerancia para considerar dos programas consecutivos
+
+
+class ConflictoCascada(Exception):
+    """El nuevo horario choca con algo que la cascada no puede mover."""
+
+
+def _aware(dt):
+    return timezone.make_aware(dt) if dt and timezone.is_naive(dt) else dt
+
+
+def _aplicar_duracion(programa, modelo):
+    """
+    Recalcula etapas y duracion_total con el modelo de ruteo y devuelve la
+    duración; si el fert no tiene ruta, conserva la actual.
+    """
+    cantidad = cantidad_programa(programa.lote_f, programa.produccion, programa.paila_id)
+    calculo = modelo.horas_etapas(programa.fert_id, cantidad) if cantidad else None
+    if calculo and calculo[1]:
+        etapas, total = calculo
+        for op, horas in etapas.items():
+            setattr(programa, op, horas)
+        programa.duracion_total = total
+        return timedelta(hours=total)
+    duracion = programa.hora_final - programa.hora_inicial
+    programa.duracion_total = duracion.total_seconds() / 3600
+    return duracion
+
+
+def _sufijo(paila_id, desde, excluir):
+    """Programas de la paila con hora_inicial >= desde, en orden y por tramos."""
+    base = (
+        ProgramaProduccion.objects.filter(paila_id=paila_id, hora_inicial__isnull=False, hora_final__isnull=False)
+        .exclude(pk=excluir)
+        .order_by("hora_inicial", "id")
+        .only(
+            "id", "fert_id", "lote_f", "produccion", "paila_id", "hora_inicial", "hora_final",
+            "duracion_total", *ETAPAS,
+        )
+    )
+    tramo = list(base.filter(hora_inicial__gte=desde)[:TRAMO])
+    while tramo:
+        yield from tramo
+        ultimo = tramo[-1]
+        tramo = list(base.filter(
+            Q(hora_inicial__gt=ultimo.hora_inicial) | Q(hora_inicial=ultimo.hora_inicial, id__gt=ultimo.id)
+        )[:TRAMO])
+
+
+def calcular_cascada(programa, inicio, fin, modo="empujar"):
+    """
+    Programas de la misma paila que hay que mover para que `programa` ocupe
+    [inicio, fin). Devuelve la lista con las horas nuevas ya asignadas (sin
+    guardar). Lanza ConflictoCascada si [inicio, fin) choca con un programa
+    que empieza antes o con un bloque fijo.
+    """
+    inicio, fin = _aware(inicio), _aware(fin)
+    paila_id = programa.paila_id
+
+    anterior = (
+        ProgramaProduccion.objects.filter(paila_id=paila_id, hora_inicial__lt=inicio, hora_final__gt=inicio)
+        .exclude(pk=programa.pk)
+        .exists()
+    )
+    if anterior:
+        raise ConflictoCascada("El nuevo horario se solapa con un programa que empieza antes en la paila")
+
+    fijos = Agenda()
+    for ini, fi in (
+        PailaAsignacion.objects.filter(paila_id=paila_id, programa__isnull=True, fin__gt=inicio, inicio__isnull=False)
+        .order_by("inicio")
+        .values_list("inicio", "fin")
+    ):
+        fijos.reservar(ini, fi)
+    if fijos.primer_hueco(inicio, fin - inicio) != inicio:
+        raise ConflictoCascada("El nuevo horario se solapa con un bloque fijo de la paila")
+
+    modelo = obtener_modelo_ruteo()
+    compactar = modo == "compactar"
+    cursor = fin  # fin de lo último ya ubicado en la línea
+    fin_cadena = programa.hora_final  # fin original del último programa de la cadena pegada
+    movidos = []
+    for siguiente in _sufijo(paila_id, inicio, programa.pk):
+        # pegado según el plan original: empieza donde terminaba el anterior de la cadena
+        pegado = (
+            compactar and fin_cadena is not None
+            and fin_cadena - PEGADO <= siguiente.hora_inicial <= fin_cadena + PEGADO
+        )
+        if pegado:
+            fin_cadena = siguiente.hora_final
+        elif siguiente.hora_inicial >= cursor:
+            if not compactar or fin_cadena is None or siguiente.hora_inicial > fin_cadena + PEGADO:
+                break  # no se solapa ni sigue la cadena: el resto de la línea no cambia
+            cursor = max(cursor, siguiente.hora_final)  # ajeno a la cadena: queda donde está
+            continue
+
+        duracion = _aplicar_duracion(siguiente, modelo)
+        nuevo_inicio = fijos.primer_hueco(cursor, duracion)
+        if nuevo_inicio == siguiente.hora_inicial and nuevo_inicio + duracion == siguiente.hora_final:
+            break
+        siguiente.hora_inicial = nuevo_inicio
+        siguiente.hora_final = nuevo_inicio + duracion
+        cursor = siguiente.hora_final
+        movidos.append(siguiente)
+    return movidos
+
+
+def reprogramar_en_cascada(programa, inicio, fin, modo="empujar"):
+    """Calcula la cascada y guarda los programas movidos y sus asignaciones en bloque."""
+    movidos = calcular_cascada(programa, inicio, fin, modo)
+    if movidos:
+        with cambios_agrupados():
+            actualizar_en_bloque(movidos, ["hora_inicial", "hora_final", "duracion_total", *ETAPAS])
+            registrar_cambios(PROGRAMA, [p.id for p in movidos])
+            reconciliar_asignaciones(movidos)
+    return movidos
@@ -0,0 +1,89 @@
+# compatibilidad.py
+"""
+Índice en memoria de compatibilidad paila/color.
+
+Por cada color guarda las filas válidas de Matrix (diamsi='SI') ordenadas por
+base_dispersion_minimo, así "pailas válidas para lote_f" es un bisect más una
+agregación por paila (memoizada). Se reconstruye cuando cambia Matrix,
+DetalleProducto o InventarioPaila (ver signals.py).
+"""
+from bisect import bisect_left
+
+from .models import DetalleProducto, Matrix
+from .versiones import IndiceVersionado
+
+VERSION = "compatibilidad"
+
+
+class IndiceCompatibilidad:
+    def __init__(self, color_por_fert, por_color):
+        self.color_por_fert = color_por_fert  # fert -> color del primer DetalleProducto
+        self.por_color = por_color  # color -> (bases ordenadas, entradas)
+        self._memo = {}  # (color, posicion) -> pailas agregadas
+
+    @classmethod
+    def construir(cls):
+        color_por_fert = {}
+        # igual que DetalleProducto.objects.filter(fert=...).first()
+        for fert_id, color_id in DetalleProducto.objects.order_by("primario").values_list("fert_id", "color_id"):
+            color_por_fert.setdefault(fert_id, color_id)
+
+        filas = (
+            Matrix.objects.filter(diamsi__iexact="SI", base_dispersion_minimo__isnull=False)
+            .order_by("base_dispersion_minimo", "primario")
+            .values_list("color_id", "base_dispersion_minimo", "paila_id", "paila__numero", "capacidad_planificable")
+        )
+        por_color = {}
+        for color_id, base, paila, numero, capacidad in filas:
+            if not paila or not capacidad:
+                continue
+            bases, entradas = por_color.setdefault(color_id, ([], []))
+            bases.append(base)
+            entradas.append((paila, numero, capacidad))
+
+        return cls(color_por_fert, por_color)
+
+    def color_de(self, fert_id):
+        return self.color_por_fert.get(fert_id)
+
+    def pailas_para_color(self, color_id, lote_f):
+        """
+        Pailas con base_dispersion_minimo < lote_f para el color, una por paila
+        con su mayor capacidad_planificable, ordenadas por capacidad descendente.
+        """
+        if color_id is None or lote_f is None or color_id not in self.por_color:
+            return []
+
+        bases, entradas = self.por_color[color_id]
+        posicion = bisect_left(bases, lote_f)
+        clave = (color_id, posicion)
+        if clave not in self._memo:
+            paila_dict = {}
+            for paila, numero, capacidad in entradas[:posicion]:
+                actual = paila_dict.get(paila)
+                if actual is None:
+                    paila_dict[paila] = {"paila": paila, "numero": numero, "capacidad_planificable": capacidad}
+                elif capacidad > actual["capacidad_planificable"]:
+                    actual["capacidad_planificable"] = capacidad
+            self._memo[clave] = sorted(
+                paila_dict.values(), key=lambda x: x["capacidad_planificable"], reverse=True
+            )
+
+        return [dict(p) for p in self._memo[clave]]
+
+    def pailas_validas(self, fert_id, lote_f):
+        return self.pailas_para_color(self.color_de(fert_id), lote_f)
+
+
+
+_indice = IndiceVersionado(VERSION, IndiceCompatibilidad.construir)
+
+
+def obtener_indice():
+    """Índice del proceso, reconstruido si la versión cambió."""
+    return _indice.obtener()
+
+
+def invalidar_indice(**kwargs):
+    """Receiver de señales: la versión cambia al confirmar la transacción."""
+    _indice.invalidar()
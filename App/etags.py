@@ -0,0 +1,60 @@
+# etags.py
+"""
+Lecturas condicionales con la versión del plan.
+
+El ETag (débil) es la versión del plan de versiones.py; si el cliente manda
+If-None-Match con la versión actual se responde 304 con una sola consulta a
+VersionPlan, sin tocar las tablas del programa. La versión se lee antes que
+los datos, así una respuesta nunca queda etiquetada con una versión más nueva
+que su contenido.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .versiones import obtener_version_plan
+
+
+def etag_plan(*partes):
+    """ETag de la versión actual; `partes` distingue respuestas de una misma URL (p. ej. el body)."""
+    return 'W/"' + "-".join(["plan", str(obtener_version_plan()), *partes]) + '"'
+
+
+def huella(datos):
+    """Hash corto y estable de un body JSON para usarlo en el ETag."""
+    return hashlib.sha1(json.dumps(datos, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _sin_debil(etag):
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def no_modificado(request, etag):
+    """HttpResponseNotModified si If-None-Match coincide con `etag` (comparación débil), si no None."""
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if "*" in etags or _sin_debil(etag) in {_sin_debil(e) for e in etags}:
+        respuesta = HttpResponseNotModified()
+        respuesta["ETag"] = etag
+        respuesta["Cache-Control"] = "no-cache"
+        return respuesta
+    return None
+
+
+def marcar(respuesta, etag):
+    """Agrega ETag a las respuestas 200 (los errores no se validan)."""
+    if respuesta.status_code == 200:
+        respuesta["ETag"] = etag
+        respuesta["Cache-Control"] = "no-cache"  # el navegador revalida siempre con If-None-Match
+    return respuesta
+
+
+def con_etag_plan(vista):
+    """Decorador para lecturas GET (debajo de @api_view)."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        etag = etag_plan()
+        return no_modificado(request, etag) or marcar(vista(request, *args, **kwargs), etag)
+    return envoltura
@@ -0,0 +1,247 @@
+# exportacion.py
+import csv
+import importlib.util
+import tempfile
+from datetime import datetime
+
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import ProgramaProduccion, ExcelExtra
+
+TAMANO_CHUNK = 2000  # programas leídos por consulta
+
+# columnas base del export (mismo orden que el export original)
+COLUMNAS_BASE = [
+    "orden", "fert", "lote_f", "paila", "estacion", "hora_inicial", "hora_final",
+    "duracion_total", "empastado", "molino", "matizado", "emulsion", "completado", "envasado",
+]
+
+
+def iterar_chunks(tamano_chunk=TAMANO_CHUNK):
+    """
+    Recorre los programas por id en chunks (paginación keyset) y devuelve
+    listas de (fila_base, extras). fert/paila salen directo de la FK
+    (son códigos) y los extras de cada chunk se traen en una sola consulta.
+    """
+    ultimo_id = 0
+    while True:
+        chunk = list(
+            ProgramaProduccion.objects.filter(id__gt=ultimo_id)
+            .order_by("id")
+            .values("id", *COLUMNAS_BASE)[:tamano_chunk]
+        )
+        if not chunk:
+            return
+
+        ids = [fila["id"] for fila in chunk]
+        extras = {}
+        for programa_id, data in (
+            ExcelExtra.objects.filter(programa_id__in=ids)
+            .order_by("id")
+            .values_list("programa_id", "data")
+        ):
+            extras.setdefault(programa_id, data)  # equivalente a extras.first()
+
+        yield [(fila, extras.get(fila["id"]) or {}) for fila in chunk]
+
+        ultimo_id = ids[-1]
+
+
+def iterar_programas(tamano_chunk=TAMANO_CHUNK):
+    """Igual que iterar_chunks pero fila por fila."""
+    for chunk in iterar_chunks(tamano_chunk):
+        yield from chunk
+
+
+def perfil_extras():
+    """
+    Columnas extra en orden de aparición con los tipos de valor vistos en
+    cada una, leyendo los JSON en streaming.
+    """
+    columnas = {}
+    for data in (
+        ExcelExtra.objects.order_by("programa_id", "id")
+        .values_list("data", flat=True)
+        .iterator(chunk_size=TAMANO_CHUNK)
+    ):
+        if isinstance(data, dict):
+            for clave, valor in data.items():
+                tipos = columnas.setdefault(clave, set())
+                if valor is not None:
+                    tipos.add(type(valor))
+    return columnas
+
+
+def columnas_extras():
+    """Columnas extra en orden de aparición."""
+    return list(perfil_extras())
+
+
+def valor_excel(valor):
+    """Excel no admite datetimes con zona horaria: se exportan en hora local."""
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.localtime(valor).replace(tzinfo=None)
+    return valor
+
+
+def escribir_xlsx(tamano_chunk=TAMANO_CHUNK):
+    """
+    Escribe el export con un workbook write-only de openpyxl (las filas van a
+    disco a medida que se agregan) y devuelve un archivo temporal listo para
+    enviarse en streaming. La memoria no crece con el tamaño del plan.
+    """
+    extras = columnas_extras()
+
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet("Produccion+Extras")
+    hoja.append(COLUMNAS_BASE + extras)
+
+    for fila, data in iterar_programas(tamano_chunk):
+        hoja.append(
+            [valor_excel(fila[col]) for col in COLUMNAS_BASE]
+            + [data.get(col) for col in extras]
+        )
+
+    archivo = tempfile.TemporaryFile()
+    libro.save(archivo)
+    archivo.seek(0)
+    return archivo
+
+
+class BufferStreaming:
+    """
+    Archivo de solo escritura que acumula bytes hasta que se vacían con
+    `vaciar()`. Lleva la posición total para los escritores (pyarrow) que
+    usan tell() al calcular offsets.
+    """
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.partes.append(bytes(data))
+        self.posicion += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        data = b"".join(self.partes)
+        self.partes = []
+        return data
+
+
+def generar_csv(tamano_chunk=TAMANO_CHUNK):
+    """CSV en streaming: se emite un bloque de bytes por chunk de programas."""
+    extras = columnas_extras()
+    buffer = BufferStreaming()
+    escritor = csv.writer(buffer)
+
+    escritor.writerow(COLUMNAS_BASE + extras)
+    yield buffer.vaciar()
+
+    for chunk in iterar_chunks(tamano_chunk):
+        escritor.writerows(
+            [fila[col] for col in COLUMNAS_BASE] + [data.get(col) for col in extras]
+            for fila, data in chunk
+        )
+        yield buffer.vaciar()
+
+
+def pyarrow_disponible():
+    """Parquet/Arrow requieren pyarrow (dependencia opcional)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _esquema_arrow(perfil):
+    """Esquema fijo para todos los row groups: base tipada + extras por tipo visto."""
+    import pyarrow as pa
+
+    texto = {"orden", "fert", "paila", "estacion"}
+    fechas = {"hora_inicial", "hora_final"}
+    campos = []
+    for col in COLUMNAS_BASE:
+        if col in texto:
+            campos.append(pa.field(col, pa.string()))
+        elif col in fechas:
+            campos.append(pa.field(col, pa.timestamp("us", tz="UTC")))
+        else:
+            campos.append(pa.field(col, pa.float64()))
+
+    for col, tipos in perfil.items():
+        if tipos and tipos <= {bool}:
+            tipo = pa.bool_()
+        elif tipos and tipos <= {int}:
+            tipo = pa.int64()
+        elif tipos and tipos <= {int, float}:
+            tipo = pa.float64()
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(str(col), tipo))
+
+    return pa.schema(campos)
+
+
+def iterar_record_batches(tamano_chunk=TAMANO_CHUNK):
+    """
+    Pipeline columnar: cada chunk de programas se convierte en un RecordBatch
+    de pyarrow con el mismo esquema. Devuelve (esquema, generador).
+    """
+    import pyarrow as pa
+
+    perfil = perfil_extras()
+    esquema = _esquema_arrow(perfil)
+    extras_texto = [
+        col for col in perfil
+        if pa.types.is_string(esquema.field(str(col)).type)
+    ]
+
+    def lotes():
+        for chunk in iterar_chunks(tamano_chunk):
+            columnas = {col: [fila[col] for fila, _ in chunk] for col in COLUMNAS_BASE}
+            for col in perfil:
+                valores = [data.get(col) for _, data in chunk]
+                if col in extras_texto:
+                    valores = [None if v is None else str(v) for v in valores]
+                columnas[str(col)] = valores
+            yield pa.RecordBatch.from_pydict(columnas, schema=esquema)
+
+    return esquema, lotes()
+
+
+def generar_parquet(tamano_chunk=TAMANO_CHUNK):
+    """Parquet en streaming: un row group por chunk, el footer al final."""
+    import pyarrow.parquet as pq
+
+    esquema, lotes = iterar_record_batches(tamano_chunk)
+    buffer = BufferStreaming()
+    with pq.ParquetWriter(buffer, esquema) as escritor:
+        for lote in lotes:
+            escritor.write_batch(lote)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
+
+
+def generar_arrow(tamano_chunk=TAMANO_CHUNK):
+    """Arrow IPC (formato stream) en streaming: un record batch por chunk."""
+    import pyarrow as pa
+
+    esquema, lotes = iterar_record_batches(tamano_chunk)
+    buffer = BufferStreaming()
+    with pa.ipc.new_stream(buffer, esquema) as escritor:
+        for lote in lotes:
+            escritor.write_batch(lote)
+            yield buffer.vaciar()
+    yield buffer.vaciar()
@@ -0,0 +1,322 @@
+# importacion.py
+import time
+from contextlib import nullcontext
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from openpyxl import load_workbook
+
+from .instrumentacion import tramo
+from .cambios import registrar_cambios, PROGRAMA, ASIGNACION
+from .models import ProgramaProduccion, ExcelExtra, Producto, InventarioPaila, PailaAsignacion
+from .versiones import cambios_agrupados
+
+TAMANO_LOTE = 2000  # filas por bulk_create
+
+
+def clean_value(val):
+    """Convierte valores de pandas/numpy a tipos JSON-compatibles."""
+    if pd.isna(val):
+        return None
+    if isinstance(val, (pd.Timestamp, date)):  # date cubre datetime (lectura openpyxl)
+        return val.strftime("%Y-%m-%d")  # o .isoformat() si quieres fecha+hora
+    if isinstance(val, (np.generic,)):  # numpy int64, float64, etc.
+        return val.item()
+    return val
+
+
+def normalizar_codigos(serie):
+    """
+    Normaliza una columna de códigos a texto: 123.0 -> "123", " ABC " -> "ABC".
+    Los nulos se mantienen como <NA>.
+    """
+    if pd.api.types.is_float_dtype(serie):
+        return np.trunc(serie).astype("Int64").astype("string")
+
+    texto = serie.astype("string").str.strip()
+    # columnas mixtas: solo los float reales se pasan a entero (igual que antes)
+    es_float = serie.map(type).eq(float) & serie.notna()
+    if es_float.any():
+        texto[es_float] = np.trunc(serie[es_float].astype(float)).astype("Int64").astype("string")
+    return texto
+
+
+def _columna(df, nombre):
+    """Devuelve la columna del DataFrame o una serie vacía si no existe."""
+    if nombre in df.columns:
+        return df[nombre]
+    return pd.Series(pd.NA, index=df.index, dtype="object")
+
+
+def preparar_lote(df, mapping):
+    """
+    Normaliza orden/fert/lote de un DataFrame con operaciones vectorizadas.
+    Devuelve (filas, extras, omitidas): `filas` son las filas válidas con las
+    columnas _orden, _fert, _lote más las columnas extra originales.
+    """
+    orden = _columna(df, mapping["orden"])
+    fert = _columna(df, mapping["fert"])
+    lote = _columna(df, mapping["lote"])
+
+    validas = orden.notna() & fert.notna()
+
+    columnas_mapeadas = set(mapping.values())
+    extras = [col for col in df.columns if col not in columnas_mapeadas]
+
+    filas = df.loc[validas, extras].copy()
+    filas["_orden"] = orden[validas].astype(str).str.strip()
+    filas["_fert"] = normalizar_codigos(fert[validas])
+    filas["_lote"] = pd.to_numeric(lote[validas], errors="coerce")
+    # como antes (float(lote)): un lote no numérico detiene la importación
+    for valor in lote[validas][filas["_lote"].isna() & lote[validas].notna()]:
+        float(valor)
+
+    return filas, extras, int((~validas).sum())
+
+
+def extras_a_registros(filas, extras):
+    """Convierte las columnas extra de un lote en dicts JSON-compatibles."""
+    if not extras:
+        return None
+
+    datos = filas[extras].copy()
+    for col in extras:
+        if pd.api.types.is_datetime64_any_dtype(datos[col]):
+            datos[col] = datos[col].dt.strftime("%Y-%m-%d")
+
+    return [
+        {str(col): clean_value(val) for col, val in registro.items()}
+        for registro in datos.to_dict("records")
+    ]
+
+
+def resolver_productos(codigos):
+    """
+    Asegura que existan todos los Producto de `codigos` con una sola consulta
+    de lectura y un bulk_create para los faltantes.
+    """
+    codigos = set(codigos)
+    existentes = set(
+        Producto.objects.filter(codigo__in=codigos).values_list("codigo", flat=True)
+    )
+    faltantes = codigos - existentes
+    if faltantes:
+        Producto.objects.bulk_create(
+            [Producto(codigo=c, descripcion=c) for c in faltantes],
+            ignore_conflicts=True,
+        )
+    return codigos
+
+
+def guardar_lote(filas, extras, tamano_lote=TAMANO_LOTE, creados_ids=None):
+    """
+    Inserta programas y extras de un lote ya normalizado con bulk_create.
+    Anota en `creados_ids` (si se pasa) los programas creados.
+    """
+    lotes = filas["_lote"].astype(object).where(filas["_lote"].notna(), None)
+
+    programas = ProgramaProduccion.objects.bulk_create(
+        [
+            ProgramaProduccion(orden=orden, fert_id=fert, lote_f=lote)
+            for orden, fert, lote in zip(filas["_orden"], filas["_fert"], lotes)
+        ],
+        batch_size=tamano_lote,
+    )
+    registrar_cambios(PROGRAMA, [p.pk for p in programas])  # bulk_create no dispara señales
+    if creados_ids is not None:
+        creados_ids.extend(p.pk for p in programas)
+
+    registros = extras_a_registros(filas, extras)
+    if registros is not None:
+        ExcelExtra.objects.bulk_create(
+            [
+                ExcelExtra(programa=programa, data=data)
+                for programa, data in zip(programas, registros)
+            ],
+            batch_size=tamano_lote,
+        )
+
+    return len(programas)
+
+
+def leer_excel_por_lotes(archivo, tamano_lote=TAMANO_LOTE):
+    """
+    Lee la primera hoja en modo read-only de openpyxl y devuelve DataFrames
+    de `tamano_lote` filas. La memoria depende del tamaño de lote, no del archivo.
+    Los encabezados se toman de la primera fila, igual que pd.read_excel.
+    """
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            return
+
+        columnas = [
+            col if col is not None else f"Unnamed: {i}"
+            for i, col in enumerate(encabezado)
+        ]
+        ancho = len(columnas)
+
+        lote = []
+        for fila in filas:
+            fila = tuple(fila[:ancho]) + (None,) * (ancho - len(fila))
+            if all(val is None for val in fila):
+                continue  # pd.read_excel también ignora filas vacías
+            lote.append(fila)
+            if len(lote) >= tamano_lote:
+                yield pd.DataFrame.from_records(lote, columns=columnas)
+                lote = []
+
+        if lote:
+            yield pd.DataFrame.from_records(lote, columns=columnas)
+    finally:
+        libro.close()
+
+
+def importar_programas(df, mapping, tamano_lote=TAMANO_LOTE):
+    """
+    Importa un DataFrame de programa de producción en bloque:
+    normaliza columnas, resuelve todos los fert de una vez y hace bulk_create
+    de programas y extras por lotes dentro de una sola transacción.
+    """
+    return importar_programas_por_lotes([df], mapping, tamano_lote)
+
+
+def importar_programas_por_lotes(lotes, mapping, tamano_lote=TAMANO_LOTE, progreso=None, atomico=True):
+    """
+    Igual que importar_programas pero consumiendo un iterable de DataFrames
+    (p. ej. leer_excel_por_lotes), sin cargar el archivo completo en memoria.
+
+    `progreso(importadas, omitidas)` se llama tras cada lote. Con
+    `atomico=False` cada lote se confirma por separado para que el avance sea
+    visible desde otras conexiones (trabajos en segundo plano); si un lote
+    falla se borran los programas (y sus extras) ya importados, así el
+    resultado es todo o nada como con atomico=True.
+    """
+    inicio = time.perf_counter()
+    importadas = 0
+    omitidas = 0
+    conocidos = set()  # fert ya resueltos en lotes anteriores
+    creados_ids = []
+
+    try:
+        with transaction.atomic() if atomico else nullcontext():
+            for df in lotes:
+                with transaction.atomic(savepoint=False):
+                    with tramo("normalizacion"):
+                        filas, extras, omitidas_lote = preparar_lote(df, mapping)
+                    omitidas += omitidas_lote
+
+                    nuevos = set(filas["_fert"].unique()) - conocidos
+                    if nuevos:
+                        conocidos |= resolver_productos(nuevos)
+
+                    for desde in range(0, len(filas), tamano_lote):
+                        importadas += guardar_lote(
+                            filas.iloc[desde:desde + tamano_lote], extras, tamano_lote, creados_ids
+                        )
+
+                if progreso:
+                    progreso(importadas, omitidas)
+    except Exception:
+        if not atomico:
+            with cambios_agrupados():  # los extras caen por CASCADE
+                ProgramaProduccion.objects.filter(pk__in=creados_ids).delete()
+        raise
+
+    return {
+        "importadas": importadas,
+        "omitidas": omitidas,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def _a_datetime(val):
+    """Soporta string de fecha o datetime (igual que la importación fila a fila)."""
+    if isinstance(val, pd.Timestamp):
+        return val.to_pydatetime()
+    if isinstance(val, datetime):
+        return val
+    return parse_datetime(str(val))
+
+
+def importar_asignaciones_por_lotes(lotes, mapping, inicio_dt, tamano_lote=TAMANO_LOTE, progreso=None, atomico=True):
+    """
+    Importa bloques de PailaAsignacion (sin programa) desde un iterable de
+    DataFrames. Las pailas se resuelven con una sola consulta y las filas se
+    insertan con bulk_create dentro de una transacción.
+    `progreso` y `atomico` funcionan igual que en importar_programas_por_lotes.
+    Los bloques anteriores se reemplazan al final: con atomico=False, si un
+    lote falla se borran las filas ya importadas y quedan los anteriores.
+    """
+    inicio = time.perf_counter()
+    creadas_ids = []
+
+    # 🔹 los bloques sin programa que existen ahora son los que se reemplazan
+    tope = PailaAsignacion.objects.aggregate(tope=Max("pk"))["tope"] or 0
+    pailas = set(InventarioPaila.objects.values_list("paila", flat=True))
+
+    try:
+        with transaction.atomic() if atomico else nullcontext():
+            importadas, omitidas = _importar_bloques(lotes, mapping, inicio_dt, pailas, tamano_lote, progreso, creadas_ids)
+            # 👇 BORRAR asignaciones sin programa anteriores, recién con todo importado
+            with cambios_agrupados():
+                PailaAsignacion.objects.filter(programa__isnull=True, pk__lte=tope).delete()
+    except Exception:
+        if not atomico:
+            with cambios_agrupados():
+                PailaAsignacion.objects.filter(pk__in=creadas_ids).delete()
+        raise
+
+    return {
+        "importadas": importadas,
+        "omitidas": omitidas,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def _importar_bloques(lotes, mapping, inicio_dt, pailas, tamano_lote, progreso, creadas_ids):
+    """Inserta los lotes y anota en `creadas_ids` lo creado. Devuelve (importadas, omitidas)."""
+    importadas = 0
+    omitidas = 0
+    for df in lotes:
+        paila = _columna(df, mapping["paila"])
+        fin = _columna(df, mapping["fin"])
+        estado = _columna(df, mapping["estado"])
+
+        paila = paila.where(paila.isna(), paila.astype(str).str.strip())
+        validas = paila.isin(pailas)
+        omitidas += int((~validas).sum())
+
+        fin = [_a_datetime(v) if pd.notna(v) else None for v in fin[validas]]
+
+        estado = estado[validas]
+        estado = estado.where(
+            estado.isna(), estado.astype(str).str.strip().str.lower()
+        ).fillna("disponible")
+
+        creadas = PailaAsignacion.objects.bulk_create(
+            [
+                PailaAsignacion(paila_id=p, inicio=inicio_dt, fin=f, estado=e)
+                for p, f, e in zip(paila[validas], fin, estado)
+            ],
+            batch_size=tamano_lote,
+        )
+        importadas += len(creadas)
+        creadas_ids.extend(a.pk for a in creadas)
+        registrar_cambios(ASIGNACION, [a.pk for a in creadas])
+
+        if progreso:
+            progreso(importadas, omitidas)
+
+    return importadas, omitidas
+
+
+def importar_asignaciones(df, mapping, inicio_dt, tamano_lote=TAMANO_LOTE):
+    """Versión de importar_asignaciones_por_lotes para un DataFrame ya leído."""
+    return importar_asignaciones_por_lotes([df], mapping, inicio_dt, tamano_lote)
@@ -0,0 +1,149 @@
+# instrumentacion.py
+"""
+Medición por request: consultas SQL, tiempo en SQL, tiempo en Python y
+tramos con nombre de las rutas calientes (lectura de Excel, serialización,
+chequeos de solapamiento...).
+
+MedicionMiddleware instala un execute_wrapper en las conexiones durante el
+request y deja la medición en un ContextVar, así `tramo("excel")` funciona
+desde cualquier módulo sin pasar el request (fuera de un request no hace
+nada). Al terminar:
+  - agrega el header Server-Timing (sql, python, total y cada tramo),
+  - escribe una línea JSON en el logger "App.rendimiento",
+  - guarda el registro en un buffer circular por proceso que resume
+    GET /debug/perf/ (p50/p95 por ruta).
+En respuestas en streaming solo se mide hasta que la vista devuelve.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("App.rendimiento")
+
+_medicion = ContextVar("medicion", default=None)
+
+_registros = None
+_lock = threading.Lock()
+
+
+class Medicion:
+    def __init__(self):
+        self.consultas = 0
+        self.sql = 0.0
+        self.tramos = defaultdict(float)
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: cuenta y cronometra cada consulta."""
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.sql += time.perf_counter() - t0
+
+
+@contextmanager
+def tramo(nombre):
+    """Suma el tiempo del bloque al tramo `nombre` del request actual."""
+    medicion = _medicion.get()
+    if medicion is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion.tramos[nombre] += time.perf_counter() - t0
+
+
+def _buffer():
+    global _registros
+    if _registros is None:
+        _registros = deque(maxlen=getattr(settings, "RENDIMIENTO_BUFFER", 5000))
+    return _registros
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 2)
+
+
+def server_timing(medicion, total):
+    partes = [
+        f'sql;dur={_ms(medicion.sql)};desc="{medicion.consultas} consultas"',
+        f"python;dur={_ms(total - medicion.sql)}",
+    ]
+    partes += [f"{nombre};dur={_ms(segundos)}" for nombre, segundos in medicion.tramos.items()]
+    partes.append(f"total;dur={_ms(total)}")
+    return ", ".join(partes)
+
+
+class MedicionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        t0 = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        total = time.perf_counter() - t0
+
+        response["Server-Timing"] = server_timing(medicion, total)
+
+        coincidencia = getattr(request, "resolver_match", None)
+        registro = {
+            "metodo": request.method,
+            "ruta": "/" + coincidencia.route if coincidencia else request.path,
+            "status": response.status_code,
+            "total_ms": _ms(total),
+            "sql_ms": _ms(medicion.sql),
+            "python_ms": _ms(total - medicion.sql),
+            "consultas": medicion.consultas,
+            "tramos_ms": {nombre: _ms(segundos) for nombre, segundos in medicion.tramos.items()},
+        }
+        logger.info(json.dumps(registro))
+        with _lock:
+            _buffer().append(registro)
+        return response
+
+
+def resumen_rendimiento():
+    """{"METODO ruta": {requests, p50/p95 de total, sql y consultas, promedio por tramo}}."""
+    with _lock:
+        registros = list(_buffer())
+
+    por_ruta = defaultdict(list)
+    for registro in registros:
+        por_ruta[f"{registro['metodo']} {registro['ruta']}"].append(registro)
+
+    resumen = {}
+    for ruta, filas in sorted(por_ruta.items()):
+        total = np.array([f["total_ms"] for f in filas])
+        sql = np.array([f["sql_ms"] for f in filas])
+        consultas = np.array([f["consultas"] for f in filas])
+        tramos = defaultdict(float)
+        for fila in filas:
+            for nombre, ms in fila["tramos_ms"].items():
+                tramos[nombre] += ms
+        resumen[ruta] = {
+            "requests": len(filas),
+            "total_ms": {"p50": round(float(np.percentile(total, 50)), 2), "p95": round(float(np.percentile(total, 95)), 2)},
+            "sql_ms": {"p50": round(float(np.percentile(sql, 50)), 2), "p95": round(float(np.percentile(sql, 95)), 2)},
+            "consultas": {"p50": float(np.percentile(consultas, 50)), "p95": float(np.percentile(consultas, 95))},
+            "tramos_promedio_ms": {nombre: round(ms / len(filas), 2) for nombre, ms in sorted(tramos.items())},
+        }
+    return {"registros": len(registros), "rutas": resumen}
@@ -0,0 +1,57 @@
+# intervalos.py
+"""
+Índice en memoria de intervalos ocupados por paila (PailaAsignacion) para
+el reporte de conflictos (conflictos/).
+
+Carga todas las pailas con una consulta y, por paila, busca los pares
+solapados con un barrido por inicio. El chequeo de las escrituras
+(asignar_paila, set_hora_inicial) no usa este índice: consulta la base
+(views.hay_solapamiento) para ver también lo que acaban de escribir otros
+procesos.
+"""
+import heapq
+
+from .models import PailaAsignacion
+
+CAMPOS = ("id", "paila_id", "inicio", "fin", "programa_id")
+
+
+class LineaPaila:
+    def __init__(self, intervalos):
+        # intervalos: (inicio, fin, programa_id, asignacion_id)
+        self.intervalos = sorted(intervalos, key=lambda i: (i[0], i[1]))
+
+    def conflictos(self):
+        """Pares de intervalos solapados (barrido por inicio con heap de fines)."""
+        activos = []  # (fin, indice)
+        pares = []
+        for indice, (inicio, fin, _, _) in enumerate(self.intervalos):
+            while activos and activos[0][0] <= inicio:
+                heapq.heappop(activos)
+            for _, otro in activos:
+                if self.intervalos[otro][0] < fin:  # descarta intervalos vacíos
+                    pares.append((self.intervalos[otro], self.intervalos[indice]))
+            heapq.heappush(activos, (fin, indice))
+        return pares
+
+
+class IndiceIntervalos:
+    def __init__(self):
+        self.lineas = {}  # paila -> LineaPaila
+
+    def cargar_todo(self):
+        """Carga todas las pailas con una sola consulta."""
+        por_paila = {}
+        for asignacion_id, paila_id, inicio, fin, programa_id in PailaAsignacion.objects.values_list(*CAMPOS):
+            if inicio is None or fin is None:
+                continue  # sin rango no puede solaparse (igual que la consulta original)
+            por_paila.setdefault(paila_id, []).append((inicio, fin, programa_id, asignacion_id))
+        self.lineas = {paila_id: LineaPaila(intervalos) for paila_id, intervalos in por_paila.items()}
+        return self
+
+    def conflictos(self):
+        """Todos los pares solapados de todas las pailas cargadas."""
+        return {
+            paila_id: linea.conflictos()
+            for paila_id, linea in self.lineas.items()
+        }
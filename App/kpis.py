@@ -0,0 +1,133 @@
+# kpis.py
+"""
+KPIs del plan para el tablero (ocupación de pailas, makespan, horas por
+etapa, órdenes fragmentadas y volumen sin asignar).
+
+Los totales de programas salen de agregados en la base; la ocupación de
+pailas es una pasada de numpy sobre PailaAsignacion (unión de intervalos por
+paila, sin contar dos veces los solapes). El resultado se guarda en el cache
+de Django con la versión del plan (versiones.py) en la clave: cualquier
+cambio de programas o asignaciones incrementa la versión (señales + llamadas
+explícitas tras las escrituras en bloque) y la siguiente consulta recalcula.
+"""
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Sum
+
+from .models import ProgramaProduccion, PailaAsignacion
+from .ruteo import ETAPAS
+from .versiones import obtener_version_plan, incrementar_version_plan
+
+
+def _horas(delta):
+    return delta.total_seconds() / 3600
+
+
+def ocupacion_pailas(filas):
+    """
+    filas: [(paila, inicio, fin)] ordenadas por paila e inicio.
+    Devuelve (inicio, fin, {paila: horas ocupadas}) con la unión de intervalos.
+    """
+    if not filas:
+        return None, None, {}
+    pailas, inicios, fines = zip(*filas)
+    origen = min(inicios)
+    final = max(fines)
+    ini = np.array([_horas(v - origen) for v in inicios])
+    fin = np.array([_horas(v - origen) for v in fines])
+
+    # grupos consecutivos por paila; el desplazamiento por grupo permite un
+    # solo maximum.accumulate global que no mezcla pailas
+    cambio = np.r_[True, np.array(pailas[1:], dtype=object) != np.array(pailas[:-1], dtype=object)]
+    grupo = np.cumsum(cambio) - 1
+    desplazamiento = grupo * (fin.max() + 1)
+    fin_acumulado = np.maximum.accumulate(fin + desplazamiento) - desplazamiento
+    previo = np.r_[-np.inf, fin_acumulado[:-1]]
+    previo[cambio] = -np.inf
+    aporte = np.maximum(fin - np.maximum(ini, previo), 0.0)
+
+    ocupadas = np.bincount(grupo, weights=aporte)
+    nombres = np.array(pailas, dtype=object)[cambio]
+    return origen, final, dict(zip(nombres.tolist(), ocupadas.tolist()))
+
+
+def calcular_kpis():
+    """KPIs sin cache (ver obtener_kpis)."""
+    t0 = time.perf_counter()
+    planificados = ProgramaProduccion.objects.filter(
+        paila__isnull=False, hora_inicial__isnull=False, hora_final__isnull=False
+    )
+    totales = planificados.aggregate(
+        programas=Count("id"),
+        produccion=Sum("produccion"),
+        inicio=Min("hora_inicial"),
+        fin=Max("hora_final"),
+        **{op: Sum(op) for op in ETAPAS},
+    )
+    fragmentacion = ProgramaProduccion.objects.filter(parent__isnull=False).aggregate(
+        # los hijos heredan la orden (también en cadenas de varios niveles)
+        fragmentos=Count("id"), ordenes=Count("orden", distinct=True),
+    )
+    # pendientes: hojas sin paila (los padres fragmentados no cuentan)
+    pendientes = ProgramaProduccion.objects.filter(paila__isnull=True, children__isnull=True).aggregate(
+        programas=Count("id"), volumen=Sum("lote_f"),
+    )
+
+    filas = list(
+        PailaAsignacion.objects.filter(inicio__isnull=False, fin__isnull=False)
+        .order_by("paila_id", "inicio")
+        .values_list("paila_id", "inicio", "fin")
+    )
+    origen, final, ocupadas = ocupacion_pailas(filas)
+    horizonte = _horas(final - origen) if filas else 0.0
+
+    makespan = _horas(totales["fin"] - totales["inicio"]) if totales["programas"] else 0.0
+    return {
+        "makespan_horas": round(makespan, 4),
+        "inicio": totales["inicio"],
+        "fin": totales["fin"],
+        "programas_planificados": totales["programas"],
+        "produccion_planificada": totales["produccion"] or 0.0,
+        "horas_por_etapa": {op: round(totales[op] or 0.0, 4) for op in ETAPAS},
+        "ocupacion_pailas": {
+            "horizonte_horas": round(horizonte, 4),
+            "promedio": round(sum(ocupadas.values()) / (len(ocupadas) * horizonte), 4) if horizonte else 0.0,
+            "pailas": [
+                {
+                    "paila": paila_id,
+                    "horas_ocupada": round(horas, 4),
+                    "ocupacion": round(horas / horizonte, 4) if horizonte else 0.0,
+                }
+                for paila_id, horas in sorted(ocupadas.items())
+            ],
+        },
+        "fragmentacion": {
+            "ordenes_fragmentadas": fragmentacion["ordenes"],
+            "fragmentos": fragmentacion["fragmentos"],
+        },
+        "sin_asignar": {
+            "programas": pendientes["programas"],
+            "volumen": pendientes["volumen"] or 0.0,
+        },
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
+
+
+def obtener_kpis():
+    """(kpis, version, cacheado): se recalcula solo si la versión del plan cambió."""
+    version = obtener_version_plan()
+    clave = f"kpis:{version}"
+    kpis = cache.get(clave)
+    if kpis is not None:
+        return kpis, version, True
+    kpis = calcular_kpis()
+    cache.set(clave, kpis, timeout=getattr(settings, "KPIS_CACHE_SEGUNDOS", 3600))
+    return kpis, version, False
+
+
+def invalidar_plan(**kwargs):
+    """Receiver de señales (y llamada explícita tras escrituras en bloque)."""
+    incrementar_version_plan()
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from App.sintetico import ESCALAS, generar_planta
+
+
+class Command(BaseCommand):
+    help = "Genera una planta sintética (productos, rutas, pailas, Matrix y órdenes) para pruebas de carga."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escala", choices=sorted(ESCALAS), help="Tamaño predefinido (órdenes, pailas)")
+        parser.add_argument("--ordenes", type=int)
+        parser.add_argument("--pailas", type=int)
+        parser.add_argument("--ferts", type=int)
+        parser.add_argument("--semilla", type=int, default=0)
+        parser.add_argument("--prefijo", default="SIN", help="Prefijo de los códigos generados")
+
+    def handle(self, *args, **opciones):
+        ordenes, pailas = ESCALAS[opciones["escala"]] if opciones["escala"] else (1_000, 50)
+        ordenes = opciones["ordenes"] or ordenes
+        pailas = opciones["pailas"] or pailas
+        if ordenes < 1 or pailas < 1:
+            raise CommandError("--ordenes y --pailas deben ser positivos")
+
+        creados = generar_planta(
+            ordenes=ordenes, pailas=pailas, ferts=opciones["ferts"],
+            semilla=opciones["semilla"], prefijo=opciones["prefijo"],
+        )
+        for modelo, cantidad in creados.items():
+            self.stdout.write(f"{modelo}: {cantidad}")
+        self.stdout.write(self.style.SUCCESS("Planta sintética generada"))
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0003_programaproduccion_produccion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('programa', 'Programa de producción'), ('asignacion', 'Asignación de pailas')], max_length=20)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('archivo', models.CharField(max_length=500)),
+                ('parametros', models.JSONField(default=dict)),
+                ('filas_procesadas', models.IntegerField(default=0)),
+                ('filas_omitidas', models.IntegerField(default=0)),
+                ('errores', models.JSONField(default=list)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('finalizado', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2 on 2026-10-18 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0004_trabajoimportacion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='programaproduccion',
+            index=models.Index(fields=['hora_inicial'], name='App_program_hora_in_62a445_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='programaproduccion',
+            index=models.Index(fields=['hora_final'], name='App_program_hora_fi_b48d43_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='programaproduccion',
+            index=models.Index(fields=['estacion'], name='App_program_estacio_06bdf1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='programaproduccion',
+            index=models.Index(fields=['paila', 'hora_inicial'], name='App_program_paila_i_4c818d_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-18 02:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0005_programaproduccion_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionPlan',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0006_versionplan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(db_index=True)),
+                ('tabla', models.CharField(max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+            ],
+        ),
+    ]
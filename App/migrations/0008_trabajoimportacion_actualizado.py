@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0007_cambioplan'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trabajoimportacion',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
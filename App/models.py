@@ -105,6 +105,15 @@ class ProgramaProduccion(models.Model):
 
     parent = models.ForeignKey("self", null=True, blank=True, related_name="children", on_delete=models.CASCADE)
 
+    class Meta:
+        # índices para los filtros de listar_programa (ventana horaria, paila, estación)
+        indexes = [
+            models.Index(fields=["hora_inicial"]),
+            models.Index(fields=["hora_final"]),
+            models.Index(fields=["estacion"]),
+            models.Index(fields=["paila", "hora_inicial"]),
+        ]
+
     def save(self, *args, **kwargs):
         # 👇 no permitir que se guarde produccion si no hay paila
         if not self.paila:
@@ -112,6 +121,11 @@ class ProgramaProduccion(models.Model):
 
         super().save(*args, **kwargs)  # primero guarda el programa
 
+        # 🔹 dentro de sincronizacion_diferida() la asignación se reconcilia al salir del bloque
+        from .asignaciones import diferir_asignacion
+        if diferir_asignacion(self):
+            return
+
         # 🔹 Crear o actualizar la asignación de la paila
         if self.paila and self.hora_inicial and self.hora_final:
             asignacion, created = PailaAsignacion.objects.update_or_create(
@@ -178,4 +192,57 @@ class Throughput(models.Model):
 
 class ExcelExtra(models.Model):
     programa = models.ForeignKey(ProgramaProduccion, on_delete=models.CASCADE, related_name="extras")
-    data = models.JSONField()  # guarda pares clave-valor de columnas adicionales
\ No newline at end of file
+    data = models.JSONField()  # guarda pares clave-valor de columnas adicionales
+
+# Tabla: TrabajoImportacion (importaciones de Excel en segundo plano)
+class TrabajoImportacion(models.Model):
+    tipo = models.CharField(
+        max_length=20,
+        choices=[
+            ('programa', 'Programa de producción'),
+            ('asignacion', 'Asignación de pailas'),
+        ]
+    )
+    estado = models.CharField(
+        max_length=20,
+        default='pendiente',
+        choices=[
+            ('pendiente', 'Pendiente'),
+            ('en_proceso', 'En proceso'),
+            ('completado', 'Completado'),
+            ('error', 'Error'),
+        ]
+    )
+    archivo = models.CharField(max_length=500)  # ruta temporal del Excel subido
+    parametros = models.JSONField(default=dict)  # mapping, inicio, etc.
+
+    filas_procesadas = models.IntegerField(default=0)
+    filas_omitidas = models.IntegerField(default=0)
+    errores = models.JSONField(default=list)
+
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    finalizado = models.DateTimeField(null=True, blank=True)
+    actualizado = models.DateTimeField(auto_now=True, null=True)  # último avance (ver trabajos.revisar_trabajo)
+
+    def __str__(self):
+        return f"Importación {self.pk} - {self.tipo} ({self.estado})"
+
+
+# Tabla: VersionPlan (contadores monotónicos para ETag / lecturas condicionales)
+class VersionPlan(models.Model):
+    nombre = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nombre} v{self.version}"
+
+
+# Tabla: CambioPlan (bitácora de filas cambiadas por versión, para /programa-produccion/cambios/)
+class CambioPlan(models.Model):
+    version = models.BigIntegerField(db_index=True)
+    tabla = models.CharField(max_length=20)  # "programa", "asignacion" o "reinicio"
+    objeto_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f"v{self.version} {self.tabla} {self.objeto_id}"
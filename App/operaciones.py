@@ -0,0 +1,91 @@
+# operaciones.py
+"""
+Cálculo vectorizado de horas por etapa para todo el plan.
+
+Cruza el plan con la matriz de horas por unidad del modelo de ruteo y calcula
+cantidad * horas_unidad (ruteo.cantidad_programa: la producción en la paila de
+los fragmentos, si no lote_f) para las etapas activas de una sola pasada. El
+resultado se guarda con una actualización en bloque y una reconciliación de
+asignaciones, en lugar de un programa.save() por fila.
+"""
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from .asignaciones import reconciliar_asignaciones
+from .bd import actualizar_en_bloque
+from .cambios import registrar_cambios, PROGRAMA
+from .models import ProgramaProduccion
+from .ruteo import ETAPAS, obtener_modelo_ruteo, cantidad_programa
+from .versiones import cambios_agrupados
+
+CAMPOS_OPERACIONES = [*ETAPAS, "duracion_total", "hora_final", "produccion"]
+
+COLUMNAS_PROGRAMA = ["id", "fert_id", "lote_f", "paila_id", "produccion", "hora_inicial", "hora_final"]
+
+
+def horas_por_etapa(lotes, filas, modelo):
+    """
+    lotes: array de cantidades; filas: índices en el modelo de ruteo (-1 = sin
+    ruta). Devuelve (horas por etapa (n x etapas, NaN si no aplica), total).
+    """
+    if not modelo.posicion:
+        horas = np.full((len(lotes), len(ETAPAS)), np.nan)
+        return horas, np.zeros(len(lotes))
+    horas = lotes[:, None] * modelo.horas_unidad[np.maximum(filas, 0)]
+    horas[filas < 0] = np.nan
+    return horas, np.nansum(horas, axis=1)
+
+
+def _nulo(valor):
+    return None if np.isnan(valor) else float(valor)
+
+
+def calcular_operaciones_plan():
+    """
+    Recalcula etapas, duracion_total y hora_final de todos los programas con
+    fert y lote_f. Devuelve {"actualizados", "omitidos", "segundos"}.
+    """
+    t0 = time.perf_counter()
+    filas = list(
+        ProgramaProduccion.objects.filter(lote_f__isnull=False)
+        .exclude(lote_f=0)
+        .values(*COLUMNAS_PROGRAMA)
+    )
+    modelo = obtener_modelo_ruteo()
+    filas_modelo = modelo.filas([f["fert_id"] for f in filas])
+    lotes = np.array([cantidad_programa(f["lote_f"], f["produccion"], f["paila_id"]) for f in filas], dtype=float)
+    horas, totales = horas_por_etapa(lotes, filas_modelo, modelo)
+
+    programas = []
+    for original, fila, etapas, total in zip(filas, filas_modelo, horas, totales):
+        if fila < 0:
+            continue
+        programa = ProgramaProduccion(
+            id=original["id"],
+            fert_id=original["fert_id"],
+            lote_f=original["lote_f"],
+            paila_id=original["paila_id"],
+            # como en save(): sin paila no hay producción
+            produccion=original["produccion"] if original["paila_id"] else None,
+            hora_inicial=original["hora_inicial"],
+            hora_final=original["hora_final"],
+            duracion_total=float(total),
+        )
+        for op, valor in zip(ETAPAS, etapas.tolist()):
+            setattr(programa, op, _nulo(valor))
+        if programa.hora_inicial and programa.duracion_total:
+            programa.hora_final = programa.hora_inicial + timedelta(hours=programa.duracion_total)
+        programas.append(programa)
+
+    with cambios_agrupados():
+        actualizar_en_bloque(programas, CAMPOS_OPERACIONES)
+        registrar_cambios(PROGRAMA, [p.id for p in programas])
+        reconciliar_asignaciones(programas)
+
+    return {
+        "actualizados": len(programas),
+        "omitidos": len(filas) - len(programas),
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
@@ -0,0 +1,259 @@
+# optimizador.py
+"""
+Optimizador de mejora sobre el plan actual.
+
+Toma los programas ya planificados (paila + horas), arma el problema en
+estructuras simples y lanza reinicios independientes de recocido simulado
+(busqueda_local.buscar) en un ProcessPoolExecutor. El horizonte empieza en
+`desde` (por defecto, el primer programa): los programas que empezaron antes
+quedan fijos como obstáculos y el resto puede adelantarse hasta ese inicio.
+El objetivo inicial se mide sobre el plan guardado. Devuelve la mejor
+solución con su objetivo; opcionalmente guarda en bloque los programas que
+cambiaron.
+"""
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+
+from .asignaciones import reconciliar_asignaciones
+from .bd import actualizar_en_bloque
+from .cambios import registrar_cambios, PROGRAMA
+from .busqueda_local import buscar, decodificar, objetivo
+from .compatibilidad import obtener_indice
+from .models import ProgramaProduccion, PailaAsignacion
+from .planificador import cargar_estaciones
+from .ruteo import cantidad_programa
+from .versiones import cambios_agrupados
+
+
+def _horas(delta):
+    return delta.total_seconds() / 3600
+
+
+def cargar_problema(desde=None):
+    """
+    Programas planificados desde `desde`, pailas compatibles y obstáculos
+    (asignaciones sin programa y programas que empezaron antes de `desde`).
+    """
+    programas = list(
+        ProgramaProduccion.objects.filter(
+            paila__isnull=False, hora_inicial__isnull=False, hora_final__isnull=False
+        )
+        .order_by("hora_inicial", "id")
+        .values("id", "fert_id", "lote_f", "produccion", "paila_id", "hora_inicial", "hora_final")
+    )
+    inicio = desde or min((p["hora_inicial"] for p in programas), default=None)
+    fijos = [p for p in programas if p["hora_inicial"] < inicio] if inicio else []
+    programas = [p for p in programas if p["hora_inicial"] >= inicio] if inicio else []
+    if not programas:
+        return None
+
+    indice = obtener_indice()
+
+    pailas = []
+    posicion = {}
+
+    def _paila(paila_id):
+        if paila_id not in posicion:
+            posicion[paila_id] = len(pailas)
+            pailas.append(paila_id)
+        return posicion[paila_id]
+
+    duraciones = []
+    guardados = []  # inicio guardado de cada trabajo (horas desde `inicio`)
+    compatibles = []
+    secuencias = {}
+    for trabajo, programa in enumerate(programas):
+        duraciones.append(max(_horas(programa["hora_final"] - programa["hora_inicial"]), 0.0))
+        guardados.append(_horas(programa["hora_inicial"] - inicio))
+        cantidad = cantidad_programa(programa["lote_f"], programa["produccion"], programa["paila_id"])
+        opciones = {
+            _paila(p["paila"])
+            for p in indice.pailas_validas(programa["fert_id"], programa["lote_f"])
+            if p["capacidad_planificable"] >= cantidad
+        }
+        actual = _paila(programa["paila_id"])
+        opciones.add(actual)  # la paila actual siempre es válida
+        compatibles.append(sorted(opciones))
+        secuencias.setdefault(actual, []).append(trabajo)
+
+    obstaculos = [[] for _ in pailas]
+    for paila_id, ini, fin in (
+        PailaAsignacion.objects.filter(
+            programa__isnull=True, paila_id__in=pailas, inicio__isnull=False, fin__isnull=False
+        )
+        .order_by("inicio")
+        .values_list("paila_id", "inicio", "fin")
+    ):
+        obstaculos[posicion[paila_id]].append((_horas(ini - inicio), _horas(fin - inicio)))
+    for programa in fijos:  # en curso al inicio del horizonte: ocupan su paila
+        if programa["paila_id"] in posicion and programa["hora_final"] > inicio:
+            obstaculos[posicion[programa["paila_id"]]].append(
+                (_horas(programa["hora_inicial"] - inicio), _horas(programa["hora_final"] - inicio))
+            )
+    for lista in obstaculos:
+        lista.sort()
+
+    return {
+        "inicio": inicio,
+        "programas": programas,
+        "pailas": pailas,
+        "guardados": guardados,
+        "datos": {
+            "duraciones": duraciones,
+            "compatibles": compatibles,
+            "obstaculos": obstaculos,
+            "secuencias": [secuencias.get(p, []) for p in range(len(pailas))],
+        },
+    }
+
+
+def evaluar(datos, secuencias):
+    """(objetivo, makespan, ocio, inicios por trabajo) de un conjunto de secuencias."""
+    fines, ocios, inicios = [], [], {}
+    for p, secuencia in enumerate(secuencias):
+        fin, ocio, comienzos = decodificar(secuencia, datos["duraciones"], datos["obstaculos"][p])
+        fines.append(fin)
+        ocios.append(ocio)
+        inicios.update(zip(secuencia, comienzos))
+    return objetivo(fines, ocios), max(fines, default=0.0), sum(ocios), inicios
+
+
+def evaluar_guardado(datos, guardados):
+    """(objetivo, makespan, ocio) del plan tal como está guardado, sin decodificar."""
+    fines, ocios = [], []
+    for p, secuencia in enumerate(datos["secuencias"]):
+        tramos = [(guardados[t], guardados[t] + datos["duraciones"][t]) for t in secuencia]
+        fin = max((f for _, f in tramos), default=0.0)
+        # ocio = tiempo en [0, fin] no cubierto por trabajos ni obstáculos (como en decodificar)
+        ocupado, hasta = 0.0, 0.0
+        for ini, f in sorted(tramos + datos["obstaculos"][p]):
+            ini, f = max(ini, hasta), min(f, fin)
+            if f > ini:
+                ocupado += f - ini
+                hasta = f
+        fines.append(fin)
+        ocios.append(max(fin - ocupado, 0.0))
+    return objetivo(fines, ocios), max(fines, default=0.0), sum(ocios)
+
+
+def optimizar(tiempo=10.0, semilla=0, reinicios=None, iteraciones=None, aplicar=False, desde=None):
+    """
+    Ejecuta `reinicios` corridas independientes (una por núcleo por defecto)
+    con semillas semilla, semilla+1, ... y devuelve la mejor. `tiempo` (s)
+    se limita a OPTIMIZADOR_TIEMPO_MAXIMO; valores no finitos, no positivos o
+    sin reinicios dan ValueError. Con `aplicar=True` se guarda solo si mejora
+    el objetivo inicial.
+    """
+    if not math.isfinite(tiempo) or tiempo <= 0:
+        raise ValueError("tiempo debe ser un número positivo de segundos")
+    if reinicios is not None and reinicios < 1:
+        raise ValueError("reinicios debe ser al menos 1")
+    if iteraciones is not None and iteraciones < 1:
+        raise ValueError("iteraciones debe ser al menos 1")
+    tiempo = min(tiempo, getattr(settings, "OPTIMIZADOR_TIEMPO_MAXIMO", 120))
+
+    t0 = time.perf_counter()
+    problema = cargar_problema(desde)
+    if problema is None:
+        return None
+
+    datos = problema["datos"]
+    nucleos = os.cpu_count() or 1
+    reinicios = reinicios or nucleos
+    workers = min(reinicios, nucleos)
+    # el presupuesto es de reloj: si hay más reinicios que núcleos se reparte por rondas
+    tiempo_corrida = tiempo / math.ceil(reinicios / workers)
+    perturbacion = max(len(datos["duraciones"]) // 10, 1)
+    argumentos = [
+        (datos, semilla + k, tiempo_corrida, iteraciones, perturbacion if k else 0)
+        for k in range(reinicios)
+    ]
+
+    if workers == 1:
+        resultados = [buscar(*args) for args in argumentos]
+    else:
+        # spawn: los hijos no heredan conexiones ni hilos del proceso de Django
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+            resultados = list(pool.map(buscar, *zip(*argumentos)))
+
+    # mejor objetivo; ante empate, la menor semilla (resultado determinista)
+    mejor = min(resultados, key=lambda r: (r["objetivo"], r["semilla"]))
+
+    objetivo_inicial, makespan_inicial, ocio_inicial = evaluar_guardado(datos, problema["guardados"])
+    objetivo_final, makespan, ocio, inicios = evaluar(datos, mejor["secuencias"])
+
+    inicio = problema["inicio"]
+    asignaciones = []
+    for p, secuencia in enumerate(mejor["secuencias"]):
+        for trabajo in secuencia:
+            programa = problema["programas"][trabajo]
+            if abs(inicios[trabajo] - problema["guardados"][trabajo]) < 1e-9:
+                # sin redondeos: el trabajo que no se movió conserva sus horas exactas
+                comienzo, final = programa["hora_inicial"], programa["hora_final"]
+            else:
+                comienzo = inicio + timedelta(hours=inicios[trabajo])
+                final = comienzo + timedelta(hours=datos["duraciones"][trabajo])
+            asignaciones.append({
+                "programa": programa["id"],
+                "paila": problema["pailas"][p],
+                "hora_inicial": comienzo,
+                "hora_final": final,
+            })
+
+    aplicado = False
+    actualizados = 0
+    if aplicar and objetivo_final < objetivo_inicial:
+        actualizados = aplicar_asignaciones(asignaciones)
+        aplicado = True
+
+    return {
+        "objetivo_inicial": round(objetivo_inicial, 4),
+        "objetivo": round(objetivo_final, 4),
+        "makespan_inicial_horas": round(makespan_inicial, 4),
+        "makespan_horas": round(makespan, 4),
+        "ocio_inicial_horas": round(ocio_inicial, 4),
+        "ocio_horas": round(ocio, 4),
+        "semilla": mejor["semilla"],
+        "iteraciones": sum(r["iteraciones"] for r in resultados),
+        "reinicios": reinicios,
+        "aplicado": aplicado,
+        "actualizados": actualizados,
+        "segundos": round(time.perf_counter() - t0, 3),
+        "asignaciones": asignaciones,
+    }
+
+
+def aplicar_asignaciones(asignaciones):
+    """Guarda en bloque paila/horas (y la estación de la nueva paila) de los programas que cambiaron."""
+    por_programa = {a["programa"]: a for a in asignaciones}
+    estaciones = cargar_estaciones()
+    indice = obtener_indice()
+
+    cambiados = []
+    for programa in ProgramaProduccion.objects.filter(pk__in=por_programa):
+        nueva = por_programa[programa.id]
+        if (programa.paila_id, programa.hora_inicial, programa.hora_final) == (
+            nueva["paila"], nueva["hora_inicial"], nueva["hora_final"]
+        ):
+            continue
+        if programa.paila_id != nueva["paila"]:
+            programa.paila_id = nueva["paila"]
+            programa.estacion = estaciones.get((nueva["paila"], indice.color_de(programa.fert_id)))
+        programa.hora_inicial = nueva["hora_inicial"]
+        programa.hora_final = nueva["hora_final"]
+        cambiados.append(programa)
+
+    if not cambiados:
+        return 0
+    with cambios_agrupados():
+        actualizar_en_bloque(cambiados, ["paila", "estacion", "hora_inicial", "hora_final"])
+        registrar_cambios(PROGRAMA, [p.id for p in cambiados])
+        reconciliar_asignaciones(cambiados)
+    return len(cambiados)
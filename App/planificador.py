@@ -0,0 +1,354 @@
+# planificador.py
+"""
+Planificación automática por lista (greedy).
+
+Carga en memoria el plan, la compatibilidad Matrix y los bloques ya ocupados
+de PailaAsignacion; las duraciones salen del modelo de ruteo. Cada programa
+sin planificar va a la paila compatible donde termina antes; si el lote supera
+la capacidad_planificable se fragmenta igual que en asignar_paila (el hijo
+lleva el sobrante) y cada fragmento se planifica a su vez. El resultado se
+escribe con bulk_update / bulk_create y una reconciliación de asignaciones.
+"""
+import time
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Q
+
+from .asignaciones import reconciliar_asignaciones
+from .bd import actualizar_en_bloque
+from .cambios import registrar_cambios, PROGRAMA
+from .compatibilidad import obtener_indice
+from .models import ProgramaProduccion, PailaAsignacion, Matrix
+from .recursos import cargar_calendario
+from .ruteo import ETAPAS, obtener_modelo_ruteo, cantidad_programa
+from .versiones import cambios_agrupados
+
+CAMPOS_PLANIFICADOS = [
+    "paila", "estacion", "produccion", "hora_inicial", "hora_final", "duracion_total", *ETAPAS,
+]
+
+
+class Agenda:
+    """Intervalos ocupados de una paila, ordenados y fusionados."""
+
+    def __init__(self):
+        self.inicios = []
+        self.fines = []
+
+    def primer_hueco(self, desde, duracion):
+        """Primer inicio >= desde tal que [inicio, inicio + duracion) está libre."""
+        inicio = desde
+        k = bisect_right(self.fines, desde)  # primer intervalo que termina después de `desde`
+        while k < len(self.inicios):
+            if self.inicios[k] >= inicio + duracion:
+                break
+            inicio = max(inicio, self.fines[k])
+            k += 1
+        return inicio
+
+    def reservar(self, inicio, fin):
+        k = bisect_left(self.inicios, inicio)
+        if k > 0 and self.fines[k - 1] >= inicio:
+            k -= 1
+            inicio = self.inicios[k]
+            fin = max(fin, self.fines[k])
+            del self.inicios[k], self.fines[k]
+        while k < len(self.inicios) and self.inicios[k] <= fin:
+            fin = max(fin, self.fines[k])
+            del self.inicios[k], self.fines[k]
+        self.inicios.insert(k, inicio)
+        self.fines.insert(k, fin)
+
+
+def cargar_estaciones():
+    """(paila, color) -> estación del primer Matrix con diamsi='SI' (como asignar_paila)."""
+    estaciones = {}
+    for paila_id, color_id, estacion in (
+        Matrix.objects.filter(diamsi="SI").order_by("primario").values_list("paila_id", "color_id", "estacion")
+    ):
+        estaciones.setdefault((paila_id, color_id), estacion)
+    return estaciones
+
+
+def cargar_agendas(excluir_programas, pailas=None):
+    agendas = defaultdict(Agenda)
+    filas = PailaAsignacion.objects.filter(inicio__isnull=False, fin__isnull=False)
+    if pailas is not None:
+        filas = filas.filter(paila_id__in=pailas)
+    filas = filas.order_by("inicio").values_list("paila_id", "inicio", "fin", "programa_id")
+    for paila_id, inicio, fin, programa_id in filas:
+        if programa_id not in excluir_programas and inicio < fin:
+            agendas[paila_id].reservar(inicio, fin)
+    return agendas
+
+
+def primer_hueco_conjunto(agenda, calendario, paila_id, estacion, etapas, desde, duracion):
+    """
+    Primer inicio libre a la vez en la paila y en los equipos de la estación
+    (si hay calendario). El calendario también tiene la ocupación de la paila
+    (redondeada a buckets hacia afuera), así que su respuesta ya suele estar
+    libre en la agenda; la agenda solo confirma.
+    """
+    hueco = agenda.primer_hueco(desde, duracion)
+    if calendario is None:
+        return hueco
+    while True:
+        hueco = calendario.primer_inicio(estacion, etapas, hueco, paila=paila_id)
+        libre = agenda.primer_hueco(hueco, duracion)
+        if libre == hueco:
+            return hueco
+        hueco = libre
+
+
+def _aplicar_tiempos(programa, modelo, cantidad, inicio):
+    etapas, total = modelo.horas_etapas(programa.fert_id, cantidad)
+    for op, horas in etapas.items():
+        setattr(programa, op, horas)
+    programa.duracion_total = total
+    programa.hora_inicial = inicio
+    programa.hora_final = inicio + timedelta(hours=total)
+
+
+def planificar(inicio, programa_ids=None, recursos=False):
+    """
+    Planifica los programas sin paila (hojas del árbol) o sin hora_inicial a
+    partir de `inicio`. Con `recursos=True` cada etapa además debe entrar en
+    el calendario de equipos de su estación (ver recursos.py).
+    Devuelve un resumen con contadores y el fin del plan.
+    """
+    t0 = time.perf_counter()
+
+    # Exists y no un join con children: un programa con varios hijos saldría repetido
+    hijos = ProgramaProduccion.objects.filter(parent=OuterRef("pk"))
+    candidatos = ProgramaProduccion.objects.filter(
+        Q(paila__isnull=True) & ~Exists(hijos) | Q(paila__isnull=False, hora_inicial__isnull=True)
+    ).order_by("id")
+    if programa_ids is not None:
+        candidatos = candidatos.filter(pk__in=programa_ids)
+    candidatos = list(candidatos)
+
+    indice = obtener_indice()
+    modelo = obtener_modelo_ruteo()
+    estaciones = cargar_estaciones()
+    agendas = cargar_agendas({p.id for p in candidatos})
+    calendario = None
+    if recursos:
+        calendario = cargar_calendario(inicio, {p.id for p in candidatos})
+        for paila_id, agenda in agendas.items():
+            for ini, fin in zip(agenda.inicios, agenda.fines):
+                if fin > inicio:
+                    calendario.ocupar_paila(paila_id, max(ini, inicio), fin)
+
+    planificados = []  # programas existentes actualizados
+    fragmentos = []  # niveles de hijos nuevos: fragmentos[n] = hijos de profundidad n
+    sin_paila = sin_duracion = 0
+
+    for programa in candidatos:
+        por_unidad = modelo.total_por_unidad(programa.fert_id)
+        if not por_unidad or not programa.lote_f:
+            sin_duracion += 1
+            continue
+
+        if programa.paila_id:
+            # ya tiene paila: solo buscar el primer hueco en esa paila
+            cantidad = cantidad_programa(programa.lote_f, programa.produccion, programa.paila_id)
+            duracion = timedelta(hours=cantidad * por_unidad)
+            etapas, _ = modelo.horas_etapas(programa.fert_id, cantidad)
+            agenda = agendas[programa.paila_id]
+            hueco = primer_hueco_conjunto(agenda, calendario, programa.paila_id, programa.estacion, etapas, inicio, duracion)
+            _aplicar_tiempos(programa, modelo, cantidad, hueco)
+            agenda.reservar(hueco, hueco + duracion)
+            if calendario is not None:
+                calendario.reservar(programa.estacion, etapas, hueco, paila=programa.paila_id)
+            planificados.append(programa)
+            continue
+
+        color_id = indice.color_de(programa.fert_id)
+        actual = programa
+        restante = programa.lote_f
+        nivel = 0
+        while True:
+            compatibles = indice.pailas_para_color(color_id, restante)
+            if not compatibles:
+                if actual is programa:
+                    sin_paila += 1
+                break  # el fragmento queda sin paila, como en asignar_paila
+
+            # 🔹 paila compatible donde el fragmento termina antes: el hueco de
+            # la paila sola es cota inferior, así que se evalúan en ese orden y
+            # se corta en cuanto la cota no mejora lo encontrado
+            opciones = []
+            equipos = {}  # (estacion, cantidad) -> (etapas, primer inicio solo por equipos)
+            for orden, opcion in enumerate(compatibles):
+                cantidad = min(restante, opcion["capacidad_planificable"])
+                duracion = timedelta(hours=cantidad * por_unidad)
+                hueco = agendas[opcion["paila"]].primer_hueco(inicio, duracion)
+                estacion = estaciones.get((opcion["paila"], color_id))
+                etapas = None
+                if calendario is not None:
+                    # con equipos la cota es el máximo de ambos huecos por separado
+                    clave = (estacion, cantidad)
+                    if clave not in equipos:
+                        etapas, _ = modelo.horas_etapas(programa.fert_id, cantidad)
+                        equipos[clave] = (etapas, calendario.primer_inicio(estacion, etapas, inicio))
+                    etapas, hueco_equipos = equipos[clave]
+                    hueco = max(hueco, hueco_equipos)
+                opciones.append((hueco + duracion, orden, hueco, duracion, cantidad, opcion["paila"], estacion, etapas))
+            opciones.sort(key=lambda o: (o[0], o[1]))
+
+            mejor = None
+            for cota, _, hueco, duracion, cantidad, paila_id, estacion, etapas in opciones:
+                if mejor is not None and cota >= mejor[0]:
+                    break
+                if etapas is None:
+                    etapas, _ = modelo.horas_etapas(programa.fert_id, cantidad)
+                hueco = primer_hueco_conjunto(agendas[paila_id], calendario, paila_id, estacion, etapas, hueco, duracion)
+                if mejor is None or hueco + duracion < mejor[0]:
+                    mejor = (hueco + duracion, hueco, duracion, cantidad, paila_id, estacion, etapas)
+            _, hueco, duracion, cantidad, paila_id, estacion, etapas = mejor
+
+            actual.paila_id = paila_id
+            actual.estacion = estacion
+            actual.produccion = cantidad
+            _aplicar_tiempos(actual, modelo, cantidad, hueco)
+            agendas[paila_id].reservar(hueco, hueco + duracion)
+            if calendario is not None:
+                calendario.reservar(estacion, etapas, hueco, paila=paila_id)
+            if actual is programa:
+                planificados.append(programa)
+
+            restante -= cantidad
+            if restante <= 0:
+                break
+
+            # 🔹 sobrante como hijo del fragmento actual
+            hijo = ProgramaProduccion(orden=actual.orden, fert_id=actual.fert_id, lote_f=restante, parent=actual)
+            if len(fragmentos) <= nivel:
+                fragmentos.append([])
+            fragmentos[nivel].append(hijo)
+            actual = hijo
+            nivel += 1
+
+    with cambios_agrupados():
+        actualizar_en_bloque(planificados, CAMPOS_PLANIFICADOS)
+        for hijos in fragmentos:  # por niveles: cada nivel ya conoce el id de su padre
+            ProgramaProduccion.objects.bulk_create(hijos, batch_size=1000)
+        nuevos = [hijo for hijos in fragmentos for hijo in hijos]
+        registrar_cambios(PROGRAMA, [p.id for p in planificados + nuevos])
+        reconciliar_asignaciones(planificados + nuevos)
+
+    fines = [p.hora_final for p in planificados + nuevos if p.hora_final]
+    return {
+        "planificados": len(planificados),
+        "fragmentos": len(nuevos),
+        "sin_paila": sin_paila,
+        "sin_duracion": sin_duracion,
+        "fin_plan": max(fines) if fines else None,
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
+
+
+def repartir_lote(lote_f, color_id, indice, permitidas=None):
+    """
+    Reparte lote_f en fragmentos sobre las pailas compatibles (first-fit
+    decreasing): cada ronda recorre las pailas por capacidad descendente
+    usando cada una a lo sumo una vez; el resto va a la paila más chica donde
+    cabe entero. Devuelve ([(opcion, cantidad)], sobrante sin paila).
+    Una paila sin capacidad_planificable positiva no avanza el reparto: ValueError.
+    """
+    fragmentos = []
+    usadas = set()
+    restante = lote_f
+    while restante > 0:
+        opciones = [
+            o for o in indice.pailas_para_color(color_id, restante)
+            if permitidas is None or o["paila"] in permitidas
+        ]
+        if not opciones:
+            break
+        for o in opciones:
+            if not o["capacidad_planificable"] or o["capacidad_planificable"] <= 0:
+                raise ValueError(f"La paila {o['paila']} no tiene capacidad_planificable positiva")
+        libres = [o for o in opciones if o["paila"] not in usadas]
+        if not libres:  # nueva ronda sobre las mismas pailas
+            usadas.clear()
+            libres = opciones
+        caben = [o for o in libres if o["capacidad_planificable"] >= restante]
+        opcion = caben[-1] if caben else libres[0]  # ordenadas por capacidad descendente
+
+        cantidad = min(restante, opcion["capacidad_planificable"])
+        fragmentos.append((opcion, cantidad))
+        usadas.add(opcion["paila"])
+        restante -= cantidad
+    return fragmentos, max(restante, 0)
+
+
+def fragmentar_programa(programa, inicio, pailas=None):
+    """
+    Reemplaza los hijos del programa por un reparto completo del lote en
+    varias pailas: cada fragmento con su paila, estación y primer hueco libre
+    desde `inicio`. Como en asignar_paila y planificar, cada fragmento es hijo
+    del anterior y su lote_f es lo que falta repartir. Todos se insertan con
+    un solo bulk_create colgando del programa y después una actualización en
+    bloque los encadena. Sin ruta no hay duración: el programa conserva su
+    horario solo si está libre en la paila nueva (si no, ValueError) y los
+    demás fragmentos quedan sin horario. Devuelve None si ninguna paila es
+    compatible.
+    """
+    indice = obtener_indice()
+    color_id = indice.color_de(programa.fert_id)
+    permitidas = set(pailas) if pailas is not None else None
+    fragmentos, sobrante = repartir_lote(programa.lote_f, color_id, indice, permitidas)
+    if not fragmentos:
+        return None
+
+    modelo = obtener_modelo_ruteo()
+    estaciones = cargar_estaciones()
+    con_ruta = modelo.tiene_ruta(programa.fert_id)
+
+    with cambios_agrupados():
+        programa.children.all().delete()  # sus descendientes y asignaciones caen por CASCADE
+        # una sola consulta de ocupación para las pailas involucradas
+        agendas = cargar_agendas({programa.id}, {o["paila"] for o, _ in fragmentos})
+
+        piezas = []
+        restante = programa.lote_f
+        for opcion, cantidad in fragmentos:
+            pieza = programa if not piezas else ProgramaProduccion(
+                orden=programa.orden, fert_id=programa.fert_id, lote_f=restante, parent=programa,
+            )
+            pieza.paila_id = opcion["paila"]
+            pieza.estacion = estaciones.get((opcion["paila"], color_id))
+            pieza.produccion = cantidad
+            agenda = agendas[opcion["paila"]]
+            if con_ruta:
+                duracion = timedelta(hours=modelo.duracion(programa.fert_id, cantidad))
+                hueco = agenda.primer_hueco(inicio, duracion)
+                _aplicar_tiempos(pieza, modelo, cantidad, hueco)
+                agenda.reservar(hueco, hueco + duracion)
+            elif pieza.hora_inicial and pieza.hora_final:
+                duracion = pieza.hora_final - pieza.hora_inicial
+                if agenda.primer_hueco(pieza.hora_inicial, duracion) != pieza.hora_inicial:
+                    raise ValueError("No se puede asignar esta paila porque hay solapamiento")
+                agenda.reservar(pieza.hora_inicial, pieza.hora_final)
+            piezas.append(pieza)
+            restante -= cantidad
+
+        if sobrante:
+            # como en asignar_paila: lo que no entra en ninguna paila queda sin asignar
+            piezas.append(ProgramaProduccion(
+                orden=programa.orden, fert_id=programa.fert_id, lote_f=sobrante, parent=programa,
+            ))
+
+        actualizar_en_bloque([programa], CAMPOS_PLANIFICADOS)
+        ProgramaProduccion.objects.bulk_create(piezas[1:], batch_size=1000)
+        # con los ids ya asignados, cada fragmento pasa a colgar del anterior
+        for anterior, pieza in zip(piezas[1:], piezas[2:]):
+            pieza.parent = anterior
+        actualizar_en_bloque(piezas[2:], ["parent"])
+        registrar_cambios(PROGRAMA, [p.id for p in piezas])
+        reconciliar_asignaciones(piezas)
+
+    return {"fragmentos": piezas, "sobrante": sobrante}
@@ -0,0 +1,230 @@
+# recursos.py
+"""
+Calendario de capacidad por estación y etapa.
+
+Cada estación tiene tantas unidades como equipos registrados en Equipo; cada
+etapa del programa (empastado, molino, ..., envasado, en ese orden desde
+hora_inicial) ocupa una unidad del recurso (estacion, etapa) durante sus
+horas. Así dos programas pueden estar en la misma estación en etapas
+distintas, pero no más molinos o envasados a la vez que equipos.
+Opcionalmente la paila entra como un recurso más de capacidad 1 durante todo
+el programa, y la búsqueda resuelve paila y equipos en una sola pasada.
+
+La ocupación de cada recurso es un array de enteros por bucket de tiempo
+(RECURSOS_MINUTOS_BUCKET, 15 min por defecto) desde `origen`; reservar es
+sumar 1 a un rango y "primer inicio donde entran todas las etapas" es un AND
+de comparaciones sobre las corridas de buckets libres de cada recurso, sin
+recorrer programas. El redondeo a buckets es conservador (un bucket parcial
+cuenta como ocupado). Las estaciones sin equipos no se modelan.
+"""
+import math
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from .models import Equipo, ProgramaProduccion
+from .ruteo import ETAPAS
+
+BLOQUE_INICIAL = 4 * 24 * 7  # buckets reservados al crear un recurso (una semana en 15 min)
+TRAMO_BUSQUEDA = 128  # primeros candidatos revisados por primer_inicio (luego se duplica)
+SIN_LIMITE = np.iinfo(np.int64).max
+
+PAILA = "paila"  # recursos de paila: (PAILA, paila_id), capacidad 1
+
+
+class CalendarioRecursos:
+    def __init__(self, origen, capacidades, minutos=None):
+        self.origen = origen
+        self.capacidades = capacidades  # estacion -> cantidad de equipos
+        self.delta = timedelta(minutes=minutos or getattr(settings, "RECURSOS_MINUTOS_BUCKET", 15))
+        self.ocupacion = {}  # recurso -> np.ndarray de ocupación por bucket
+        self._corridas_cache = {}  # recurso -> buckets libres consecutivos desde cada bucket
+
+    # 🔹 conversión de tiempos a buckets
+    def _indice(self, momento):
+        return (momento - self.origen) / self.delta
+
+    def _asegurar_origen(self, momento):
+        """Mueve el origen hacia atrás (rellenando los arrays) si `momento` es anterior."""
+        if self.origen is None:
+            self.origen = momento
+        elif momento < self.origen:
+            faltan = math.ceil((self.origen - momento) / self.delta)
+            for recurso, ocupacion in self.ocupacion.items():
+                self.ocupacion[recurso] = np.concatenate([np.zeros(faltan, dtype=np.int32), ocupacion])
+            self._corridas_cache.clear()
+            self.origen -= faltan * self.delta
+
+    def modela(self, estacion):
+        return bool(self.capacidades.get(estacion))
+
+    def capacidad(self, recurso):
+        return 1 if recurso[0] == PAILA else self.capacidades[recurso[0]]
+
+    def ventanas(self, etapas):
+        """[(etapa, desde_h, hasta_h)] relativas a hora_inicial, en orden de ETAPAS."""
+        resultado = []
+        t = 0.0
+        for op in ETAPAS:
+            horas = etapas.get(op)
+            if horas:
+                resultado.append((op, t, t + horas))
+                t += horas
+        return resultado
+
+    def _rangos(self, estacion, etapas, inicio, paila=None):
+        """[(recurso, b0, b1)] buckets que ocupa el programa en cada recurso."""
+        self._asegurar_origen(inicio)
+        base = self._indice(inicio)
+        por_bucket = 3600 / self.delta.total_seconds()
+        ventanas = self.ventanas(etapas)
+        rangos = []
+        if self.modela(estacion):
+            for op, desde, hasta in ventanas:
+                b0 = math.floor(base + desde * por_bucket)
+                b1 = math.ceil(base + hasta * por_bucket)
+                if b1 > b0:
+                    rangos.append(((estacion, op), b0, b1))
+        if paila is not None and ventanas:
+            b0 = math.floor(base)
+            b1 = math.ceil(base + ventanas[-1][2] * por_bucket)
+            if b1 > b0:
+                rangos.append(((PAILA, paila), b0, b1))
+        return rangos
+
+    def _array(self, recurso, largo):
+        actual = self.ocupacion.get(recurso)
+        if actual is None:
+            actual = np.zeros(max(largo, BLOQUE_INICIAL), dtype=np.int32)
+            self.ocupacion[recurso] = actual
+        elif len(actual) < largo:
+            actual = np.concatenate([actual, np.zeros(max(largo - len(actual), len(actual)), dtype=np.int32)])
+            self.ocupacion[recurso] = actual
+        return actual
+
+    def _sumar(self, recurso, b0, b1, cantidad):
+        self._array(recurso, b1)[b0:b1] += cantidad
+        self._corridas_cache.pop(recurso, None)
+
+    def _corridas(self, recurso):
+        """
+        corrida[i] = buckets libres consecutivos desde i (cache por recurso,
+        se descarta al reservar). El último elemento representa "después del
+        array" y es infinito.
+        """
+        corrida = self._corridas_cache.get(recurso)
+        if corrida is None:
+            ocupacion = self.ocupacion.get(recurso)
+            n = 0 if ocupacion is None else len(ocupacion)
+            posiciones = np.arange(n + 1)
+            llenos = np.full(n + 1, SIN_LIMITE, dtype=np.int64)
+            if n:
+                llenos[:n] = np.where(ocupacion >= self.capacidad(recurso), posiciones[:n], SIN_LIMITE)
+            siguiente_lleno = np.minimum.accumulate(llenos[::-1])[::-1]
+            corrida = np.where(siguiente_lleno == SIN_LIMITE, SIN_LIMITE, siguiente_lleno - posiciones)
+            self._corridas_cache[recurso] = corrida
+        return corrida
+
+    # 🔹 consultas y reservas
+    def reservar(self, estacion, etapas, inicio, paila=None, cantidad=1):
+        for recurso, b0, b1 in self._rangos(estacion, etapas, inicio, paila):
+            self._sumar(recurso, b0, b1, cantidad)
+
+    def liberar(self, estacion, etapas, inicio, paila=None):
+        self.reservar(estacion, etapas, inicio, paila, cantidad=-1)
+
+    def ocupar_paila(self, paila, inicio, fin):
+        """Bloque de paila que no es un programa con etapas (asignaciones existentes)."""
+        self._asegurar_origen(inicio)
+        b0 = math.floor(self._indice(inicio))
+        b1 = math.ceil(self._indice(fin))
+        if b1 > b0:
+            self._sumar((PAILA, paila), b0, b1, 1)
+
+    def cabe(self, estacion, etapas, inicio, paila=None):
+        for recurso, b0, b1 in self._rangos(estacion, etapas, inicio, paila):
+            ocupacion = self.ocupacion.get(recurso)
+            if ocupacion is not None and (ocupacion[b0:b1] >= self.capacidad(recurso)).any():
+                return False
+        return True
+
+    def primer_inicio(self, estacion, etapas, desde, paila=None):
+        """
+        Primer inicio >= desde (en pasos de un bucket) donde todas las etapas
+        tienen una unidad libre en su estación (y la paila, si se indica).
+        Revisa los candidatos por tramos crecientes: un recurso admite la
+        posición i si la corrida de buckets libres desde i alcanza su largo.
+        """
+        rangos = self._rangos(estacion, etapas, desde, paila)
+        if not rangos:
+            return desde
+        corridas = [(self._corridas(recurso), b0, b1 - b0) for recurso, b0, b1 in rangos]
+        if all(corrida[min(b0, len(corrida) - 1)] >= largo for corrida, b0, largo in corridas):
+            return desde
+
+        # más allá del final de cada array todo está libre, así que el
+        # desplazamiento nunca pasa del array más largo
+        desplazamiento = 1
+        ancho = TRAMO_BUSQUEDA
+        while True:
+            valido = np.ones(ancho, dtype=bool)
+            for corrida, b0, largo in corridas:
+                tramo = corrida[b0 + desplazamiento:b0 + desplazamiento + ancho]
+                valido[:len(tramo)] &= tramo >= largo
+            if valido.any():
+                return desde + (desplazamiento + int(np.argmax(valido))) * self.delta
+            desplazamiento += ancho
+            ancho *= 2
+
+    def sobrecargas(self):
+        """{(estacion, etapa): [(inicio, fin, ocupacion máxima, capacidad)]} donde ocupación > capacidad."""
+        resultado = {}
+        for recurso, ocupacion in self.ocupacion.items():
+            if recurso[0] == PAILA:
+                continue  # los solapes de paila se reportan con /conflictos/ (tiempos exactos)
+            capacidad = self.capacidad(recurso)
+            exceso = ocupacion > capacidad
+            if not exceso.any():
+                continue
+            bordes = np.flatnonzero(np.diff(np.concatenate([[0], exceso.astype(np.int8), [0]])))
+            resultado[recurso] = [
+                (
+                    self.origen + int(b0) * self.delta,
+                    self.origen + int(b1) * self.delta,
+                    int(ocupacion[b0:b1].max()),
+                    capacidad,
+                )
+                for b0, b1 in zip(bordes[::2], bordes[1::2])
+            ]
+        return resultado
+
+
+def cargar_capacidades():
+    """estacion -> cantidad de equipos."""
+    return Counter(
+        estacion for estacion in Equipo.objects.values_list("estacion", flat=True) if estacion
+    )
+
+
+def etapas_de(fila):
+    return {op: fila[op] for op in ETAPAS}
+
+
+def cargar_calendario(origen=None, excluir_programas=(), minutos=None):
+    """
+    Calendario con los programas ya programados (estación + hora_inicial +
+    horas por etapa). Con `origen` se ignoran los que terminaron antes.
+    """
+    capacidades = cargar_capacidades()
+    programas = ProgramaProduccion.objects.filter(
+        estacion__in=list(capacidades), hora_inicial__isnull=False
+    ).exclude(pk__in=list(excluir_programas))
+    if origen is not None:
+        programas = programas.filter(hora_final__gt=origen)
+
+    calendario = CalendarioRecursos(origen, capacidades, minutos)
+    for fila in programas.order_by("hora_inicial").values("estacion", "hora_inicial", *ETAPAS):
+        calendario.reservar(fila["estacion"], etapas_de(fila), fila["hora_inicial"])
+    return calendario
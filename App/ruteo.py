@@ -0,0 +1,113 @@
+# ruteo.py
+"""
+Modelo de ruteo en memoria: horas por unidad de cada etapa, por fert.
+
+Con el primer Throughput del fert (como .filter(fert=...).first()) y su Ruta,
+cada fert queda como una fila de la matriz `horas_unidad` (una columna por
+etapa, NaN si la etapa está en False en la ruta o no tiene capacidad). Las
+duraciones se obtienen sin consultas: horas = cantidad * horas_unidad. Se
+reconstruye cuando cambia Throughput o Ruta (ver signals.py).
+"""
+import math
+
+import numpy as np
+
+from .models import Throughput
+from .versiones import IndiceVersionado
+
+VERSION = "ruteo"
+
+ETAPAS = ["empastado", "molino", "emulsion", "completado", "matizado", "envasado"]
+
+
+class ModeloRuteo:
+    def __init__(self, ferts, horas_unidad):
+        self.posicion = {fert_id: i for i, fert_id in enumerate(ferts)}  # fert -> fila
+        self.horas_unidad = horas_unidad  # matriz (ferts x etapas), NaN = etapa no aplica
+        self._por_fert = {
+            fert_id: tuple(None if math.isnan(h) else h for h in fila.tolist())
+            for fert_id, fila in zip(ferts, horas_unidad)
+        }
+        self._total_unidad = {
+            fert_id: sum(h for h in fila if h) for fert_id, fila in self._por_fert.items()
+        }
+
+    @classmethod
+    def construir(cls):
+        ferts = []
+        filas = []
+        vistos = set()
+        campos = [*ETAPAS, *[f"ruta__{op}" for op in ETAPAS]]
+        for fert_id, ruta_id, *valores in (
+            Throughput.objects.order_by("primario").values_list("fert_id", "ruta_id", *campos)
+        ):
+            if fert_id in vistos:
+                continue
+            vistos.add(fert_id)
+            if ruta_id is None:
+                continue  # el primer throughput sin ruta deja al fert sin duraciones
+            capacidades, activas = valores[:len(ETAPAS)], valores[len(ETAPAS):]
+            filas.append([
+                1 / capacidad if activa and capacidad and capacidad > 0 else np.nan
+                for capacidad, activa in zip(capacidades, activas)
+            ])
+            ferts.append(fert_id)
+
+        horas_unidad = np.array(filas, dtype=float).reshape(len(filas), len(ETAPAS))
+        return cls(ferts, horas_unidad)
+
+    def tiene_ruta(self, fert_id):
+        return fert_id in self._por_fert
+
+    def horas_por_unidad(self, fert_id):
+        """{etapa: horas por unidad o None}, o None si el fert no tiene ruta."""
+        fila = self._por_fert.get(fert_id)
+        return dict(zip(ETAPAS, fila)) if fila is not None else None
+
+    def total_por_unidad(self, fert_id):
+        return self._total_unidad.get(fert_id, 0)
+
+    def horas_etapas(self, fert_id, cantidad):
+        """
+        ({etapa: horas o None}, total) para producir `cantidad` del fert,
+        o None si el fert no tiene ruta.
+        """
+        fila = self._por_fert.get(fert_id)
+        if fila is None:
+            return None
+        etapas = {op: cantidad * h if h else None for op, h in zip(ETAPAS, fila)}
+        return etapas, sum(h for h in etapas.values() if h)
+
+    def duracion(self, fert_id, cantidad):
+        """Horas totales para `cantidad` del fert (0 si no tiene ruta)."""
+        return cantidad * self._total_unidad.get(fert_id, 0)
+
+    def filas(self, fert_ids):
+        """Índices de fila para un array de ferts (-1 si el fert no tiene ruta)."""
+        return np.array([self.posicion.get(f, -1) for f in fert_ids], dtype=np.intp)
+
+
+
+
+def cantidad_programa(lote_f, produccion=None, paila_id=None):
+    """
+    Cantidad sobre la que se calculan las duraciones de un programa (planificar,
+    calcular_operaciones, set_hora_inicial, cascada, simulación): con paila,
+    lo que entra en ella (`produccion`, que tras fragmentar es menor que
+    lote_f); sin paila o sin producción, el lote completo.
+    """
+    if paila_id and produccion:
+        return produccion
+    return lote_f or 0
+
+_modelo = IndiceVersionado(VERSION, ModeloRuteo.construir)
+
+
+def obtener_modelo_ruteo():
+    """Modelo del proceso, reconstruido si la versión cambió."""
+    return _modelo.obtener()
+
+
+def invalidar_ruteo(**kwargs):
+    """Receiver de señales: la versión cambia al confirmar la transacción."""
+    _modelo.invalidar()
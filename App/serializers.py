@@ -1,7 +1,8 @@
 # serializers.py
 from rest_framework import serializers
-from .models import ProgramaProduccion, ExcelExtra, Producto
+from .models import ProgramaProduccion, ExcelExtra, Producto, TrabajoImportacion
 from datetime import timedelta
+from django.utils import timezone
 
 class ProgramaProduccionSerializer(serializers.ModelSerializer):
     paila_id = serializers.CharField(source="paila.paila", default=None)
@@ -15,17 +16,63 @@ class ProgramaProduccionSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
     def get_children(self, obj):
+        # 🔹 si la vista ya armó el árbol en memoria (context["hijos"]) no se consulta la BD
+        hijos = self.context.get("hijos")
+        if hijos is None:
+            children = obj.children.all().order_by("id")
+        else:
+            children = hijos.get(obj.id, [])
         return ProgramaProduccionSerializer(
-            obj.children.all().order_by("id"), many=True
+            children, many=True, context=self.context
         ).data
 
     def get_produccion(self, obj):
         # Solo devolver producción si hay paila asignada
-        if obj.paila:
+        if obj.paila_id:
             return obj.produccion
         return None
-    
+
+
+class ProgramaPlanoSerializer(ProgramaProduccionSerializer):
+    """Sin hijos anidados: para respuestas delta, el árbol se arma con `parent`."""
+    children = None
+
+
 class ExcelExtraSerializer(serializers.ModelSerializer):
     class Meta:
         model = ExcelExtra
         fields = "__all__"
+
+
+class TrabajoImportacionSerializer(serializers.ModelSerializer):
+    filas_por_segundo = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TrabajoImportacion
+        exclude = ["archivo", "parametros"]
+
+    def get_filas_por_segundo(self, obj):
+        # throughput = filas procesadas / tiempo transcurrido desde el inicio
+        if not obj.iniciado:
+            return None
+        segundos = ((obj.finalizado or timezone.now()) - obj.iniciado).total_seconds()
+        if segundos <= 0:
+            return None
+        return round(obj.filas_procesadas / segundos, 1)
+
+
+def serializar_arbol(programas):
+    """
+    Serializa una lista plana de programas (ordenada por id) como árbol
+    padre/hijos, armando las relaciones en memoria: sin consultas por nodo.
+    """
+    ids = {p.id for p in programas}
+    hijos = {}
+    raices = []
+    for programa in programas:
+        if programa.parent_id in ids:
+            hijos.setdefault(programa.parent_id, []).append(programa)
+        else:
+            raices.append(programa)
+
+    return ProgramaProduccionSerializer(raices, many=True, context={"hijos": hijos}).data
@@ -0,0 +1,50 @@
+# signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .compatibilidad import invalidar_indice
+from .cambios import registrar_cambios, PROGRAMA, ASIGNACION
+from .kpis import invalidar_plan
+from .models import (
+    Matrix, DetalleProducto, InventarioPaila, PailaAsignacion, Throughput, Ruta, ProgramaProduccion, ExcelExtra,
+)
+from .ruteo import invalidar_ruteo
+
+
+# 🔹 el índice de compatibilidad depende de Matrix, DetalleProducto e InventarioPaila
+@receiver([post_save, post_delete], sender=Matrix)
+@receiver([post_save, post_delete], sender=DetalleProducto)
+@receiver([post_save, post_delete], sender=InventarioPaila)
+def invalidar_compatibilidad(sender, **kwargs):
+    invalidar_indice()
+
+
+# 🔹 el modelo de ruteo (horas por unidad) depende de Throughput y Ruta
+@receiver([post_save, post_delete], sender=Throughput)
+@receiver([post_save, post_delete], sender=Ruta)
+def invalidar_modelo_ruteo(sender, **kwargs):
+    invalidar_ruteo()
+
+
+# 🔹 la versión del plan (ETag de las lecturas y cache de /kpis/) cambia con
+# cualquier programa, asignación o extra, con lo que define pailas-validas y
+# con el ruteo (horas por etapa del listado y la exportación);
+# programas y asignaciones además quedan en la bitácora de /cambios/
+@receiver([post_save, post_delete], sender=ProgramaProduccion)
+def registrar_programa(sender, instance, **kwargs):
+    registrar_cambios(PROGRAMA, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=PailaAsignacion)
+def registrar_asignacion(sender, instance, **kwargs):
+    registrar_cambios(ASIGNACION, [instance.pk])
+
+
+@receiver([post_save, post_delete], sender=ExcelExtra)
+@receiver([post_save, post_delete], sender=Matrix)
+@receiver([post_save, post_delete], sender=DetalleProducto)
+@receiver([post_save, post_delete], sender=InventarioPaila)
+@receiver([post_save, post_delete], sender=Ruta)
+@receiver([post_save, post_delete], sender=Throughput)
+def invalidar_version_plan(sender, **kwargs):
+    invalidar_plan()
@@ -0,0 +1,243 @@
+# simulacion.py
+"""
+Simulación de eventos discretos del plan actual.
+
+Cada programa planificado (paila + horas) recorre sus etapas en orden de
+ETAPAS con las horas del modelo de ruteo (cantidad * horas por unidad). La
+paila se ocupa desde que empieza la primera etapa hasta que termina la
+última; cada etapa toma además una unidad de (estacion, etapa), con tantas
+unidades como equipos tenga la estación (como en recursos.py; sin equipos no
+hay cola). Las colas son FIFO por hora de llegada. Los bloques fijos de
+paila (asignaciones sin programa) se respetan al arrancar con la duración
+sin esperas; si las esperas de equipos estiran el uso real de la paila sobre
+un bloque fijo, el programa se informa en choques_bloques_fijos.
+
+Todo lo que no depende del orden de los eventos (duraciones, tiempos en
+horas, agregados de KPIs) se calcula con numpy; el bucle de eventos solo
+mueve índices y floats con heapq.
+"""
+import heapq
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+from .models import ProgramaProduccion, PailaAsignacion
+from .operaciones import horas_por_etapa
+from .planificador import Agenda
+from .recursos import cargar_capacidades
+from .ruteo import ETAPAS, obtener_modelo_ruteo, cantidad_programa
+
+DETALLE_ATRASOS = 50  # programas atrasados devueltos por defecto
+
+
+def _hora(valor, origen):
+    return (valor - origen).total_seconds() / 3600
+
+
+def _horas(valores, origen):
+    """Datetimes -> array de horas desde `origen`."""
+    return np.array([_hora(v, origen) for v in valores], dtype=float)
+
+
+def _resumen(valores):
+    if not len(valores):
+        return {"total": 0.0, "promedio": 0.0, "p95": 0.0, "maximo": 0.0}
+    return {
+        "total": round(float(valores.sum()), 4),
+        "promedio": round(float(valores.mean()), 4),
+        "p95": round(float(np.percentile(valores, 95)), 4),
+        "maximo": round(float(valores.max()), 4),
+    }
+
+
+def cargar_plan():
+    """Programas planificados (orden por hora_inicial) y bloques fijos por paila."""
+    programas = list(
+        ProgramaProduccion.objects.filter(
+            paila__isnull=False, hora_inicial__isnull=False, hora_final__isnull=False
+        )
+        .order_by("hora_inicial", "id")
+        .values_list("id", "orden", "fert_id", "lote_f", "produccion", "paila_id", "estacion", "hora_inicial", "hora_final")
+    )
+    fijos = list(
+        PailaAsignacion.objects.filter(programa__isnull=True, inicio__isnull=False, fin__isnull=False)
+        .order_by("inicio")
+        .values_list("paila_id", "inicio", "fin")
+    )
+    return programas, fijos
+
+
+def simular(tolerancia_horas=0.0, detalle=DETALLE_ATRASOS):
+    """
+    Simula el plan y devuelve los KPIs: makespan, utilización por paila y por
+    estación, esperas en cola y programas que terminan después de su
+    hora_final planificada (más `tolerancia_horas`) y los que pisan un bloque
+    fijo por esperas de equipos. None si no hay plan.
+    """
+    t0 = time.perf_counter()
+    programas, fijos = cargar_plan()
+    if not programas:
+        return None
+
+    ids, ordenes, ferts, lotes, producciones, pailas, estaciones, inicios, finales = zip(*programas)
+    origen = inicios[0]
+    liberacion = _horas(inicios, origen)
+    fin_plan = _horas(finales, origen)
+    n = len(ids)
+
+    # 🔹 horas por etapa de todo el plan de una vez; sin ruta queda un solo tramo con la duración planificada
+    modelo = obtener_modelo_ruteo()
+    cantidades = np.array(
+        [cantidad_programa(l, p, paila) for l, p, paila in zip(lotes, producciones, pailas)], dtype=float
+    )
+    horas, totales = horas_por_etapa(cantidades, modelo.filas(ferts), modelo)
+    horas = np.nan_to_num(horas)
+    sin_ruta = totales <= 0
+    totales = np.where(sin_ruta, np.maximum(fin_plan - liberacion, 0.0), totales)
+
+    capacidades = cargar_capacidades()
+    unidades = {}  # (estacion, etapa) -> heap con la hora en que se libera cada equipo
+    recursos = []  # por programa: [(etapa, recurso o None, horas)]
+    for j in range(n):
+        if sin_ruta[j]:
+            recursos.append([(None, None, float(totales[j]))])
+            continue
+        estacion = estaciones[j]
+        modelada = bool(capacidades.get(estacion))
+        tramos = []
+        for k, op in enumerate(ETAPAS):
+            duracion = horas[j, k]
+            if duracion > 0:
+                recurso = (estacion, op) if modelada else None
+                if recurso is not None and recurso not in unidades:
+                    unidades[recurso] = [0.0] * capacidades[estacion]  # libres desde el origen
+                tramos.append((op, recurso, float(duracion)))
+        recursos.append(tramos)
+
+    agendas = defaultdict(Agenda)
+    for paila_id, inicio, fin in fijos:
+        if fin > origen:
+            agendas[paila_id].reservar(max(_hora(inicio, origen), 0.0), _hora(fin, origen))
+
+    colas = defaultdict(deque)  # paila -> programas en orden de hora_inicial
+    for j, paila_id in enumerate(pailas):
+        colas[paila_id].append(j)
+
+    inicio_sim = np.zeros(n)
+    fin_sim = np.zeros(n)
+    espera_cola = np.zeros(n)  # horas esperando equipos entre etapas
+    ocupado_recurso = defaultdict(float)
+    esperas_recurso = defaultdict(float)
+    choques = []  # programas cuyo uso real de la paila pisa un bloque fijo
+    eventos = []  # (hora, secuencia, programa, etapa)
+    secuencia = 0
+
+    def _arrancar(j, desde):
+        nonlocal secuencia
+        hora = agendas[pailas[j]].primer_hueco(max(liberacion[j], desde), totales[j])
+        inicio_sim[j] = hora
+        heapq.heappush(eventos, (hora, secuencia, j, 0))
+        secuencia += 1
+
+    for cola in colas.values():
+        _arrancar(cola.popleft(), 0.0)
+
+    # 🔹 bucle de eventos: programa j listo para su etapa k a la hora t
+    while eventos:
+        t, _, j, k = heapq.heappop(eventos)
+        _, recurso, duracion = recursos[j][k]
+        comienzo = t
+        if recurso is not None:
+            equipos = unidades[recurso]
+            comienzo = max(t, heapq.heappop(equipos))
+            heapq.heappush(equipos, comienzo + duracion)
+            espera = comienzo - t
+            espera_cola[j] += espera
+            ocupado_recurso[recurso] += duracion
+            esperas_recurso[recurso] += espera
+        fin = comienzo + duracion
+        if k + 1 < len(recursos[j]):
+            heapq.heappush(eventos, (fin, secuencia, j, k + 1))
+            secuencia += 1
+            continue
+        fin_sim[j] = fin
+        # 🔹 el bloque fijo se compara con el uso real (con esperas), no con la duración planificada
+        if agendas[pailas[j]].primer_hueco(inicio_sim[j], fin - inicio_sim[j]) != inicio_sim[j]:
+            choques.append(j)
+        cola = colas[pailas[j]]
+        if cola:
+            _arrancar(cola.popleft(), fin)
+
+    # 🔹 KPIs
+    makespan = float(fin_sim.max())
+    horizonte = max(makespan, 1e-9)
+    espera_paila = inicio_sim - liberacion
+
+    lista_pailas = sorted(colas)
+    posicion = {p: i for i, p in enumerate(lista_pailas)}
+    indice_paila = np.array([posicion[p] for p in pailas], dtype=np.intp)
+    ocupado_paila = np.bincount(indice_paila, weights=fin_sim - inicio_sim, minlength=len(lista_pailas))
+    programas_paila = np.bincount(indice_paila, minlength=len(lista_pailas))
+
+    atraso = fin_sim - fin_plan
+    atrasados = np.flatnonzero(atraso > tolerancia_horas)
+    atrasados = atrasados[np.argsort(-atraso[atrasados], kind="stable")]
+
+    return {
+        "programas": n,
+        "inicio": origen,
+        "makespan_horas": round(makespan, 4),
+        "makespan_plan_horas": round(float(fin_plan.max()), 4),
+        "utilizacion_pailas": [
+            {
+                "paila": paila_id,
+                "programas": int(programas_paila[i]),
+                "horas_ocupada": round(float(ocupado_paila[i]), 4),
+                "utilizacion": round(float(ocupado_paila[i]) / horizonte, 4),
+            }
+            for i, paila_id in enumerate(lista_pailas)
+        ],
+        "utilizacion_estaciones": [
+            {
+                "estacion": estacion,
+                "etapa": etapa,
+                "equipos": capacidades[estacion],
+                "horas_ocupada": round(ocupado, 4),
+                "utilizacion": round(ocupado / (capacidades[estacion] * horizonte), 4),
+                "espera_horas": round(float(esperas_recurso[(estacion, etapa)]), 4),
+            }
+            for (estacion, etapa), ocupado in sorted(ocupado_recurso.items())
+        ],
+        "esperas": {
+            "paila": _resumen(espera_paila),
+            "equipos": _resumen(espera_cola),
+        },
+        "atrasados": {
+            "total": int(len(atrasados)),
+            "atraso_total_horas": round(float(atraso[atrasados].sum()), 4),
+            "detalle": [
+                {
+                    "id": ids[j],
+                    "orden": ordenes[j],
+                    "paila": pailas[j],
+                    "hora_final_plan": finales[j],
+                    "atraso_horas": round(float(atraso[j]), 4),
+                }
+                for j in atrasados[:detalle]
+            ],
+        },
+        "choques_bloques_fijos": {
+            "total": len(choques),
+            "detalle": [
+                {
+                    "id": ids[j],
+                    "orden": ordenes[j],
+                    "paila": pailas[j],
+                    "espera_equipos_horas": round(float(espera_cola[j]), 4),
+                }
+                for j in choques[:detalle]
+            ],
+        },
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
@@ -0,0 +1,134 @@
+# sintetico.py
+"""
+Generador de una planta sintética para pruebas de carga y benchmarks.
+
+Crea colores, productos (fert) con su detalle y throughput, rutas, equipos
+por estación, pailas con sus filas de Matrix (cuatro colores por paila) y
+órdenes de producción sin asignar, todo con bulk_create y una semilla fija
+(mismos datos en cada corrida). Las claves llevan un prefijo y los primarios
+enteros arrancan después de los existentes, así se puede generar sobre una
+base con datos.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import Max
+
+from .compatibilidad import invalidar_indice
+from .cambios import reiniciar_cambios
+from .models import (
+    Color, Producto, DetalleProducto, Ruta, Throughput, InventarioPaila, Equipo, Matrix, ProgramaProduccion,
+)
+from .ruteo import ETAPAS, invalidar_ruteo
+
+# escala -> (órdenes, pailas)
+ESCALAS = {
+    "chica": (1_000, 50),
+    "mediana": (10_000, 500),
+    "grande": (100_000, 500),
+}
+
+CAPACIDADES = [2000, 4000, 8000]  # capacidad_planificable de paila/matrix
+BASES_DISPERSION = [100, 300, 800]
+LOTES = [500, 1500, 3000, 6000, 12000]  # los mayores obligan a fragmentar
+COLORES_POR_PAILA = 4
+TAMANO_LOTE = 5000
+
+
+def _siguiente_primario(modelo):
+    return (modelo.objects.aggregate(maximo=Max("primario"))["maximo"] or 0) + 1
+
+
+def generar_planta(ordenes=1_000, pailas=50, ferts=None, colores=10, estaciones=5,
+                   equipos_por_estacion=3, semilla=0, prefijo="SIN"):
+    """
+    Genera la planta y devuelve cuántas filas se crearon por modelo.
+    Por defecto hay un fert cada 25 órdenes (mínimo 20).
+    """
+    rnd = random.Random(semilla)
+    ferts = ferts or max(ordenes // 25, 20)
+    colores = max(min(colores, pailas * COLORES_POR_PAILA), 1)
+
+    codigos_color = [f"{prefijo}-C{i}" for i in range(colores)]
+    codigos_fert = [f"{prefijo}-F{i}" for i in range(ferts)]
+    codigos_paila = [f"{prefijo}-P{i}" for i in range(pailas)]
+    nombres_estacion = [f"{prefijo}-E{i}" for i in range(estaciones)]
+    codigos_ruta = [f"{prefijo}-R{i}" for i in range(4)]
+
+    with transaction.atomic():
+        Color.objects.bulk_create([Color(codigo=c, descripcion=f"Color {c}") for c in codigos_color])
+        Producto.objects.bulk_create([Producto(codigo=f, descripcion=f"Producto {f}") for f in codigos_fert])
+
+        primario = _siguiente_primario(DetalleProducto)
+        DetalleProducto.objects.bulk_create([
+            DetalleProducto(primario=primario + i, fert_id=f, descripcion=f"Detalle {f}", color_id=codigos_color[i % colores])
+            for i, f in enumerate(codigos_fert)
+        ])
+
+        # 🔹 rutas: empastado, completado y envasado siempre; el resto alterna
+        Ruta.objects.bulk_create([
+            Ruta(
+                Tipo="sintetica", proceso=codigo, empastado=True, molino=bool(i % 2), emulsion=i % 3 == 0,
+                completado=True, matizado=i % 2 == 0, calidad=False, envasado=True,
+            )
+            for i, codigo in enumerate(codigos_ruta)
+        ])
+        primario = _siguiente_primario(Throughput)
+        Throughput.objects.bulk_create([
+            Throughput(
+                primario=primario + i, linea="L1", fert_id=f, descripcion=f"Throughput {f}",
+                ruta_id=codigos_ruta[i % len(codigos_ruta)],
+                **{op: rnd.uniform(800, 5000) for op in ETAPAS},  # unidades por hora
+            )
+            for i, f in enumerate(codigos_fert)
+        ])
+
+        equipos = [
+            Equipo(equipo=f"{estacion}-EQ{k}", estacion=estacion)
+            for estacion in nombres_estacion
+            for k in range(equipos_por_estacion)
+        ]
+        Equipo.objects.bulk_create(equipos)
+
+        InventarioPaila.objects.bulk_create([
+            InventarioPaila(paila=p, numero=i, tipo="sintetica", capacidad_planificable=rnd.choice(CAPACIDADES))
+            for i, p in enumerate(codigos_paila)
+        ])
+
+        # 🔹 cada paila pertenece a una estación y admite algunos colores
+        primario = _siguiente_primario(Matrix)
+        filas = []
+        for i, paila in enumerate(codigos_paila):
+            estacion = nombres_estacion[i % estaciones]
+            equipo = equipos[(i % estaciones) * equipos_por_estacion]
+            for color in rnd.sample(codigos_color, min(COLORES_POR_PAILA, colores)):
+                filas.append(Matrix(
+                    primario=primario + len(filas), paila_id=paila, equipo=equipo, numero=i,
+                    capacidad_planificable=rnd.choice(CAPACIDADES),
+                    base_dispersion_minimo=rnd.choice(BASES_DISPERSION),
+                    diamsi="SI", estacion=estacion, color_id=color,
+                ))
+        Matrix.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+
+        ProgramaProduccion.objects.bulk_create(
+            [
+                ProgramaProduccion(orden=f"{prefijo}-O{i}", fert_id=rnd.choice(codigos_fert), lote_f=rnd.choice(LOTES))
+                for i in range(ordenes)
+            ],
+            batch_size=TAMANO_LOTE,
+        )
+
+    # bulk_create no dispara señales
+    invalidar_indice()
+    invalidar_ruteo()
+    reiniciar_cambios()
+
+    return {
+        "colores": colores,
+        "productos": ferts,
+        "rutas": len(codigos_ruta),
+        "equipos": len(equipos),
+        "pailas": pailas,
+        "matrix": len(filas),
+        "programas": ordenes,
+    }
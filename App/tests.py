@@ -1,3 +1,891 @@
-from django.test import TestCase
+"""
+Benchmarks de los endpoints de App/urls.py sobre una planta sintética.
 
-# Create your tests here.
+    python manage.py test App --settings=backend.settings_bench
+
+Cada endpoint se mide con tiempo de reloj y cantidad de consultas SQL; la
+cantidad de consultas tiene un techo que no depende del tamaño del plan (o
+crece solo con la cantidad de lotes de escritura), así un N+1 que vuelva a
+aparecer rompe el test en cualquier escala. Escala: BENCH_ORDENES y
+BENCH_PAILAS (por defecto 1000 órdenes y 50 pailas). Al final la tabla de
+tiempos sale por el logger App.tests (nivel INFO).
+
+Las demás clases prueban comportamiento sobre plantas chicas: importación,
+trabajos, planificación, fragmentos, cascada, simulación, optimizador y
+solapamientos.
+"""
+import io
+import json
+import logging
+import math
+import os
+import time
+import warnings
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Max
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .cambios import reiniciar_cambios
+from .asignaciones import sincronizacion_diferida
+from .cascada import reprogramar_en_cascada
+from .models import (
+    ProgramaProduccion, PailaAsignacion, InventarioPaila, TrabajoImportacion, CambioPlan, Ruta, Throughput, Equipo,
+    ExcelExtra, Producto, Color, DetalleProducto, Matrix,
+)
+from .operaciones import calcular_operaciones_plan
+from .optimizador import aplicar_asignaciones, optimizar
+from .simulacion import simular
+from .planificador import planificar, fragmentar_programa, repartir_lote
+from .ruteo import ETAPAS, cantidad_programa, obtener_modelo_ruteo
+from .importacion import importar_asignaciones_por_lotes, importar_programas_por_lotes, preparar_lote
+from .intervalos import IndiceIntervalos
+from .sintetico import generar_planta
+from .trabajos import ejecutar_trabajo
+from .versiones import IndiceVersionado, obtener_version_plan
+from .views import hay_solapamiento
+
+logger = logging.getLogger(__name__)
+
+ORDENES = int(os.environ.get("BENCH_ORDENES", 1000))
+PAILAS = int(os.environ.get("BENCH_PAILAS", 50))
+INICIO = timezone.make_aware(datetime(2025, 1, 6, 6))
+
+CONSULTAS_POR_EDICION = 40  # asignar-paila, fragmentar, set-hora-inicial (no dependen del plan)
+
+
+def lotes(filas, por_lote):
+    """
+    Consultas de escritura en bloque que se permiten para `filas` filas. En
+    SQLite cada sentencia lleva a lo sumo 999 parámetros, así que `por_lote`
+    va de decenas a cientos de filas según las columnas escritas.
+    """
+    return math.ceil(filas / por_lote)
+
+
+class ContadorConsultas:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class BenchmarkEndpoints(TestCase):
+    resultados = []
+
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=ORDENES, pailas=PAILAS, semilla=0)
+        planificar(INICIO)
+        cls.programas = ProgramaProduccion.objects.count()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        ancho = max(len(r[0]) for r in cls.resultados) if cls.resultados else 0
+        lineas = [f"Benchmark ({ORDENES} órdenes, {PAILAS} pailas)"]
+        for nombre, segundos, consultas, techo in sorted(cls.resultados):
+            lineas.append(f"  {nombre:<{ancho}}  {segundos * 1000:9.1f} ms  {consultas:6d} consultas (máx {techo})")
+        logger.info("\n".join(lineas))
+
+    def setUp(self):
+        self.client = APIClient()
+        # los índices en memoria sobreviven al rollback entre tests
+        IndiceVersionado.descartar_todos()
+        # la versión del plan vuelve atrás con el rollback; los kpis en cache no
+        cache.clear()
+
+    @contextmanager
+    def medir(self, nombre, maximo_consultas):
+        contador = ContadorConsultas()
+        t0 = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            yield
+        segundos = time.perf_counter() - t0
+        self.resultados.append((nombre, segundos, contador.total, maximo_consultas))
+        self.assertLessEqual(
+            contador.total, maximo_consultas, f"{nombre}: {contador.total} consultas (máximo {maximo_consultas})"
+        )
+
+    def pedir(self, nombre, maximo_consultas, metodo, url, status=200, **kwargs):
+        with self.medir(nombre, maximo_consultas):
+            respuesta = getattr(self.client, metodo)(url, **kwargs)
+            if hasattr(respuesta, "streaming_content"):
+                b"".join(respuesta.streaming_content)
+        self.assertEqual(respuesta.status_code, status, getattr(respuesta, "data", None))
+        return respuesta
+
+    # 🔹 lectura
+    def test_listar_programa(self):
+        self.pedir("programa-produccion (completo)", 3, "get", "/api/programa-produccion/")
+        respuesta = self.pedir("programa-produccion (página)", 9, "get", "/api/programa-produccion/?limit=200")
+        self.pedir(
+            "programa-produccion (cursor)", 9, "get",
+            f"/api/programa-produccion/?limit=200&cursor={respuesta.data['next_cursor']}",
+        )
+        self.pedir("programa-produccion (filtro)", 9, "get", "/api/programa-produccion/?estacion=SIN-E0&limit=200")
+
+    def test_hay_datos(self):
+        self.pedir("hay-datos", 3, "get", "/api/hay-datos/")
+
+    def test_exportar(self):
+        self.pedir("exportar-excel (xlsx)", 4 + 2 * lotes(self.programas, 2000), "get", "/api/exportar-excel/")
+        self.pedir("exportar-excel (csv)", 4 + 2 * lotes(self.programas, 2000), "get", "/api/exportar-excel/?formato=csv")
+
+    def test_pailas_validas(self):
+        programa = ProgramaProduccion.objects.order_by("id").first()
+        self.pedir("pailas-validas/<id>", 5, "get", f"/api/pailas-validas/{programa.id}/")
+        self.pedir("pailas-validas (lote)", 5, "post", "/api/pailas-validas/", data={"programas": "sin_asignar"}, format="json")
+        ids = list(ProgramaProduccion.objects.values_list("id", flat=True)[:500])
+        self.pedir("pailas-validas (ids)", 5, "post", "/api/pailas-validas/", data={"programas": ids}, format="json")
+
+    def test_conflictos(self):
+        respuesta = self.pedir("conflictos", 2, "get", "/api/conflictos/")
+        self.assertEqual(respuesta.data["total"], 0)
+        self.pedir("conflictos-recursos", 3, "get", "/api/conflictos-recursos/")
+
+    def test_kpis(self):
+        self.pedir("kpis", 5, "get", "/api/kpis/")
+        respuesta = self.pedir("kpis (cache)", 1, "get", "/api/kpis/")
+        self.assertTrue(respuesta.data["cacheado"])
+
+    def test_etag(self):
+        respuesta = self.pedir("programa-produccion (etag)", 9, "get", "/api/programa-produccion/?limit=200")
+        etag = respuesta["ETag"]
+        self.pedir("programa-produccion (304)", 1, "get", "/api/programa-produccion/?limit=200",
+                   status=304, HTTP_IF_NONE_MATCH=etag)
+        cuerpo = {"programas": "sin_asignar"}
+        etag_lote = self.pedir("pailas-validas (etag)", 5, "post", "/api/pailas-validas/", data=cuerpo, format="json")["ETag"]
+        self.pedir("pailas-validas (304)", 1, "post", "/api/pailas-validas/", data=cuerpo, format="json",
+                   status=304, HTTP_IF_NONE_MATCH=etag_lote)
+        # otro body, otra respuesta
+        self.pedir("pailas-validas (otro body)", 5, "post", "/api/pailas-validas/", data={"programas": []},
+                   format="json", HTTP_IF_NONE_MATCH=etag_lote)
+
+        # cualquier escritura confirmada cambia la versión
+        programa = ProgramaProduccion.objects.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            programa.save()
+        self.pedir("programa-produccion (cambió)", 9, "get", "/api/programa-produccion/?limit=200",
+                   HTTP_IF_NONE_MATCH=etag)
+
+    def test_etag_ruteo(self):
+        # las horas por etapa dependen de Ruta/Throughput: cambiarlos invalida el ETag
+        etag = self.client.get("/api/hay-datos/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Ruta.objects.order_by("proceso").first().save()
+        self.assertEqual(self.client.get("/api/hay-datos/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cambios(self):
+        version = self.pedir("cambios (sin desde)", 2, "get", "/api/programa-produccion/cambios/").data["version"]
+        vacio = self.pedir("cambios (sin cambios)", 3, "get", f"/api/programa-produccion/cambios/?desde={version}")
+        self.assertEqual(vacio.data["programas"], [])
+
+        # asignar_paila reescribe el fragmento: el delta trae solo ese árbol
+        programa = ProgramaProduccion.objects.filter(parent__isnull=True).order_by("-lote_f", "id").first()
+        antes = set(ProgramaProduccion.objects.values_list("id", flat=True))
+        paila = programa.paila_id or InventarioPaila.objects.order_by("paila").values_list("paila", flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f"/api/asignar-paila/{programa.id}/", data={"paila": paila}, format="json")
+        respuesta = self.pedir("cambios (tras asignar-paila)", 5, "get", f"/api/programa-produccion/cambios/?desde={version}")
+        datos = respuesta.data
+        self.assertFalse(datos["completo"])
+        self.assertGreater(datos["version"], version)
+        ids = {p["id"] for p in datos["programas"]}
+        self.assertIn(programa.id, ids)
+        self.assertEqual(set(ProgramaProduccion.objects.filter(parent=programa).values_list("id", flat=True)), ids - {programa.id})
+        # los descendientes borrados en cascada también se informan
+        self.assertEqual(set(datos["programas_eliminados"]), antes - set(ProgramaProduccion.objects.values_list("id", flat=True)))
+        self.assertLess(len(ids), 5)
+
+        self.pedir(
+            "cambios (304)", 1, "get", f"/api/programa-produccion/cambios/?desde={version}",
+            status=304, HTTP_IF_NONE_MATCH=respuesta["ETag"],
+        )
+        # una carga masiva obliga a recargar todo
+        with self.captureOnCommitCallbacks(execute=True):
+            reiniciar_cambios()
+        self.assertTrue(self.client.get(f"/api/programa-produccion/cambios/?desde={datos['version']}").data["completo"])
+
+    def test_simular(self):
+        respuesta = self.pedir("simular", 5, "post", "/api/simular/", data={}, format="json")
+        self.assertEqual(respuesta.data["programas"], PailaAsignacion.objects.count())
+
+    def test_estado_importacion(self):
+        trabajo = TrabajoImportacion.objects.create(tipo="programa", archivo="bench.xlsx")
+        self.pedir("import-jobs/<id>", 1, "get", f"/api/import-jobs/{trabajo.id}/")
+
+    @override_settings(RENDIMIENTO_ENDPOINT=True)
+    def test_rendimiento(self):
+        respuesta = self.pedir("hay-datos (medido)", 3, "get", "/api/hay-datos/")
+        self.assertIn("sql;dur=", respuesta["Server-Timing"])
+        respuesta = self.pedir("debug/perf", 0, "get", "/api/debug/perf/")
+        self.assertIn("GET /api/hay-datos/", respuesta.data["rutas"])
+
+    # 🔹 escritura
+    def test_planificar(self):
+        ProgramaProduccion.objects.filter(parent__isnull=False).delete()
+        ProgramaProduccion.objects.update(paila=None, estacion=None, produccion=None, hora_inicial=None, hora_final=None)
+        PailaAsignacion.objects.all().delete()
+        self.pedir("planificar", 20 + lotes(self.programas, 40), "post", "/api/planificar/", data={"inicio": "2025-01-06T06:00:00"}, format="json")
+        respuesta = self.pedir("conflictos (tras planificar)", 2, "get", "/api/conflictos/")
+        self.assertEqual(respuesta.data["total"], 0)
+
+    def test_planificar_recursos(self):
+        ids = list(ProgramaProduccion.objects.filter(parent__isnull=True).values_list("id", flat=True)[:200])
+        self.pedir(
+            "planificar (recursos, 200)", 15 + lotes(len(ids) * 3, 40), "post", "/api/planificar/",
+            data={"inicio": "2025-06-01T06:00:00", "programas": ids, "recursos": True}, format="json",
+        )
+
+    def test_calcular_operaciones(self):
+        self.pedir("calcular-operaciones", 10 + lotes(self.programas, 60), "post", "/api/calcular-operaciones/")
+
+    def test_sincronizar_asignaciones(self):
+        self.pedir("sincronizar-asignaciones (dry_run)", 2, "post", "/api/sincronizar-asignaciones/?dry_run=true")
+        PailaAsignacion.objects.filter(programa__isnull=False).delete()
+        self.pedir(
+            "sincronizar-asignaciones", 6 + lotes(self.programas, 150), "post", "/api/sincronizar-asignaciones/",
+        )
+        self.assertEqual(PailaAsignacion.objects.count(), self.programas)
+
+    def test_optimizar(self):
+        self.pedir(
+            "optimizar (aplicar)", 10 + lotes(self.programas, 80), "post", "/api/optimizar/",
+            data={"iteraciones": 2000, "reinicios": 1, "aplicar": True}, format="json",
+        )
+
+    def test_set_hora_inicial(self):
+        # la hora se manda 5 h antes porque la vista suma 5 h; el último
+        # programa del plan no tiene nada detrás en su paila
+        ultimo = ProgramaProduccion.objects.filter(paila__isnull=False).order_by("-hora_final", "id").first()
+        hora = (ultimo.hora_inicial - timedelta(hours=5)).isoformat()
+        self.pedir(
+            "set-hora-inicial", CONSULTAS_POR_EDICION, "patch", f"/api/set-hora-inicial/{ultimo.id}/",
+            data={"hora_inicial": hora}, format="json",
+        )
+        # el primero del plan se recalcula con todo su lote_f y empuja a los siguientes
+        primero = ProgramaProduccion.objects.filter(paila__isnull=False).order_by("hora_inicial", "id").first()
+        hora = (primero.hora_inicial - timedelta(hours=5)).isoformat()
+        self.pedir(
+            "set-hora-inicial (cascada)", CONSULTAS_POR_EDICION, "patch", f"/api/set-hora-inicial/{primero.id}/",
+            data={"hora_inicial": hora, "cascada": "empujar"}, format="json",
+        )
+
+    def test_asignar_paila(self):
+        programa = ProgramaProduccion.objects.filter(parent__isnull=True).order_by("id").first()
+        paila = programa.paila_id or InventarioPaila.objects.order_by("paila").values_list("paila", flat=True).first()
+        self.pedir("asignar-paila", CONSULTAS_POR_EDICION, "patch", f"/api/asignar-paila/{programa.id}/", data={"paila": paila}, format="json")
+
+    def test_fragmentar(self):
+        programa = ProgramaProduccion.objects.filter(parent__isnull=True).order_by("-lote_f", "id").first()
+        self.pedir("fragmentar/<id>", CONSULTAS_POR_EDICION, "post", f"/api/fragmentar/{programa.id}/", data={"inicio": "2025-06-01T06:00:00"}, format="json")
+
+    def test_importar_excel(self):
+        filas = ORDENES
+        df = pd.DataFrame({
+            "ORDEN": [f"IMP-{i}" for i in range(filas)],
+            "FERT": [f"SIN-F{i % 20}" for i in range(filas)],
+            "LOTE": [1000.0] * filas,
+            "CLIENTE": ["X"] * filas,
+        })
+        archivo = io.BytesIO()
+        df.to_excel(archivo, index=False)
+        archivo.name = "programa.xlsx"
+        archivo.seek(0)
+        self.pedir(
+            "importar-excel", 8 + lotes(filas, 40), "post", "/api/importar-excel/", status=201,
+            data={"file": archivo, "mapping": json.dumps({"orden": "ORDEN", "fert": "FERT", "lote": "LOTE"})},
+            format="multipart",
+        )
+
+    def test_importar_excel_paila_asignacion(self):
+        filas = PAILAS * 2
+        df = pd.DataFrame({
+            "PAILA": [f"SIN-P{i % PAILAS}" for i in range(filas)],
+            "FIN": ["2025-01-07T06:00:00+00:00"] * filas,
+            "ESTADO": ["lavado"] * filas,
+        })
+        archivo = io.BytesIO()
+        df.to_excel(archivo, index=False)
+        archivo.name = "asignaciones.xlsx"
+        archivo.seek(0)
+        self.pedir(
+            "importar-excel-paila-asignacion", 8 + lotes(filas, 40), "post", "/api/importar-excel-paila-asignacion/",
+            status=201,
+            data={
+                "file": archivo, "inicio": "2025-01-06T06:00:00+00:00",
+                "mapping": json.dumps({"paila": "PAILA", "fin": "FIN", "estado": "ESTADO"}),
+            },
+            format="multipart",
+        )
+
+    def test_borrar_programa_y_extras(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pedir("borrar-programa-extras", 10 + lotes(self.programas, 30), "delete", "/api/borrar-programa-extras/")
+        self.assertFalse(ProgramaProduccion.objects.exists())
+        # la bitácora solo guarda el reinicio, no una fila por programa borrado
+        self.assertEqual(list(CambioPlan.objects.values_list("tabla", flat=True)), ["reinicio"])
+
+
+class TrabajosImportacion(TestCase):
+    MAPPING = {"paila": "PAILA", "fin": "FIN", "estado": "ESTADO"}
+
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=20, pailas=2, semilla=0)
+        cls.inicio = timezone.make_aware(datetime(2025, 1, 6, 6))
+        cls.fijo = PailaAsignacion.objects.create(
+            paila_id="SIN-P0", inicio=cls.inicio, fin=cls.inicio + timedelta(hours=4), estado="lavado",
+        )
+
+    def lote(self, filas):
+        return pd.DataFrame({
+            "PAILA": ["SIN-P1"] * filas,
+            "FIN": ["2025-01-07T06:00:00+00:00"] * filas,
+            "ESTADO": ["mantenimiento"] * filas,
+        })
+
+    def test_reemplaza_bloques_al_final(self):
+        resumen = importar_asignaciones_por_lotes([self.lote(2), self.lote(3)], self.MAPPING, self.inicio)
+        self.assertEqual(resumen["importadas"], 5)
+        fijos = PailaAsignacion.objects.filter(programa__isnull=True)
+        self.assertFalse(fijos.filter(pk=self.fijo.pk).exists())
+        self.assertEqual(fijos.count(), 5)
+
+    def test_falla_a_mitad_conserva_bloques_anteriores(self):
+        def lotes():
+            yield self.lote(2)
+            raise ValueError("lote ilegible")
+
+        with self.assertRaises(ValueError):
+            importar_asignaciones_por_lotes(lotes(), self.MAPPING, self.inicio, atomico=False)
+        # el primer lote ya se había confirmado: se deshace y queda el bloque anterior
+        self.assertEqual(
+            list(PailaAsignacion.objects.filter(programa__isnull=True).values_list("pk", flat=True)), [self.fijo.pk],
+        )
+
+    def test_programas_falla_a_mitad_no_deja_lotes(self):
+        mapping = {"orden": "ORDEN", "fert": "FERT", "lote": "LOTE"}
+        antes = ProgramaProduccion.objects.count()
+
+        def lotes():
+            yield pd.DataFrame({"ORDEN": ["A", "B"], "FERT": ["SIN-F1"] * 2, "LOTE": [10, 20], "CLIENTE": ["X", "Y"]})
+            raise ValueError("lote ilegible")
+
+        with self.assertRaises(ValueError):
+            importar_programas_por_lotes(lotes(), mapping, atomico=False)
+        self.assertEqual(ProgramaProduccion.objects.count(), antes)
+        self.assertFalse(ExcelExtra.objects.filter(programa__orden__in=["A", "B"]).exists())
+
+    def test_lote_no_numerico_detiene_la_importacion(self):
+        mapping = {"orden": "ORDEN", "fert": "FERT", "lote": "LOTE"}
+        df = pd.DataFrame({"ORDEN": ["A", "B", "C"], "FERT": ["SIN-F1"] * 3, "LOTE": [" 12 ", None, 1500.0]})
+        filas, _, omitidas = preparar_lote(df, mapping)
+        self.assertEqual(omitidas, 0)
+        self.assertEqual(filas["_lote"].iloc[0], 12.0)
+        self.assertTrue(pd.isna(filas["_lote"].iloc[1]))  # vacío: programa sin lote
+        with self.assertRaises(ValueError):  # como float(lote) en la importación fila a fila
+            preparar_lote(df.assign(LOTE=["12", "doce", 3]), mapping)
+
+    @override_settings(IMPORTACION_SEGUNDOS_SIN_AVANCE=60)
+    def test_trabajo_sin_avance_queda_interrumpido(self):
+        trabajo = TrabajoImportacion.objects.create(tipo="programa", archivo="no-existe.xlsx", estado="en_proceso")
+        self.assertEqual(self.client.get(f"/api/import-jobs/{trabajo.id}/").data["estado"], "en_proceso")
+
+        TrabajoImportacion.objects.filter(pk=trabajo.pk).update(actualizado=timezone.now() - timedelta(minutes=5))
+        datos = self.client.get(f"/api/import-jobs/{trabajo.id}/").data
+        self.assertEqual(datos["estado"], "error")
+        self.assertIn("interrumpido", datos["errores"][0])
+
+
+
+# ejecutar_trabajo cierra la conexión al terminar (como en el hilo del pool)
+class EjecucionTrabajos(TransactionTestCase):
+    def test_trabajo_interrumpido_no_se_ejecuta(self):
+        trabajo = TrabajoImportacion.objects.create(tipo="programa", archivo="no-existe.xlsx", estado="error")
+        ejecutar_trabajo(trabajo.pk)
+        self.assertEqual(TrabajoImportacion.objects.get(pk=trabajo.pk).estado, "error")
+
+    def test_trabajo_inexistente(self):
+        # se registra el error sin romper el hilo del pool
+        with self.assertLogs("App.trabajos", "ERROR"):
+            ejecutar_trabajo(0)
+
+
+class Planificacion(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=60, pailas=6, semilla=1)
+        planificar(INICIO)
+
+    def setUp(self):
+        IndiceVersionado.descartar_todos()
+
+    def fragmentado(self):
+        return ProgramaProduccion.objects.filter(children__isnull=False, paila__isnull=False).order_by("id").first()
+
+    def test_calcular_operaciones_respeta_el_plan(self):
+        # planificar y calcular_operaciones usan la misma cantidad (la producción en la paila)
+        antes = dict(ProgramaProduccion.objects.filter(paila__isnull=False).values_list("id", "hora_final"))
+        calcular_operaciones_plan()
+        despues = dict(ProgramaProduccion.objects.filter(paila__isnull=False).values_list("id", "hora_final"))
+        for programa_id, fin in antes.items():
+            self.assertAlmostEqual((despues[programa_id] - fin).total_seconds(), 0, delta=1, msg=programa_id)
+
+    def test_set_hora_inicial_mantiene_la_duracion_del_fragmento(self):
+        padre = self.fragmentado()
+        self.assertLess(padre.produccion, padre.lote_f)
+        hora = (padre.hora_inicial - timedelta(hours=5)).isoformat()  # la vista suma 5 h
+        respuesta = self.client.patch(f"/api/set-hora-inicial/{padre.id}/", data={"hora_inicial": hora}, content_type="application/json")
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertAlmostEqual(respuesta.data["duracion_total"], padre.duracion_total)
+
+    def test_candidato_con_varios_hijos_se_planifica_una_vez(self):
+        padre = self.fragmentado()
+        ProgramaProduccion.objects.create(orden=padre.orden, fert_id=padre.fert_id, lote_f=100, parent=padre)
+        ProgramaProduccion.objects.filter(pk=padre.pk).update(hora_inicial=None, hora_final=None)
+        resumen = planificar(INICIO, programa_ids=[padre.id])
+        self.assertEqual(resumen["planificados"], 1)
+
+    def test_ids_invalidos(self):
+        for programas in (["abc"], [1, "2"], [1.5], [True], "todos"):
+            for url, datos in (
+                ("/api/pailas-validas/", {"programas": programas}),
+                ("/api/planificar/", {"programas": programas, "inicio": INICIO.isoformat()}),
+            ):
+                respuesta = self.client.post(url, data=datos, content_type="application/json")
+                self.assertEqual(respuesta.status_code, 400, (url, programas))
+
+    def test_limite_de_pagina(self):
+        for limite in ("0", "-5", "abc"):
+            respuesta = self.client.get(f"/api/programa-produccion/?limit={limite}")
+            self.assertEqual(respuesta.status_code, 400, limite)
+        respuesta = self.client.get("/api/programa-produccion/?limit=2")
+        self.assertEqual(len(respuesta.data["results"]), 2)
+
+    def test_sincronizar_sin_diferencias_no_cambia_la_version(self):
+        version = obtener_version_plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post("/api/sincronizar-asignaciones/", data={}, content_type="application/json")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(obtener_version_plan(), version)
+        self.assertFalse(CambioPlan.objects.exists())
+
+    def test_bitacora_solo_con_lo_escrito(self):
+        a, b, c = self.linea(0, 0, 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            movidos = reprogramar_en_cascada(a, a.hora_inicial + timedelta(hours=1), a.hora_final + timedelta(hours=1))
+        # solo el programa que la cascada movió, no todo lo que leyó
+        programas = set(CambioPlan.objects.filter(tabla="programa").values_list("objeto_id", flat=True))
+        self.assertEqual(programas, {p.id for p in movidos})
+
+    def test_fragmentar_encadena_el_sobrante(self):
+        padre = self.fragmentado()
+        resultado = fragmentar_programa(padre, INICIO)
+        piezas = resultado["fragmentos"]
+        self.assertGreater(len(piezas), 1)
+        # como en asignar_paila: cada hijo cuelga del anterior y lleva lo que falta
+        for anterior, pieza in zip(piezas, piezas[1:]):
+            pieza.refresh_from_db()
+            self.assertEqual(pieza.parent_id, anterior.id)
+            self.assertEqual(pieza.lote_f, anterior.lote_f - anterior.produccion)
+        repartido = sum(p.produccion for p in piezas if p.paila_id)
+        self.assertEqual(repartido + resultado["sobrante"], padre.lote_f)
+
+    def test_fragmentar_inserta_la_cadena_de_una_vez(self):
+        padre = self.fragmentado()
+        with CaptureQueriesContext(connection) as consultas:
+            piezas = fragmentar_programa(padre, INICIO)["fragmentos"]
+        self.assertGreater(len(piezas), 2)
+        inserts = [c for c in consultas.captured_queries if c["sql"].startswith('INSERT INTO "App_programaproduccion"')]
+        self.assertEqual(len(inserts), 1)
+
+    def test_fragmentar_pailas_invalidas(self):
+        padre = self.fragmentado()
+        for pailas in ([{"paila": "SIN-P0"}], "SIN-P0", [1]):
+            respuesta = self.client.post(f"/api/fragmentar/{padre.id}/", data={"pailas": pailas}, content_type="application/json")
+            self.assertEqual(respuesta.status_code, 400, pailas)
+
+    def test_fragmentar_sin_ruta_no_pisa_otra_asignacion(self):
+        padre = self.fragmentado()
+        hijos = padre.children.count()
+        Throughput.objects.filter(fert_id=padre.fert_id).update(ruta=None)
+        PailaAsignacion.objects.create(
+            paila_id=padre.paila_id, inicio=padre.hora_inicial, fin=padre.hora_final, estado="ocupada"
+        )
+        with self.assertRaises(ValueError):
+            fragmentar_programa(padre, INICIO, pailas=[padre.paila_id])
+        self.assertEqual(padre.children.count(), hijos)
+
+    def linea(self, *separaciones):
+        """Programas de una paila movidos lejos del plan, con `separaciones[k]` horas libres antes del k-ésimo."""
+        paila_id = (
+            ProgramaProduccion.objects.filter(paila__isnull=False).values("paila_id")
+            .annotate(n=Count("id")).filter(n__gte=len(separaciones)).order_by("paila_id")
+            .values_list("paila_id", flat=True).first()
+        )
+        programas = list(ProgramaProduccion.objects.filter(paila_id=paila_id).order_by("id")[:len(separaciones)])
+        cursor = INICIO + timedelta(days=365)
+        for programa, separacion in zip(programas, separaciones):
+            duracion = programa.hora_final - programa.hora_inicial
+            programa.hora_inicial = cursor + timedelta(hours=separacion)
+            programa.hora_final = cursor = programa.hora_inicial + duracion
+            programa.save()
+        return programas
+
+    def test_cascada_empujar_recalcula_etapas(self):
+        a, b = self.linea(0, 0)
+        ProgramaProduccion.objects.filter(pk=b.pk).update(duracion_total=0, **{op: None for op in ETAPAS})
+        movidos = reprogramar_en_cascada(a, a.hora_inicial + timedelta(hours=1), a.hora_final + timedelta(hours=1))
+        self.assertEqual([p.id for p in movidos], [b.id])
+        b.refresh_from_db()
+        etapas, total = obtener_modelo_ruteo().horas_etapas(b.fert_id, cantidad_programa(b.lote_f, b.produccion, b.paila_id))
+        self.assertEqual(b.hora_inicial, a.hora_final + timedelta(hours=1))
+        self.assertAlmostEqual(b.duracion_total, total)
+        for op, horas in etapas.items():
+            self.assertAlmostEqual(getattr(b, op), horas, msg=op)
+
+    def test_cascada_compactar_sigue_la_cadena_original(self):
+        # u no iba pegado a a: al adelantar a solo lo sigue b, que sí iba pegado
+        u, a, b, c = self.linea(0, 10, 0, 5)
+        duracion = a.hora_final - a.hora_inicial
+        inicio = u.hora_inicial - duracion - timedelta(hours=1)
+        movidos = reprogramar_en_cascada(a, inicio, inicio + duracion, "compactar")
+        self.assertEqual([p.id for p in movidos], [b.id])
+        u_antes, c_antes = u.hora_inicial, c.hora_inicial
+        for programa in (u, b, c):
+            programa.refresh_from_db()
+        self.assertEqual(u.hora_inicial, u_antes)
+        self.assertEqual(b.hora_inicial, u.hora_final)
+        self.assertEqual(c.hora_inicial, c_antes)
+
+    def aislar(self, *programas):
+        """Mueve los programas al final del plan, todos con la misma hora_inicial."""
+        inicio = INICIO + timedelta(days=365)
+        for programa in programas:
+            programa.hora_final = inicio + (programa.hora_final - programa.hora_inicial)
+            programa.hora_inicial = inicio
+            programa.save()
+
+    def test_simular_usa_la_cantidad_del_plan(self):
+        padre = self.fragmentado()
+        self.aislar(padre)
+        resultado = simular()
+        self.assertNotIn(padre.id, [a["id"] for a in resultado["atrasados"]["detalle"]])
+
+    def test_simular_informa_choques_con_bloques_fijos(self):
+        estacion = Equipo.objects.values_list("estacion", flat=True).order_by("estacion").first()
+        Equipo.objects.filter(estacion=estacion).exclude(
+            pk=Equipo.objects.filter(estacion=estacion).order_by("pk").values("pk")[:1]
+        ).delete()
+        a, b = [
+            ProgramaProduccion.objects.filter(estacion=estacion, paila_id=paila_id).order_by("id").first()
+            for paila_id in ProgramaProduccion.objects.filter(estacion=estacion).order_by("paila_id")
+            .values_list("paila_id", flat=True).distinct()[:2]
+        ]
+        self.aislar(a, b)
+        for programa in (a, b):  # un bloque fijo un minuto después de lo planificado
+            PailaAsignacion.objects.create(
+                paila_id=programa.paila_id, inicio=programa.hora_final + timedelta(minutes=1),
+                fin=programa.hora_final + timedelta(hours=1), estado="ocupada",
+            )
+        # un solo equipo por etapa: los dos compiten y el que espera sigue en la paila al empezar el bloque
+        choques = simular()["choques_bloques_fijos"]
+        self.assertGreaterEqual(choques["total"], 1)
+        for choque in choques["detalle"]:  # sin esperas lo planificado entra antes del bloque
+            self.assertIn(choque["id"], {a.id, b.id})
+            self.assertGreater(choque["espera_equipos_horas"], 0)
+
+    def test_simular_parametros_invalidos(self):
+        for datos in ({"tolerancia_min": "abc"}, {"tolerancia_min": "nan"}, {"detalle": -1}, {"detalle": "x"}):
+            respuesta = self.client.post("/api/simular/", data=datos, content_type="application/json")
+            self.assertEqual(respuesta.status_code, 400, datos)
+
+    def test_repartir_lote(self):
+        class Indice:
+            def __init__(self, capacidades):
+                self.capacidades = capacidades
+
+            def pailas_para_color(self, color_id, lote_f):
+                return [{"paila": p, "capacidad_planificable": c} for p, c in self.capacidades]
+
+        fragmentos, sobrante = repartir_lote(2500, 1, Indice([("P1", 1000), ("P2", 600)]))
+        self.assertEqual([(o["paila"], c) for o, c in fragmentos], [("P1", 1000), ("P2", 600), ("P1", 900)])
+        self.assertEqual(sobrante, 0)
+        self.assertEqual(repartir_lote(0, 1, Indice([("P1", 1000)])), ([], 0))
+        with self.assertRaises(ValueError):
+            repartir_lote(500, 1, Indice([("P1", 0)]))
+
+
+class Optimizacion(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=60, pailas=6, semilla=1)
+        planificar(INICIO)
+
+    def setUp(self):
+        IndiceVersionado.descartar_todos()
+
+    def plan(self):
+        return {
+            p["id"]: p for p in ProgramaProduccion.objects.filter(paila__isnull=False, hora_inicial__isnull=False)
+            .values("id", "paila_id", "hora_inicial", "hora_final")
+        }
+
+    def test_objetivo_inicial_es_el_plan_guardado(self):
+        ultimo = ProgramaProduccion.objects.filter(paila__isnull=False).order_by("-hora_final").first()
+        ProgramaProduccion.objects.filter(pk=ultimo.pk).update(
+            hora_inicial=ultimo.hora_inicial + timedelta(hours=10), hora_final=ultimo.hora_final + timedelta(hours=10)
+        )
+        plan = self.plan()
+        inicio = min(p["hora_inicial"] for p in plan.values())
+        fin = max(p["hora_final"] for p in plan.values())
+
+        resultado = optimizar(reinicios=1, iteraciones=1)
+        self.assertAlmostEqual(resultado["makespan_inicial_horas"], (fin - inicio).total_seconds() / 3600, places=3)
+        # decodificar compacta el hueco que dejó el programa atrasado
+        self.assertLess(resultado["makespan_horas"], resultado["makespan_inicial_horas"])
+
+    def test_reparte_una_paila_apilada(self):
+        # todo lo de otra paila se apila al final de la que termina última
+        finales = (
+            ProgramaProduccion.objects.filter(paila__isnull=False).values("paila_id")
+            .annotate(fin=Max("hora_final"), n=Count("id")).order_by("-fin")
+        )
+        apilada = finales[0]["paila_id"]
+        vaciada = max(finales[1:], key=lambda f: f["n"])["paila_id"]
+        cursor = finales[0]["fin"]
+        movidos = []
+        for programa in ProgramaProduccion.objects.filter(paila_id=vaciada).order_by("hora_inicial"):
+            duracion = programa.hora_final - programa.hora_inicial
+            ProgramaProduccion.objects.filter(pk=programa.pk).update(
+                paila_id=apilada, hora_inicial=cursor, hora_final=cursor + duracion
+            )
+            movidos.append(programa.pk)
+            cursor += duracion
+        antes = self.plan()
+
+        resultado = optimizar(reinicios=1, iteraciones=5000, aplicar=True)
+        self.assertTrue(resultado["aplicado"])
+        self.assertLess(resultado["makespan_horas"], resultado["makespan_inicial_horas"] - 1)
+        despues = self.plan()
+        self.assertTrue(any(despues[i]["hora_inicial"] < antes[i]["hora_inicial"] for i in movidos))
+        self.assertTrue(any(despues[i]["paila_id"] != apilada for i in movidos))
+
+    def test_aplicar_solo_reescribe_lo_que_cambia(self):
+        antes = self.plan()
+        resultado = optimizar(reinicios=1, iteraciones=3000, aplicar=True)
+        despues = self.plan()
+        self.assertLessEqual(resultado["objetivo"], resultado["objetivo_inicial"])
+        cambiados = [i for i in antes if antes[i] != despues[i]]
+        self.assertEqual(len(cambiados), resultado["actualizados"])
+
+        # sin cambios no se escribe nada
+        asignaciones = [
+            {"programa": p["id"], "paila": p["paila_id"], "hora_inicial": p["hora_inicial"], "hora_final": p["hora_final"]}
+            for p in despues.values()
+        ]
+        self.assertEqual(aplicar_asignaciones(asignaciones), 0)
+
+    def test_parametros_invalidos(self):
+        for datos in ({"tiempo": "nan"}, {"tiempo": "inf"}, {"tiempo": 0}, {"reinicios": 0}, {"tiempo": "x"}):
+            respuesta = self.client.post("/api/optimizar/", data=datos, content_type="application/json")
+            self.assertEqual(respuesta.status_code, 400, datos)
+
+
+class Solapamientos(TestCase):
+    """hay_solapamiento (escrituras, contra la base) e IndiceIntervalos (reporte de conflictos)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=10, pailas=2, semilla=0)
+        cls.base = timezone.make_aware(datetime(2030, 1, 1, 10))
+        cls.programa = ProgramaProduccion.objects.order_by("id").first()
+        cls.bloque = PailaAsignacion.objects.create(
+            paila_id="SIN-P0", inicio=cls.base, fin=cls.base + timedelta(hours=2), estado="ocupada",
+        )
+        cls.asignacion = PailaAsignacion.objects.create(
+            paila_id="SIN-P0", programa=cls.programa, estado="ocupada",
+            inicio=cls.base + timedelta(hours=4), fin=cls.base + timedelta(hours=6),
+        )
+
+    def comprobar(self, desde, hasta, esperado, excluir=None):
+        inicio, fin = self.base + timedelta(hours=desde), self.base + timedelta(hours=hasta)
+        for a, b in ((inicio, fin), (timezone.make_naive(inicio), timezone.make_naive(fin))):
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")  # las fechas sin zona no avisan: se toman en la del proyecto
+                self.assertEqual(hay_solapamiento("SIN-P0", a, b, exclude_programa_id=excluir), esperado, (desde, hasta, a))
+
+    def test_bordes(self):
+        self.comprobar(-1, 0, False)  # termina justo cuando empieza el bloque
+        self.comprobar(2, 4, False)  # entre el bloque y el programa
+        self.comprobar(-1, 0.5, True)
+        self.comprobar(1.5, 4.5, True)
+        self.comprobar(0.5, 1, True)  # contenido
+        self.comprobar(-1, 7, True)  # contiene
+
+    def test_excluye_el_programa_editado(self):
+        self.comprobar(4.5, 5, True)
+        self.comprobar(4.5, 5, False, excluir=self.programa.id)
+        self.comprobar(1.5, 5, True, excluir=self.programa.id)
+
+    def test_conflictos(self):
+        pegado = PailaAsignacion.objects.create(  # toca el bloque sin solaparse
+            paila_id="SIN-P0", inicio=self.base + timedelta(hours=2), fin=self.base + timedelta(hours=3), estado="lavado",
+        )
+        solapado = PailaAsignacion.objects.create(
+            paila_id="SIN-P0", inicio=self.base + timedelta(hours=5), fin=self.base + timedelta(hours=8), estado="lavado",
+        )
+        conflictos = IndiceIntervalos().cargar_todo().conflictos()
+        pares = {(a[3], b[3]) for a, b in conflictos.get("SIN-P0", [])}
+        self.assertIn((self.asignacion.id, solapado.id), pares)
+        self.assertFalse({self.bloque.id, pegado.id} & {i for par in pares for i in par})
+
+
+class SincronizacionDiferida(TestCase):
+    """ProgramaProduccion.save() dentro y fuera de sincronizacion_diferida()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        generar_planta(ordenes=10, pailas=2, semilla=0)
+        planificar(INICIO)
+
+    def setUp(self):
+        self.a, self.b = ProgramaProduccion.objects.filter(paila__isnull=False).order_by("id")[:2]
+
+    def inicio_asignado(self, programa):
+        return PailaAsignacion.objects.get(programa=programa).inicio
+
+    def mover(self, programa, horas=1):
+        programa.hora_inicial += timedelta(hours=horas)
+        programa.hora_final += timedelta(hours=horas)
+        programa.save()
+        return programa.hora_inicial
+
+    def test_save_fuera_de_un_bloque_sincroniza_en_el_acto(self):
+        nuevo = self.mover(self.a)
+        self.assertEqual(self.inicio_asignado(self.a), nuevo)
+        self.a.paila = None
+        self.a.save()
+        self.assertFalse(PailaAsignacion.objects.filter(programa=self.a).exists())
+
+    def test_se_reconcilia_al_salir(self):
+        antes = self.inicio_asignado(self.a)
+        version = obtener_version_plan()
+        with self.captureOnCommitCallbacks(execute=True):
+            with sincronizacion_diferida():
+                nuevo_a = self.mover(self.a)
+                nuevo_b = self.mover(self.b)
+                self.assertEqual(self.inicio_asignado(self.a), antes)
+        self.assertEqual(self.inicio_asignado(self.a), nuevo_a)
+        self.assertEqual(self.inicio_asignado(self.b), nuevo_b)
+        self.assertEqual(obtener_version_plan(), version + 1)
+
+    def test_anidados_se_suman_al_exterior(self):
+        antes = self.inicio_asignado(self.a)
+        with sincronizacion_diferida():
+            with sincronizacion_diferida():
+                nuevo = self.mover(self.a)
+            self.assertEqual(self.inicio_asignado(self.a), antes)
+            self.mover(self.b)
+        self.assertEqual(self.inicio_asignado(self.a), nuevo)
+
+    def test_programa_borrado_dentro_del_bloque(self):
+        with sincronizacion_diferida():
+            self.mover(self.a)
+            nuevo = self.mover(self.b)
+            self.a.delete()
+        self.assertFalse(PailaAsignacion.objects.filter(programa_id=self.a.id).exists())
+        self.assertEqual(self.inicio_asignado(self.b), nuevo)
+
+    def test_una_excepcion_deshace_el_bloque(self):
+        guardado = ProgramaProduccion.objects.get(pk=self.a.pk).hora_inicial
+        antes = self.inicio_asignado(self.a)
+        with self.assertRaises(RuntimeError):
+            with sincronizacion_diferida():
+                self.mover(self.a)
+                raise RuntimeError("falla")
+        self.assertEqual(ProgramaProduccion.objects.get(pk=self.a.pk).hora_inicial, guardado)
+        self.assertEqual(self.inicio_asignado(self.a), antes)
+        # el bloque no queda activo: el siguiente save() vuelve a sincronizar en el acto
+        self.a.refresh_from_db()
+        nuevo = self.mover(self.a)
+        self.assertEqual(self.inicio_asignado(self.a), nuevo)
+
+
+class PailasValidas(TestCase):
+    """pailas-validas (por programa y en lote) contra una Matrix armada a mano."""
+
+    @classmethod
+    def setUpTestData(cls):
+        fert = Producto.objects.create(codigo="F1", descripcion="F1")
+        rojo = Color.objects.create(codigo="ROJO", descripcion="rojo")
+        Color.objects.create(codigo="AZUL", descripcion="azul")
+        DetalleProducto.objects.create(primario=1, fert=fert, descripcion="F1", color=rojo)
+        equipo = Equipo.objects.create(equipo="E1", estacion="E1")
+        for numero in (1, 2, 3):
+            InventarioPaila.objects.create(paila=f"P{numero}", numero=numero)
+        for primario, paila, base, capacidad, diamsi in (
+            (1, "P1", 50, 800, "SI"),
+            (2, "P1", 100, 500, "SI"),  # P1 dos veces: cuenta la mayor capacidad
+            (3, "P2", 200, 1000, "si"),
+            (4, "P3", 10, 2000, "NO"),
+        ):
+            Matrix.objects.create(
+                primario=primario, paila_id=paila, equipo=equipo, numero=1, color=rojo,
+                base_dispersion_minimo=base, capacidad_planificable=capacidad, diamsi=diamsi,
+            )
+        cls.programas = {
+            lote: ProgramaProduccion.objects.create(orden=f"O{lote}", fert=fert, lote_f=lote).id
+            for lote in (50, 200, 201)
+        }
+
+    def setUp(self):
+        IndiceVersionado.descartar_todos()
+
+    def validas(self, lote):
+        """Pailas por el endpoint individual y por el de lote (deben coincidir)."""
+        programa_id = self.programas[lote]
+        individual = self.client.get(f"/api/pailas-validas/{programa_id}/")
+        en_lote = self.client.post("/api/pailas-validas/", data={"programas": [programa_id]}, content_type="application/json")
+        self.assertEqual(individual.status_code, 200)
+        self.assertEqual(en_lote.status_code, 200)
+        self.assertEqual(en_lote.data[programa_id], individual.data)
+        return [(p["paila"], p["capacidad_planificable"]) for p in individual.data]
+
+    def test_base_minima_estricta_y_mayor_capacidad(self):
+        self.assertEqual(self.validas(50), [])  # 50 no es < 50
+        self.assertEqual(self.validas(200), [("P1", 800)])  # P2 pide base < 200
+        self.assertEqual(self.validas(201), [("P2", 1000), ("P1", 800)])
+
+    def test_se_reconstruye_al_cambiar_matrix(self):
+        self.assertEqual(self.validas(200), [("P1", 800)])
+        with self.captureOnCommitCallbacks(execute=True):
+            fila = Matrix.objects.get(pk=3)
+            fila.base_dispersion_minimo = 150
+            fila.save()
+        self.assertEqual(self.validas(200), [("P2", 1000), ("P1", 800)])
+
+    def test_se_reconstruye_al_cambiar_detalle_producto(self):
+        self.assertEqual(self.validas(201), [("P2", 1000), ("P1", 800)])
+        with self.captureOnCommitCallbacks(execute=True):
+            detalle = DetalleProducto.objects.get(pk=1)
+            detalle.color_id = "AZUL"
+            detalle.save()
+        self.assertEqual(self.validas(201), [])
+
+    def test_se_reconstruye_al_cambiar_inventario_paila(self):
+        self.assertEqual(self.validas(201), [("P2", 1000), ("P1", 800)])
+        with self.captureOnCommitCallbacks(execute=True):
+            InventarioPaila.objects.get(pk="P2").delete()  # arrastra sus filas de Matrix
+        self.assertEqual(self.validas(201), [("P1", 800)])
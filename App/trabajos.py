@@ -0,0 +1,138 @@
+# trabajos.py
+"""
+Importaciones de Excel en segundo plano.
+
+El POST guarda el archivo en disco, crea un TrabajoImportacion y lo encola en
+un ThreadPoolExecutor local (sin broker externo). El avance se persiste en la
+fila del trabajo después de cada lote, así cualquier worker puede consultarlo.
+Cada avance renueva `actualizado`; un trabajo sin avance por mucho tiempo se
+da por interrumpido al consultarlo (revisar_trabajo).
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .importacion import (
+    importar_programas_por_lotes, importar_asignaciones_por_lotes, leer_excel_por_lotes,
+)
+from .models import TrabajoImportacion
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def obtener_executor():
+    """Pool de hilos compartido por el proceso (se crea bajo demanda)."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "IMPORTACION_WORKERS", 2),
+            thread_name_prefix="importacion",
+        )
+    return _executor
+
+
+def guardar_archivo(file):
+    """Copia el Excel subido a un archivo temporal y devuelve su ruta."""
+    directorio = getattr(settings, "IMPORTACION_DIR", None) or tempfile.gettempdir()
+    fd, ruta = tempfile.mkstemp(prefix="importacion_", suffix=".xlsx", dir=directorio)
+    with os.fdopen(fd, "wb") as destino:
+        for chunk in file.chunks():
+            destino.write(chunk)
+    return ruta
+
+
+def crear_trabajo(tipo, file, parametros):
+    """Guarda el archivo, crea el trabajo y lo encola al confirmar la transacción."""
+    trabajo = TrabajoImportacion.objects.create(
+        tipo=tipo,
+        archivo=guardar_archivo(file),
+        parametros=parametros,
+    )
+    transaction.on_commit(lambda: obtener_executor().submit(ejecutar_trabajo, trabajo.pk))
+    return trabajo
+
+
+def ejecutar_trabajo(trabajo_id):
+    """Procesa un TrabajoImportacion en el hilo del pool."""
+    close_old_connections()
+    filtro = TrabajoImportacion.objects.filter(pk=trabajo_id)
+    trabajo = None
+
+    def progreso(importadas, omitidas):
+        filtro.update(filas_procesadas=importadas, filas_omitidas=omitidas, actualizado=timezone.now())
+
+    try:
+        trabajo = TrabajoImportacion.objects.get(pk=trabajo_id)
+        # si mientras esperaba en la cola se dio por interrumpido, no se ejecuta
+        ahora = timezone.now()
+        if not filtro.filter(estado="pendiente").update(estado="en_proceso", iniciado=ahora, actualizado=ahora):
+            return
+
+        lotes = leer_excel_por_lotes(trabajo.archivo)
+        parametros = trabajo.parametros
+        # cada lote se confirma por separado para que el avance sea visible
+        if trabajo.tipo == "asignacion":
+            resumen = importar_asignaciones_por_lotes(
+                lotes, parametros["mapping"], parse_datetime(parametros["inicio"]),
+                progreso=progreso, atomico=False,
+            )
+        else:
+            resumen = importar_programas_por_lotes(
+                lotes, parametros["mapping"], progreso=progreso, atomico=False,
+            )
+
+        ahora = timezone.now()
+        filtro.update(
+            estado="completado",
+            filas_procesadas=resumen["importadas"],
+            filas_omitidas=resumen["omitidas"],
+            finalizado=ahora,
+            actualizado=ahora,
+        )
+    except Exception as e:
+        logger.exception("Error en el trabajo de importación %s", trabajo_id)
+        ahora = timezone.now()
+        filtro.update(estado="error", errores=[str(e)], finalizado=ahora, actualizado=ahora)
+    finally:
+        if trabajo is not None:
+            try:
+                os.remove(trabajo.archivo)
+            except OSError:
+                pass
+        connection.close()
+
+
+def revisar_trabajo(trabajo):
+    """
+    El pool es del proceso: si el proceso muere, sus trabajos no se retoman.
+    Un trabajo pendiente o en proceso sin avance en IMPORTACION_SEGUNDOS_SIN_AVANCE
+    se marca como error (interrumpido). Devuelve el trabajo actualizado.
+    """
+    if trabajo.estado not in ("pendiente", "en_proceso"):
+        return trabajo
+    ultimo = trabajo.actualizado or trabajo.creado
+    limite = timezone.now() - timedelta(seconds=getattr(settings, "IMPORTACION_SEGUNDOS_SIN_AVANCE", 900))
+    if ultimo >= limite:
+        return trabajo
+
+    # condicionado al último avance visto: si el hilo avanzó entre medio, no se toca
+    ahora = timezone.now()
+    TrabajoImportacion.objects.filter(
+        pk=trabajo.pk, estado=trabajo.estado, actualizado=trabajo.actualizado,
+    ).update(
+        estado="error",
+        errores=[f"Trabajo interrumpido: sin avance desde {ultimo.isoformat()}"],
+        finalizado=ahora,
+        actualizado=ahora,
+    )
+    trabajo.refresh_from_db()
+    return trabajo
@@ -4,19 +4,33 @@ from .views import (
     importar_excel, listar_programa, borrar_programa_y_extras, hay_datos,
     exportar_excel, get_pailas_validas, asignar_paila,
     importar_excel_paila_asignacion, calcular_operaciones, set_hora_inicial,
-    sincronizar_asignaciones   # 👈 importar
+    sincronizar_asignaciones,   # 👈 importar
+    estado_importacion, pailas_validas_lote, conflictos_pailas, planificar_plan,
+    optimizar_plan, fragmentar_lote, conflictos_recursos, simular_plan,
+    kpis_plan, rendimiento, cambios_programa,
 )
 
 urlpatterns = [
     path("importar-excel/", importar_excel, name="importar_excel"),
+    path("import-jobs/<int:job_id>/", estado_importacion, name="estado_importacion"),
     path("programa-produccion/", listar_programa, name="listar_programa"),
+    path("programa-produccion/cambios/", cambios_programa, name="cambios_programa"),
     path("borrar-programa-extras/", borrar_programa_y_extras, name="borrar_programa_y_extras"),
     path("hay-datos/", hay_datos, name="hay_datos"),
     path("exportar-excel/", exportar_excel, name="exportar_excel"),
+    path("pailas-validas/", pailas_validas_lote, name="pailas_validas_lote"),
     path("pailas-validas/<int:programa_id>/", get_pailas_validas, name="pailas_validas"),
     path("asignar-paila/<int:programa_id>/", asignar_paila, name="asignar_paila"),
+    path("fragmentar/<int:programa_id>/", fragmentar_lote, name="fragmentar_programa"),
     path("importar-excel-paila-asignacion/", importar_excel_paila_asignacion, name="importar_excel_paila_asignacion"),
     path("calcular-operaciones/", calcular_operaciones, name="calcular_operaciones"),
     path("set-hora-inicial/<int:programa_id>/", set_hora_inicial, name="set_hora_inicial"),
+    path("conflictos/", conflictos_pailas, name="conflictos_pailas"),
+    path("conflictos-recursos/", conflictos_recursos, name="conflictos_recursos"),
+    path("planificar/", planificar_plan, name="planificar"),
+    path("optimizar/", optimizar_plan, name="optimizar"),
+    path("simular/", simular_plan, name="simular"),
+    path("kpis/", kpis_plan, name="kpis"),
+    path("debug/perf/", rendimiento, name="rendimiento"),
     path("sincronizar-asignaciones/", sincronizar_asignaciones, name="sincronizar_asignaciones"),  # 👈 nuevo
 ]
\ No newline at end of file
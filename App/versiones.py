@@ -0,0 +1,154 @@
+# versiones.py
+"""
+Contadores de versión para invalidar índices en memoria.
+
+Cada proceso guarda junto a su índice la versión con la que lo construyó y lo
+reconstruye cuando el contador cambia. Los contadores viven en la base
+(VersionPlan) y se incrementan al confirmar la transacción: la invalidación
+llega a todos los workers y nunca antes que los datos.
+
+La versión del plan es otro contador de VersionPlan: los clientes la guardan
+como ETag. Se incrementa una vez por bloque cambios_agrupados() y en el mismo
+paso se anotan en CambioPlan las filas que cambió la transacción (ver
+cambios.py).
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import VersionPlan, CambioPlan
+
+PLAN = "plan"
+REINICIO = ("reinicio", 0)  # cambio que obliga a los clientes a recargar todo (ver cambios.py)
+
+# bloque cambios_agrupados() activo
+_pendientes = ContextVar("cambios_plan_pendientes", default=None)
+
+
+class _Bloque:
+    """Cambios anotados en un bloque cambios_agrupados() y si hubo alguno."""
+
+    def __init__(self):
+        self.cambios = set()
+        self.incrementar = False
+
+
+def obtener_contador(nombre):
+    """Valor del contador `nombre` en VersionPlan (0 si nunca cambió). Una consulta por PK."""
+    return VersionPlan.objects.filter(pk=nombre).values_list("version", flat=True).first() or 0
+
+
+def _incrementar(nombre):
+    if not VersionPlan.objects.filter(pk=nombre).update(version=F("version") + 1):
+        VersionPlan.objects.get_or_create(pk=nombre)
+        VersionPlan.objects.filter(pk=nombre).update(version=F("version") + 1)
+
+
+class IndiceVersionado:
+    """
+    Objeto en memoria por proceso (un índice, un modelo) que se reconstruye
+    cuando cambia su contador en VersionPlan. El contador se incrementa al
+    confirmar la transacción y se lee antes de construir: una copia puede
+    quedar con una versión más vieja que sus datos (se reconstruye de más),
+    nunca al revés.
+    """
+    _instancias = []
+
+    def __init__(self, nombre, construir):
+        self.nombre = nombre
+        self.construir = construir
+        self._valor = None
+        self._version = None
+        self._lock = threading.Lock()
+        IndiceVersionado._instancias.append(self)
+
+    def obtener(self):
+        version = obtener_contador(self.nombre)
+        with self._lock:
+            if self._valor is None or self._version != version:
+                self._valor = self.construir()
+                self._version = version
+            return self._valor
+
+    def invalidar(self):
+        """Los demás procesos (y este) reconstruyen después del commit."""
+        transaction.on_commit(partial(_incrementar, self.nombre))
+
+    @classmethod
+    def descartar_todos(cls):
+        """Olvida las copias del proceso (tests: el rollback también deshace los contadores)."""
+        for indice in cls._instancias:
+            with indice._lock:
+                indice._valor = None
+
+
+def obtener_version_plan():
+    """Versión actual del plan (0 si nunca hubo cambios). Una consulta por PK."""
+    return obtener_contador(PLAN)
+
+
+def _incrementar_version_plan(cambios=()):
+    """
+    Incrementa la versión y registra `cambios` [(tabla, id)] en CambioPlan con
+    esa versión, todo en una transacción: el UPDATE bloquea la fila de
+    VersionPlan, así las versiones de la bitácora quedan en orden de commit.
+    Si entre los cambios hay un REINICIO solo se registra ese.
+    """
+    if REINICIO in cambios:
+        cambios = [REINICIO]
+    with transaction.atomic():
+        _incrementar(PLAN)
+        if not cambios:
+            return
+        version = obtener_version_plan()
+        CambioPlan.objects.bulk_create(
+            [CambioPlan(version=version, tabla=tabla, objeto_id=objeto_id) for tabla, objeto_id in cambios],
+            batch_size=5000,
+        )
+        retenidas = getattr(settings, "CAMBIOS_VERSIONES_RETENIDAS", 1000)
+        CambioPlan.objects.filter(version__lte=version - retenidas).delete()
+
+
+def incrementar_version_plan(cambios=()):
+    """
+    Incrementa la versión del plan al confirmar la transacción actual (o ya
+    mismo en autocommit). Dentro de cambios_agrupados() se junta con el resto
+    del bloque en un solo incremento.
+    """
+    bloque = _pendientes.get()
+    if bloque is None:
+        transaction.on_commit(partial(_incrementar_version_plan, set(cambios)))
+    else:
+        bloque.cambios.update(cambios)
+        bloque.incrementar = True
+
+
+@contextmanager
+def cambios_agrupados():
+    """
+    with cambios_agrupados(): ... bloque atómico cuyos cambios del plan —p. ej.
+    una señal por fila en un delete en cascada— se confirman con un solo
+    incremento (un on_commit al salir). Si nada anotó cambios no hay
+    incremento. Los bloques anidados se suman al exterior.
+    """
+    if _pendientes.get() is not None:
+        yield
+        return
+
+    bloque = _Bloque()
+    token = _pendientes.set(bloque)
+    try:
+        with transaction.atomic():
+            yield
+            _pendientes.reset(token)
+            token = None
+            if bloque.incrementar:
+                transaction.on_commit(partial(_incrementar_version_plan, bloque.cambios))
+    finally:
+        if token is not None:
+            _pendientes.reset(token)
@@ -1,30 +1,90 @@
 # views.py
+import logging
+
 import pandas as pd
 import numpy as np
 import json
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
-from rest_framework import status
-from .serializers import ProgramaProduccionSerializer
-import io
-from django.http import HttpResponse
+from .serializers import ProgramaProduccionSerializer, ProgramaPlanoSerializer, TrabajoImportacionSerializer, serializar_arbol
+from django.http import FileResponse, StreamingHttpResponse
+from django.conf import settings
 from django.db import transaction
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
-from .models import ProgramaProduccion, ExcelExtra, Producto, DetalleProducto, Matrix, InventarioPaila, PailaAsignacion,Throughput, Ruta
+from .models import ProgramaProduccion, ExcelExtra, DetalleProducto, Matrix, InventarioPaila, PailaAsignacion, TrabajoImportacion
+from .importacion import (
+    importar_programas_por_lotes, importar_asignaciones_por_lotes, leer_excel_por_lotes,
+)
+from .trabajos import crear_trabajo, revisar_trabajo
+from .compatibilidad import obtener_indice
+from .intervalos import IndiceIntervalos
+from .planificador import planificar, fragmentar_programa
+from .optimizador import optimizar
+from .operaciones import calcular_operaciones_plan
+from .ruteo import obtener_modelo_ruteo, cantidad_programa
+from .recursos import cargar_calendario
+from .simulacion import simular, DETALLE_ATRASOS
+from .kpis import obtener_kpis
+from .cambios import cambios_desde, reiniciar_cambios
+from .versiones import cambios_agrupados
+from .instrumentacion import tramo, resumen_rendimiento
+from .etags import con_etag_plan, etag_plan, huella, no_modificado, marcar
+from .cascada import reprogramar_en_cascada, ConflictoCascada, MODOS as MODOS_CASCADA
+from .asignaciones import reconciliar_asignaciones, diferencia_json, sincronizacion_diferida
+from .exportacion import (
+    escribir_xlsx, generar_csv, generar_parquet, generar_arrow, pyarrow_disponible,
+)
 from datetime import timedelta
 from django.db.models import Q
 
-def clean_value(val):
-    """Convierte valores de pandas/numpy a tipos JSON-compatibles."""
-    if pd.isna(val):
-        return None
-    if isinstance(val, pd.Timestamp):
-        return val.strftime("%Y-%m-%d")  # o .isoformat() si quieres fecha+hora
-    if isinstance(val, (np.generic,)):  # numpy int64, float64, etc.
-        return val.item()
-    return val
+logger = logging.getLogger(__name__)
+
+def es_verdadero(valor):
+    """Interpreta flags de query/form ("1", "true", "si"...)."""
+    return str(valor).strip().lower() in ("1", "true", "si", "sí", "yes", "on")
+
+
+def es_lista_de_ids(valor):
+    """True si `valor` es una lista de ids enteros (como llegan en el JSON del body)."""
+    return isinstance(valor, list) and all(isinstance(v, int) and not isinstance(v, bool) for v in valor)
+
+
+def leer_excel(request, file):
+    """
+    Devuelve el Excel como iterable de DataFrames.
+    Con `streaming=true` se lee por lotes (openpyxl read-only) para no cargar
+    el libro completo en memoria; si no, un único DataFrame con pd.read_excel.
+    """
+    if es_verdadero(request.data.get("streaming") or request.query_params.get("streaming")):
+        return _medir_lotes(leer_excel_por_lotes(file))
+    with tramo("excel"):
+        return [pd.read_excel(file)]
+
+
+def _medir_lotes(lotes):
+    """Cuenta en el tramo "excel" solo la lectura de cada lote, no su importación."""
+    iterador = iter(lotes)
+    while True:
+        with tramo("excel"):
+            df = next(iterador, None)
+        if df is None:
+            return
+        yield df
+
+
+def es_asincrono(request):
+    """`asincrono=true` encola la importación y responde de inmediato con el id."""
+    return es_verdadero(request.data.get("asincrono") or request.query_params.get("asincrono"))
+
+
+def respuesta_trabajo(trabajo):
+    return Response(
+        {"message": "Importación encolada", "job_id": trabajo.pk, "estado": trabajo.estado},
+        status=202,
+    )
 
 
 @api_view(["POST"])
@@ -35,205 +95,264 @@ def importar_excel(request):
         return Response({"error": "No file uploaded"}, status=400)
 
     try:
-        df = pd.read_excel(file)
         mapping = request.data.get("mapping")
         if not mapping:
             return Response({"error": "Mapping not provided"}, status=400)
         mapping = json.loads(mapping) if isinstance(mapping, str) else mapping
 
-        fert_cache = {}  # cache de productos
+        if es_asincrono(request):
+            return respuesta_trabajo(crear_trabajo("programa", file, {"mapping": mapping}))
 
-        for _, row in df.iterrows():
-            orden = row.get(mapping["orden"])
-            codigo_fert = row.get(mapping["fert"])
-            lote = row.get(mapping["lote"])
+        # 🔹 normalización vectorizada + bulk_create por lotes en una transacción
+        resumen = importar_programas_por_lotes(leer_excel(request, file), mapping)
 
-            if pd.isna(orden) or pd.isna(codigo_fert):
-                continue
+        return Response({"message": "Excel importado correctamente", **resumen}, status=201)
 
-            codigo_fert = str(int(codigo_fert)) if isinstance(codigo_fert, float) else str(codigo_fert).strip()
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
 
-            # obtener o crear Producto
-            if codigo_fert in fert_cache:
-                fert = fert_cache[codigo_fert]
-            else:
-                fert, _ = Producto.objects.get_or_create(codigo=codigo_fert, defaults={"descripcion": codigo_fert})
-                fert_cache[codigo_fert] = fert
-
-            # guardar ProgramaProduccion fila por fila
-            programa = ProgramaProduccion.objects.create(
-                orden=str(orden).strip(),
-                fert=fert,
-                lote_f=float(lote) if pd.notna(lote) else None
-            )
 
-            # guardar ExcelExtra asociado
-            extras = {
-                str(col): clean_value(row[col])
-                for col in df.columns
-                if col not in mapping.values()
-            }
-            if extras:
-                ExcelExtra.objects.create(programa=programa, data=extras)
+@api_view(["GET"])
+def estado_importacion(request, job_id):
+    try:
+        trabajo = TrabajoImportacion.objects.get(pk=job_id)
+    except TrabajoImportacion.DoesNotExist:
+        return Response({"error": "Trabajo no encontrado"}, status=404)
+    return Response(TrabajoImportacionSerializer(revisar_trabajo(trabajo)).data)
 
-        return Response({"message": "Excel importado correctamente"}, status=201)
 
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return Response({"error": str(e)}, status=500)
+LIMITE_MAXIMO_PAGINA = 1000
+
+
+def filtrar_programas(queryset, params):
+    """
+    Aplica los filtros opcionales de la lista de programas:
+    desde/hasta (ventana que se solapa con [hora_inicial, hora_final)),
+    paila, estacion y fert. Devuelve (queryset, hay_filtros).
+    """
+    filtros = Q()
+    desde = params.get("desde")
+    hasta = params.get("hasta")
+    if desde:
+        desde_dt = parse_datetime(desde)
+        if not desde_dt:
+            raise ValueError("desde inválido, debe ser formato ISO")
+        filtros &= Q(hora_final__gt=desde_dt)
+    if hasta:
+        hasta_dt = parse_datetime(hasta)
+        if not hasta_dt:
+            raise ValueError("hasta inválido, debe ser formato ISO")
+        filtros &= Q(hora_inicial__lt=hasta_dt)
+    for campo in ("paila", "estacion", "fert"):
+        valor = params.get(campo)
+        if valor:
+            filtros &= Q(**{campo: valor})
+
+    if not filtros:
+        return queryset, False
+    return queryset.filter(filtros), True
+
+
+def paginar_programas(base, hay_filtros, cursor, limite):
+    """
+    Paginación keyset sobre ProgramaProduccion.id: devuelve las raíces con
+    id > cursor (máximo `limite`) junto con todos sus descendientes dentro de
+    `base`, cargados por niveles (una consulta por nivel de fragmentación).
+    """
+    raices = base.filter(parent__isnull=True)
+    if hay_filtros:
+        # un fragmento cuyo padre no cumple el filtro se muestra como raíz
+        raices = base.filter(Q(parent__isnull=True) | ~Q(parent__in=base.values("id")))
+    if cursor is not None:
+        raices = raices.filter(id__gt=cursor)
+
+    pagina = list(raices.select_related("paila", "fert").order_by("id")[:limite + 1])
+    siguiente = None
+    if len(pagina) > limite:
+        pagina = pagina[:limite]
+        siguiente = pagina[-1].id
+
+    programas = list(pagina)
+    nivel = [p.id for p in pagina]
+    while nivel:
+        hijos = list(base.filter(parent_id__in=nivel).select_related("paila", "fert"))
+        programas.extend(hijos)
+        nivel = [p.id for p in hijos]
+
+    programas.sort(key=lambda p: p.id)
+    return programas, siguiente
 
 
 @api_view(["GET"])
+@con_etag_plan
 def listar_programa(request):
-    # 🔹 traer todos
-    programas = ProgramaProduccion.objects.all().order_by("id")  # mantiene el orden de inserción
+    params = request.query_params
+    try:
+        base, hay_filtros = filtrar_programas(ProgramaProduccion.objects.all(), params)
+        cursor = int(params["cursor"]) if params.get("cursor") else None
+        limite = int(params["limit"]) if params.get("limit") else None
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    if limite is not None and limite < 1:
+        return Response({"error": "limit debe ser un entero positivo"}, status=400)
+
+    if cursor is None and limite is None:
+        # 🔹 una sola consulta plana con paila/fert; el árbol se arma en memoria
+        programas = list(
+            base.select_related("paila", "fert").order_by("id")  # mantiene el orden de inserción
+        )
+        # serializar solo padres (los hijos se anidan desde el mapa en memoria)
+        with tramo("serializacion"):
+            return Response(serializar_arbol(programas))
 
-    # 🔹 separar padres de hijos
-    padres = programas.filter(parent__isnull=True)
+    # 🔹 paginado por cursor: solo la página visible
+    limite = min(limite or LIMITE_MAXIMO_PAGINA, LIMITE_MAXIMO_PAGINA)
+    programas, siguiente = paginar_programas(base, hay_filtros, cursor, limite)
+    with tramo("serializacion"):
+        datos = serializar_arbol(programas)
+    return Response({"results": datos, "next_cursor": siguiente})
+
+
+@api_view(["GET"])
+@con_etag_plan
+def cambios_programa(request):
+    """
+    Delta del plan desde la versión `desde`: programas y asignaciones creados,
+    modificados o eliminados (ver cambios.py). Con completo=true el cliente
+    recarga /programa-produccion/; la próxima vez pide desde=<version>.
+    """
+    try:
+        desde = int(request.query_params["desde"]) if request.query_params.get("desde") else None
+    except ValueError:
+        return Response({"error": "desde debe ser una versión entera"}, status=400)
+
+    cambios = cambios_desde(desde)
+    if not cambios["completo"]:
+        with tramo("serializacion"):
+            cambios["programas"] = ProgramaPlanoSerializer(cambios["programas"], many=True).data
+    return Response(cambios)
 
-    # serializar solo padres (los hijos se anidan en el serializer)
-    serializer = ProgramaProduccionSerializer(padres, many=True)
-    return Response(serializer.data)
 
 @api_view(["DELETE"])
 def borrar_programa_y_extras(request):
     try:
-        ExcelExtra.objects.all().delete()
-        ProgramaProduccion.objects.all().delete()
+        # 🔹 un solo reinicio en la bitácora, no una fila por programa borrado
+        with cambios_agrupados():
+            ExcelExtra.objects.all().delete()
+            ProgramaProduccion.objects.all().delete()
+            reiniciar_cambios()
         return Response({"message": "Datos borrados correctamente"}, status=200)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
     
 @api_view(["GET"])
+@con_etag_plan
 def hay_datos(request):
     return Response({
         "programa": ProgramaProduccion.objects.exists(),
         "extras": ExcelExtra.objects.exists()
     })
 
+FORMATOS_COLUMNARES = {
+    "csv": (generar_csv, "text/csv", "produccion_extras.csv"),
+    "parquet": (generar_parquet, "application/vnd.apache.parquet", "produccion_extras.parquet"),
+    "arrow": (generar_arrow, "application/vnd.apache.arrow.stream", "produccion_extras.arrows"),
+}
+
+
 @api_view(["GET"])
+@con_etag_plan
 def exportar_excel(request):
     try:
-        programas = ProgramaProduccion.objects.all().prefetch_related("extras")
-        if not programas.exists():
+        if not ProgramaProduccion.objects.exists():
             return Response({"error": "No hay datos para exportar"}, status=400)
 
-        # Serializar a DataFrame
-        base_data = []
-        extras_data = []
-
-        for programa in programas:
-            base_row = {
-                "orden": programa.orden,
-                "fert": programa.fert.codigo if programa.fert else None,
-                "lote_f": programa.lote_f,
-                "paila": programa.paila.paila if programa.paila else None,
-                "estacion": programa.estacion,
-                "hora_inicial": programa.hora_inicial,
-                "hora_final": programa.hora_final,
-                "duracion_total": programa.duracion_total,
-                "empastado": programa.empastado,
-                "molino": programa.molino,
-                "matizado": programa.matizado,
-                "emulsion": programa.emulsion,
-                "completado": programa.completado,
-                "envasado": programa.envasado,
-            }
-            base_data.append(base_row)
-
-            # Combinar extras
-            extra = programa.extras.first()
-            extras_data.append(extra.data if extra else {})
-
-        df_base = pd.DataFrame(base_data)
-        df_extras = pd.DataFrame(extras_data)
-
-        # Concatenar lado a lado
-        df_final = pd.concat([df_base, df_extras], axis=1)
-
-        # Guardar en memoria como Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df_final.to_excel(writer, index=False, sheet_name="Produccion+Extras")
-
-        output.seek(0)
-
-        response = HttpResponse(
-            output,
+        # 🔹 formatos columnares para consumidores automáticos (?formato=csv|parquet|arrow)
+        formato = (request.query_params.get("formato") or "xlsx").lower()
+        if formato in FORMATOS_COLUMNARES:
+            generador, content_type, nombre = FORMATOS_COLUMNARES[formato]
+            if formato != "csv" and not pyarrow_disponible():
+                return Response({"error": f"El formato {formato} requiere pyarrow"}, status=400)
+            response = StreamingHttpResponse(generador(), content_type=content_type)
+            response["Content-Disposition"] = f'attachment; filename="{nombre}"'
+            return response
+        if formato != "xlsx":
+            return Response({"error": f"Formato no soportado: {formato}"}, status=400)
+
+        # 🔹 programas por chunks -> workbook write-only -> respuesta en streaming
+        with tramo("xlsx"):
+            archivo = escribir_xlsx()
+
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename="produccion_extras.xlsx",
             content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         )
-        response["Content-Disposition"] = 'attachment; filename="produccion_extras.xlsx"'
-        return response
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
     
 @api_view(["GET"])
+@con_etag_plan
 def get_pailas_validas(request, programa_id):
     try:
-        programa = ProgramaProduccion.objects.get(pk=programa_id)
-        print(f"🔹 Programa ID: {programa.id}, lote_f: {programa.lote_f}")
-        print(f"🔹 Fert desde TanStack: {programa.fert.codigo}")
-
-        # Obtener el detalle del producto y su color
-        detalle = DetalleProducto.objects.filter(fert=programa.fert).first()
-        if not detalle:
-            print("❌ No se encontró DetalleProducto para este fert")
-            return Response([], status=200)
-
-        color = detalle.color
-        if not color:
-            print("❌ DetalleProducto no tiene color asignado")
-            return Response([], status=200)
-
-        print(f"🔹 Color obtenido: {color.codigo} - {color.descripcion}")
-
-        # Filtrar matrices según color, diamsi='SI' y base_dispersion_minimo < lote_f
-        matrices = Matrix.objects.filter(
-            color=color,
-            diamsi__iexact="SI",
-            base_dispersion_minimo__lt=programa.lote_f
-        ).select_related("paila")
-
-        print(f"🔹 Matrices encontradas: {matrices.count()}")
-
-        # Tomar pailas únicas y quedarnos con la mayor capacidad_planificable
-        paila_dict = {}
-        for m in matrices:
-            if not m.paila or not m.capacidad_planificable:
-                continue
-            if m.paila.paila not in paila_dict:
-                paila_dict[m.paila.paila] = {
-                    "paila": m.paila.paila,
-                    "numero": m.paila.numero,
-                    "capacidad_planificable": m.capacidad_planificable,
-                }
-            else:
-                # Si ya existe, me quedo con el máximo capacidad_planificable
-                if m.capacidad_planificable > paila_dict[m.paila.paila]["capacidad_planificable"]:
-                    paila_dict[m.paila.paila]["capacidad_planificable"] = m.capacidad_planificable
-
-        # Ordenar por capacidad_planificable descendente
-        pailas_ordenadas = sorted(
-            paila_dict.values(),
-            key=lambda x: x["capacidad_planificable"],
-            reverse=True
-        )
+        programa = ProgramaProduccion.objects.only("id", "fert_id", "lote_f").get(pk=programa_id)
 
-        print(f"🔹 Pailas válidas ordenadas: {[p['paila'] for p in pailas_ordenadas]}")
+        # 🔹 color del fert + bisect sobre base_dispersion_minimo en el índice en memoria
+        pailas_ordenadas = obtener_indice().pailas_validas(programa.fert_id, programa.lote_f)
 
         return Response(pailas_ordenadas, status=200)
 
     except ProgramaProduccion.DoesNotExist:
         return Response({"error": "Programa no encontrado"}, status=404)
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
     
+@api_view(["POST"])
+def pailas_validas_lote(request):
+    """
+    Pailas válidas para varios programas en una sola respuesta.
+    Body: {"programas": [ids]} o {"programas": "sin_asignar"} (todos sin paila).
+    El cálculo se hace una vez por grupo (color, lote_f), no por programa.
+    Acepta If-None-Match como las lecturas GET (ver etags.py).
+    """
+    try:
+        seleccion = request.data.get("programas")
+        # 🔹 lectura por POST: el ETag incluye la selección del body
+        etag = etag_plan(huella(seleccion))
+        respuesta = no_modificado(request, etag)
+        if respuesta is not None:
+            return respuesta
+
+        programas = ProgramaProduccion.objects.all()
+        if seleccion == "sin_asignar":
+            programas = programas.filter(paila__isnull=True)
+        elif es_lista_de_ids(seleccion):
+            programas = programas.filter(pk__in=seleccion)
+        else:
+            return Response({"error": "programas debe ser una lista de ids o 'sin_asignar'"}, status=400)
+
+        indice = obtener_indice()
+        grupos = {}
+        for programa_id, fert_id, lote_f in programas.values_list("id", "fert_id", "lote_f"):
+            grupos.setdefault((indice.color_de(fert_id), lote_f), []).append(programa_id)
+
+        resultado = {}
+        for (color_id, lote_f), ids in grupos.items():
+            pailas = indice.pailas_para_color(color_id, lote_f)
+            for programa_id in ids:
+                resultado[programa_id] = pailas
+
+        return marcar(Response(resultado, status=200), etag)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
 @api_view(["PATCH"])
 def asignar_paila(request, programa_id):
     try:
@@ -256,43 +375,45 @@ def asignar_paila(request, programa_id):
                 )
 
         # --- lógica existente ---
-        programa.children.all().delete()
-        programa.paila = paila
-
-        detalle = DetalleProducto.objects.filter(fert=programa.fert).first()
-        color = detalle.color if detalle else None
-        matrix = Matrix.objects.filter(paila=paila, color=color, diamsi="SI").first()
-        programa.estacion = matrix.estacion if matrix else None
-
-        if matrix and programa.lote_f and matrix.capacidad_planificable:
-            cap = matrix.capacidad_planificable
-            if programa.lote_f <= cap:
-                programa.produccion = programa.lote_f
-                programa.save()
+        # 🔹 las asignaciones del programa y su fragmento se reconcilian juntas al final
+        with sincronizacion_diferida():
+            programa.children.all().delete()
+            programa.paila = paila
+
+            detalle = DetalleProducto.objects.filter(fert=programa.fert).first()
+            color = detalle.color if detalle else None
+            matrix = Matrix.objects.filter(paila=paila, color=color, diamsi="SI").first()
+            programa.estacion = matrix.estacion if matrix else None
+
+            if matrix and programa.lote_f and matrix.capacidad_planificable:
+                cap = matrix.capacidad_planificable
+                if programa.lote_f <= cap:
+                    programa.produccion = programa.lote_f
+                    programa.save()
+                else:
+                    original_lote = programa.lote_f
+                    programa.produccion = cap
+                    programa.save()
+                    sobrante = original_lote - cap
+                    ProgramaProduccion.objects.create(
+                        orden=programa.orden,
+                        fert=programa.fert,
+                        lote_f=sobrante,
+                        produccion=min(sobrante, cap),
+                        estacion=None,
+                        paila=None,
+                        parent=programa,
+                    )
             else:
-                original_lote = programa.lote_f
-                programa.produccion = cap
+                programa.produccion = programa.lote_f
                 programa.save()
-                sobrante = original_lote - cap
-                ProgramaProduccion.objects.create(
-                    orden=programa.orden,
-                    fert=programa.fert,
-                    lote_f=sobrante,
-                    produccion=min(sobrante, cap),
-                    estacion=None,
-                    paila=None,
-                    parent=programa,
-                )
-        else:
-            programa.produccion = programa.lote_f
-            programa.save()
 
         return Response({"message": "Paila asignada y fragmentación actualizada"}, status=200)
 
     except ProgramaProduccion.DoesNotExist:
         return Response({"error": "Programa no encontrado"}, status=404)
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
     
 @api_view(["POST"])
@@ -303,7 +424,6 @@ def importar_excel_paila_asignacion(request):
         return Response({"error": "No file uploaded"}, status=400)
 
     try:
-        df = pd.read_excel(file)
         mapping = request.data.get("mapping")
         inicio = request.data.get("inicio")  # 👈 fecha/hora inicial común
         if not mapping or not inicio:
@@ -314,88 +434,29 @@ def importar_excel_paila_asignacion(request):
         if not inicio_dt:
             return Response({"error": "Inicio inválido, debe ser formato ISO (YYYY-MM-DD HH:MM:SS)"}, status=400)
 
-        # 👇 BORRAR asignaciones sin programa antes de importar nuevas
-        PailaAsignacion.objects.filter(programa__isnull=True).delete()
-
-        for _, row in df.iterrows():
-            paila_id = row.get(mapping["paila"])
-            fin_val = row.get(mapping["fin"])
-            estado_val = row.get(mapping["estado"])
-
-            if pd.isna(paila_id):
-                continue
-
-            try:
-                paila = InventarioPaila.objects.get(pk=str(paila_id).strip())
-            except InventarioPaila.DoesNotExist:
-                continue
-
-            fin_dt = None
-            if pd.notna(fin_val):
-                # soporta string de fecha o datetime
-                if isinstance(fin_val, pd.Timestamp):
-                    fin_dt = fin_val.to_pydatetime()
-                else:
-                    fin_dt = parse_datetime(str(fin_val))
-
-            PailaAsignacion.objects.create(
-                paila=paila,
-                inicio=inicio_dt,   # 👈 mismo valor para todas
-                fin=fin_dt,
-                estado=str(estado_val).strip().lower() if pd.notna(estado_val) else "disponible",
+        if es_asincrono(request):
+            return respuesta_trabajo(
+                crear_trabajo("asignacion", file, {"mapping": mapping, "inicio": inicio})
             )
 
-        return Response({"message": "Excel de PailaAsignacion importado correctamente"}, status=201)
+        # 👇 borra las asignaciones sin programa e inserta las nuevas en bloque
+        resumen = importar_asignaciones_por_lotes(leer_excel(request, file), mapping, inicio_dt)
+
+        return Response({"message": "Excel de PailaAsignacion importado correctamente", **resumen}, status=201)
 
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
     
 @api_view(["POST"])
 def calcular_operaciones(request):
     try:
-        programas = ProgramaProduccion.objects.all()
-
-        for programa in programas:
-            if not programa.fert or not programa.lote_f:
-                continue
-
-            # 1. Buscar throughput por fert
-            throughput = Throughput.objects.filter(fert=programa.fert).first()
-            if not throughput or not throughput.ruta:
-                continue
-
-            ruta = throughput.ruta
-
-            # 2. Campos de operaciones válidos en ruta (solo True)
-            operaciones = ["empastado", "molino", "emulsion", "completado", "matizado", "envasado"]
-
-            total_horas = 0
-            for op in operaciones:
-                if getattr(ruta, op):  # si en Ruta está en True
-                    capacidad = getattr(throughput, op)  # valor numérico de Throughput
-                    if capacidad and capacidad > 0:
-                        horas = programa.lote_f / capacidad
-                        setattr(programa, op, horas)
-                        total_horas += horas
-                    else:
-                        setattr(programa, op, None)  # vacío si no hay capacidad
-                else:
-                    setattr(programa, op, None)  # vacío si en ruta está False
-
-            # 3. Guardar duración total
-            programa.duracion_total = total_horas
-
-            # 4. Calcular hora_final si hay hora_inicial
-            if programa.hora_inicial and total_horas:
-                programa.hora_final = programa.hora_inicial + timedelta(hours=total_horas)
-
-            programa.save()
-
-        return Response({"message": "Operaciones calculadas y actualizadas"}, status=200)
+        # 🔹 una pasada vectorizada sobre todo el plan + escritura en bloque
+        resumen = calcular_operaciones_plan()
+        return Response({"message": "Operaciones calculadas y actualizadas", **resumen}, status=200)
 
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
 
 @api_view(["PATCH"])
@@ -410,102 +471,306 @@ def set_hora_inicial(request, programa_id):
         if not dt:
             return Response({"error": "Formato inválido"}, status=400)
 
+        # 🔹 cascada: "empujar" o "compactar" mueve los programas siguientes de la paila
+        cascada = request.data.get("cascada") or None
+        if cascada is not None and cascada not in MODOS_CASCADA:
+            return Response({"error": f"cascada debe ser uno de: {', '.join(MODOS_CASCADA)}"}, status=400)
+
         # 🔹 Ajustar +5h
         nueva_hora_inicial = dt + timedelta(hours=5)
 
-        # Recalcular duración y hora_final
-        throughput = Throughput.objects.filter(fert=programa.fert).first()
+        # Recalcular duración y hora_final (modelo de ruteo en memoria, sin consultas)
         total_horas = 0
-        if throughput and throughput.ruta:
-            operaciones = ["empastado","molino","emulsion","completado","matizado","envasado"]
-            for op in operaciones:
-                if getattr(throughput.ruta, op):
-                    capacidad = getattr(throughput, op)
-                    if capacidad and capacidad > 0:
-                        horas = programa.lote_f / capacidad
-                        setattr(programa, op, horas)
-                        total_horas += horas
-                    else:
-                        setattr(programa, op, None)
-                else:
-                    setattr(programa, op, None)
+        cantidad = cantidad_programa(programa.lote_f, programa.produccion, programa.paila_id)
+        calculo = obtener_modelo_ruteo().horas_etapas(programa.fert_id, cantidad)
+        if calculo:
+            etapas, total_horas = calculo
+            for op, horas in etapas.items():
+                setattr(programa, op, horas)
 
         duracion_total = total_horas or programa.duracion_total
         nueva_hora_final = nueva_hora_inicial + timedelta(hours=duracion_total) if duracion_total else None
 
-        # 🔹 Verificar solapamiento si ya hay paila
-        if programa.paila and nueva_hora_final:
-            if hay_solapamiento(programa.paila, nueva_hora_inicial, nueva_hora_final, exclude_programa_id=programa.id):
-                return Response(
-                    {"error": "No se puede asignar esta hora porque genera solapamiento en la paila"},
-                    status=400
-                )
-
-        programa.hora_inicial = nueva_hora_inicial
-        programa.hora_final = nueva_hora_final
-        programa.duracion_total = duracion_total
-        programa.save()
+        with transaction.atomic():
+            movidos = []
+            # 🔹 Verificar solapamiento si ya hay paila
+            if programa.paila_id and nueva_hora_final:
+                if cascada:
+                    try:
+                        movidos = reprogramar_en_cascada(programa, nueva_hora_inicial, nueva_hora_final, cascada)
+                    except ConflictoCascada as e:
+                        return Response({"error": str(e)}, status=400)
+                elif hay_solapamiento(programa.paila, nueva_hora_inicial, nueva_hora_final, exclude_programa_id=programa.id):
+                    return Response(
+                        {"error": "No se puede asignar esta hora porque genera solapamiento en la paila"},
+                        status=400
+                    )
+
+            programa.hora_inicial = nueva_hora_inicial
+            programa.hora_final = nueva_hora_final
+            programa.duracion_total = duracion_total
+            programa.save()
 
-        return Response(ProgramaProduccionSerializer(programa).data, status=200)
+        data = ProgramaProduccionSerializer(programa).data
+        if cascada:
+            data["reprogramados"] = [
+                {"id": p.id, "hora_inicial": p.hora_inicial, "hora_final": p.hora_final} for p in movidos
+            ]
+        return Response(data, status=200)
 
     except ProgramaProduccion.DoesNotExist:
         return Response({"error": "Programa no encontrado"}, status=404)
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
 
 @api_view(["POST"])
 def sincronizar_asignaciones(request):
     try:
-        programas = ProgramaProduccion.objects.all()
-        total_creadas = 0
-        total_actualizadas = 0
-        total_eliminadas = 0
-
-        for programa in programas:
-            if programa.paila and programa.hora_inicial and programa.hora_final:
-                asignacion, created = PailaAsignacion.objects.update_or_create(
-                    programa=programa,
-                    defaults={
-                        "paila": programa.paila,
-                        "inicio": programa.hora_inicial,
-                        "fin": programa.hora_final,
-                        "estado": "ocupada",
-                    },
-                )
-                if created:
-                    total_creadas += 1
-                else:
-                    total_actualizadas += 1
-            else:
-                deleted, _ = PailaAsignacion.objects.filter(programa=programa).delete()
-                if deleted:
-                    total_eliminadas += 1
+        dry_run = es_verdadero(request.data.get("dry_run", request.query_params.get("dry_run")))
+
+        # 🔹 una lectura de programas y una de asignaciones; la diferencia se calcula en memoria
+        programas = ProgramaProduccion.objects.only("id", "paila_id", "hora_inicial", "hora_final")
+        existentes = PailaAsignacion.objects.filter(programa__isnull=False)
+        diferencia = reconciliar_asignaciones(programas, existentes=existentes, dry_run=dry_run)
+
+        respuesta = {
+            "message": "Diferencia calculada (sin cambios)" if dry_run else "Sincronización completada",
+            "creadas": len(diferencia["crear"]),
+            "actualizadas": len(diferencia["actualizar"]),
+            "eliminadas": len(diferencia["eliminar"]),
+        }
+        if dry_run:
+            respuesta["diferencia"] = diferencia_json(diferencia)
+        return Response(respuesta, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+    
+def parse_inicio(valor):
+    """Fecha ISO del request; si viene sin zona horaria se toma la del proyecto."""
+    dt = parse_datetime(valor) if valor else None
+    if dt and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+@api_view(["POST"])
+def planificar_plan(request):
+    """
+    Planificación automática: asigna paila, estación y horario a todos los
+    programas pendientes (o a `programas`) desde `inicio`. Con `recursos`
+    también respeta la capacidad de equipos por estación y etapa.
+    """
+    try:
+        inicio = parse_inicio(request.data.get("inicio"))
+        if not inicio:
+            return Response({"error": "inicio requerido en formato ISO (YYYY-MM-DD HH:MM:SS)"}, status=400)
+
+        programa_ids = request.data.get("programas")
+        if programa_ids is not None and not es_lista_de_ids(programa_ids):
+            return Response({"error": "programas debe ser una lista de ids"}, status=400)
+
+        resumen = planificar(inicio, programa_ids, recursos=es_verdadero(request.data.get("recursos")))
+        return Response({"message": "Plan generado", **resumen}, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
+@api_view(["POST"])
+def fragmentar_lote(request, programa_id):
+    """
+    Reparte el lote del programa en todas las pailas compatibles que haga
+    falta (opcionalmente solo en `pailas`), con horario desde `inicio`
+    (por defecto la hora_inicial del programa o ahora).
+    """
+    try:
+        programa = ProgramaProduccion.objects.get(pk=programa_id)
+        if not programa.lote_f:
+            return Response({"error": "El programa no tiene lote_f"}, status=400)
+
+        pailas = request.data.get("pailas")
+        if pailas is not None and (
+            not isinstance(pailas, list) or not all(isinstance(p, str) and p for p in pailas)
+        ):
+            return Response({"error": "pailas debe ser una lista de códigos de paila"}, status=400)
+
+        inicio = parse_inicio(request.data.get("inicio")) or programa.hora_inicial or timezone.now()
+
+        resultado = fragmentar_programa(programa, inicio, pailas)
+        if resultado is None:
+            return Response({"error": "No hay pailas compatibles para el lote"}, status=400)
 
         return Response({
-            "message": "Sincronización completada",
-            "creadas": total_creadas,
-            "actualizadas": total_actualizadas,
-            "eliminadas": total_eliminadas,
+            "message": "Lote fragmentado y asignado",
+            "sobrante": resultado["sobrante"],
+            "fragmentos": [
+                {
+                    "id": pieza.id,
+                    "paila": pieza.paila_id,
+                    "estacion": pieza.estacion,
+                    "produccion": pieza.produccion,
+                    "lote_f": pieza.lote_f,
+                    "hora_inicial": pieza.hora_inicial,
+                    "hora_final": pieza.hora_final,
+                }
+                for pieza in resultado["fragmentos"]
+            ],
         }, status=200)
 
+    except ProgramaProduccion.DoesNotExist:
+        return Response({"error": "Programa no encontrado"}, status=404)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     except Exception as e:
-        import traceback; traceback.print_exc()
+        logger.exception("Error en %s", request.path)
         return Response({"error": str(e)}, status=500)
-    
+
+@api_view(["POST"])
+def optimizar_plan(request):
+    """
+    Búsqueda local (recocido simulado) sobre el plan actual para reducir
+    makespan y ocio de pailas. Parámetros: tiempo (s, con tope), semilla,
+    reinicios, iteraciones (determinista), desde (inicio del horizonte) y
+    aplicar (guarda si mejora).
+    """
+    try:
+        datos = request.data
+        resultado = optimizar(
+            tiempo=float(datos.get("tiempo", 10)),
+            semilla=int(datos.get("semilla", 0)),
+            reinicios=int(datos["reinicios"]) if datos.get("reinicios") is not None else None,
+            iteraciones=int(datos["iteraciones"]) if datos.get("iteraciones") is not None else None,
+            aplicar=es_verdadero(datos.get("aplicar", False)),
+            desde=parse_inicio(datos.get("desde")),
+        )
+        if resultado is None:
+            return Response({"error": "No hay programas planificados para optimizar"}, status=400)
+        return Response(resultado, status=200)
+
+    except (TypeError, ValueError) as e:
+        return Response({"error": str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
 def hay_solapamiento(paila, inicio, fin, exclude_programa_id=None):
     """
     Verifica si en la paila ya existe una asignación que solape [inicio, fin).
     Excluye opcionalmente un programa (cuando se está editando).
+    Consulta la base (rango indexado por paila) para ver también lo que
+    acaban de escribir otros procesos.
     """
     if not inicio or not fin:
         return False
+    # las fechas sin zona se toman en la del proyecto (como hace el ORM, sin el warning)
+    if timezone.is_naive(inicio):
+        inicio = timezone.make_aware(inicio)
+    if timezone.is_naive(fin):
+        fin = timezone.make_aware(fin)
 
-    query = Q(inicio__lt=fin, fin__gt=inicio, paila=paila)
-
-    asignaciones = PailaAsignacion.objects.filter(query)
-
+    asignaciones = PailaAsignacion.objects.filter(inicio__lt=fin, fin__gt=inicio, paila=paila)
     if exclude_programa_id:
         asignaciones = asignaciones.exclude(programa_id=exclude_programa_id)
 
-    return asignaciones.exists()
\ No newline at end of file
+    with tramo("solapamiento"):
+        return asignaciones.exists()
+
+
+def _intervalo_json(intervalo):
+    inicio, fin, programa_id, asignacion_id = intervalo
+    return {"asignacion": asignacion_id, "programa": programa_id, "inicio": inicio, "fin": fin}
+
+
+@api_view(["GET"])
+def conflictos_pailas(request):
+    """Reporte de todos los pares de asignaciones solapadas, en una pasada por paila."""
+    try:
+        indice = IndiceIntervalos().cargar_todo()
+        conflictos = [
+            {"paila": paila_id, "a": _intervalo_json(a), "b": _intervalo_json(b)}
+            for paila_id, pares in sorted(indice.conflictos().items())
+            for a, b in pares
+        ]
+        return Response({"total": len(conflictos), "conflictos": conflictos}, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(["GET"])
+def conflictos_recursos(request):
+    """Tramos (a resolución de bucket) donde una etapa usa más equipos de los que tiene su estación."""
+    try:
+        sobrecargas = cargar_calendario().sobrecargas()
+        conflictos = [
+            {
+                "estacion": estacion, "etapa": etapa, "inicio": inicio, "fin": fin,
+                "ocupacion": ocupacion, "capacidad": capacidad,
+            }
+            for (estacion, etapa), tramos in sorted(sobrecargas.items())
+            for inicio, fin, ocupacion, capacidad in tramos
+        ]
+        return Response({"total": len(conflictos), "conflictos": conflictos}, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(["POST"])
+def simular_plan(request):
+    """
+    Simulación de eventos discretos del plan actual (pailas + equipos por
+    estación). Parámetros: tolerancia_min (atraso permitido sobre hora_final)
+    y detalle (cuántos atrasados listar).
+    """
+    try:
+        datos = request.data
+        try:
+            tolerancia_horas = float(datos.get("tolerancia_min", 0)) / 60
+            detalle = int(datos.get("detalle", DETALLE_ATRASOS))
+        except (TypeError, ValueError):
+            return Response({"error": "tolerancia_min y detalle deben ser numéricos"}, status=400)
+        if not np.isfinite(tolerancia_horas):
+            return Response({"error": "tolerancia_min debe ser finita"}, status=400)
+        if detalle < 0:
+            return Response({"error": "detalle no puede ser negativo"}, status=400)
+
+        resultado = simular(tolerancia_horas=tolerancia_horas, detalle=detalle)
+        if resultado is None:
+            return Response({"error": "No hay programas planificados para simular"}, status=400)
+        return Response(resultado, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(["GET"])
+def kpis_plan(request):
+    """
+    KPIs del plan para el tablero. Se cachean por versión del plan: mientras
+    no cambien programas ni asignaciones, la respuesta sale del cache.
+    """
+    try:
+        kpis, version, cacheado = obtener_kpis()
+        return Response({"version": version, "cacheado": cacheado, **kpis}, status=200)
+
+    except Exception as e:
+        logger.exception("Error en %s", request.path)
+        return Response({"error": str(e)}, status=500)
+
+
+@api_view(["GET"])
+def rendimiento(request):
+    """
+    Resumen por ruta (p50/p95 de tiempo total, SQL y consultas) de los
+    últimos requests de este proceso. Solo con DEBUG o RENDIMIENTO_ENDPOINT.
+    """
+    if not (settings.DEBUG or getattr(settings, "RENDIMIENTO_ENDPOINT", False)):
+        return Response({"error": "No disponible"}, status=404)
+    return Response(resumen_rendimiento(), status=200)
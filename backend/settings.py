@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    "App.instrumentacion.MedicionMiddleware",  # Server-Timing + logs de rendimiento
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -130,4 +131,34 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+# Importaciones de Excel en segundo plano (App/trabajos.py)
+IMPORTACION_WORKERS = 2
+IMPORTACION_DIR = None  # None = directorio temporal del sistema
+IMPORTACION_SEGUNDOS_SIN_AVANCE = 900  # luego se da el trabajo por interrumpido
+
+# Tope de tiempo de reloj (s) por pedido a /optimizar/ (App/optimizador.py)
+OPTIMIZADOR_TIEMPO_MAXIMO = 120
+
+# Calendario de equipos por estación (App/recursos.py)
+RECURSOS_MINUTOS_BUCKET = 15
+
+# Cache de /kpis/ (la clave lleva la versión del plan; esto solo limpia versiones viejas)
+KPIS_CACHE_SEGUNDOS = 3600
+# versiones del plan que guarda la bitácora de /programa-produccion/cambios/
+CAMBIOS_VERSIONES_RETENIDAS = 1000
+
+# Instrumentación por request (App/instrumentacion.py)
+RENDIMIENTO_BUFFER = 5000  # requests guardados por proceso para /debug/perf/
+RENDIMIENTO_ENDPOINT = False  # True para exponer /debug/perf/ con DEBUG=False
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "App": {"handlers": ["console"], "level": "INFO"},
+    },
+}
@@ -0,0 +1,18 @@
+"""
+Settings para correr los benchmarks (App/tests.py) en local con SQLite:
+
+    python manage.py test App --settings=backend.settings_bench
+
+La escala se elige con BENCH_ORDENES y BENCH_PAILAS (por defecto 1000 / 50).
+"""
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "bench.sqlite3",
+    }
+}
+
+# la tabla de tiempos ya resume cada request; sin una línea de log por request
+LOGGING["loggers"]["App.rendimiento"] = {"level": "WARNING"}  # noqa: F405